@@ -1,20 +1,90 @@
 import os
-import json
+import queue
+import logging
+import threading
+import time
 import pandas as pd
+import numpy as np
 import random
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional, Iterator, Tuple
 from datetime import datetime
-from groq import Groq
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 import models
 import schemas
+import result_cache
+import llm_scheduler
+import stats_service
+import providers
+import metrics
+import response_parser
+import feature_store
+import similarity_index
 
-# Initialize Groq client
-# API key must be set in environment variable GROQ_API_KEY
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY environment variable is required")
-client = Groq(api_key=GROQ_API_KEY)
+logger = logging.getLogger(__name__)
+
+# Which backend answers a run (Groq, a local server, the in-process classifier) is
+# chosen from config['model'] by providers.get_provider.
+
+# Concurrent LLM batches per analysis run. Overridable per run via config['concurrency'].
+DEFAULT_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "4"))
+MAX_CONCURRENCY = 16
+
+# Max IDs per IN (...) lookup when checking for already-saved transactions
+LOOKUP_CHUNK_SIZE = 1000
+
+# Cached "system" user ID per database URL (see get_system_user_id)
+_system_user_ids: Dict[str, int] = {}
+_system_user_lock = threading.Lock()
+
+# Bump whenever DEFAULT_PROMPT changes so cached verdicts from the old prompt are not reused
+PROMPT_VERSION = "2"
+
+DEFAULT_MODEL = 'qwen/qwen3-32b'
+DEFAULT_TEMPERATURE = 0.6
+DEFAULT_MAX_TOKENS = 4096
+MAX_EXPLANATION_CHARS = 250
+
+# Context window (prompt + completion tokens) per model; unknown models use the default
+MODEL_CONTEXT_TOKENS = {
+    'qwen/qwen3-32b': 131072,
+    'llama3-70b': 8192,
+    'mixtral-8x7b': 32768
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+# Upper bound on rows per prompt even when the token budget allows more.
+# Overridable per run via config['batchSize'].
+MAX_BATCH_ROWS = 100
+# Share of max_completion_tokens the estimated table output may use. The rest is
+# headroom for estimation error and any reasoning the model emits before the table.
+OUTPUT_BUDGET_SHARE = 0.8
+# Estimated completion tokens per result row: ID, risk label, pipes and an explanation
+# that typically uses well under MAX_EXPLANATION_CHARS
+OUTPUT_TOKENS_PER_ROW = 20 + MAX_EXPLANATION_CHARS // 5
+# Times rows missing from a parsed response are re-sent before giving up on them.
+# Overridable per run via config['missingRowRetries'].
+MISSING_ROW_RETRIES = 2
+
+SYSTEM_PROMPT = "You are a financial crime analyst. Provide responses in exact table format as requested. Be concise and quantitative."
+JSON_SYSTEM_PROMPT = "You are a financial crime analyst. Respond only with JSON lines as requested. Be concise and quantitative."
+
+# Deterministic pre-screen thresholds. Overridable per run via config['prescreen'].
+# On the sample data (generate_sample_transactions / benchmarks/bench_data.py, 100k
+# rows) these settle ~41% of rows without the LLM, about 24% HIGH and 17% LOW,
+# every one in the TMLScore band the LLM labels the same way. The rest (all the
+# 300-600 band and low-band rows with several flags) go to the LLM.
+DEFAULT_PRESCREEN_CONFIG = {
+    'enabled': True,
+    'lowThreshold': 40,      # composite score at or below which a row can be LOW
+    'lowTmlScore': 150,      # LOW also requires TMLScore at or below this
+    'lowMaxFlags': 2,        # ...at most this many risk flags, never a high-risk country
+    'highThreshold': 50,     # composite score at or above which a row can be HIGH
+    'highTmlScore': 800,     # HIGH also requires TMLScore at or above this
+    'velocityLimit': 15,     # velocity_count above this counts as a risk flag
+    'amountLimit': 15000     # amount above this counts as a risk flag
+}
 
 DEFAULT_PROMPT = """
 ANALYZE these {transaction_count} financial transactions for fraud risk.
@@ -32,8 +102,8 @@ KEY FIELDS TO CONSIDER:
 - Geographic risks: high-risk countries
 - Device and authentication factors
 
-TRANSACTIONS DATA:
-{transactions_json}
+TRANSACTIONS DATA (pipe-separated; first line is the column header, one transaction per line):
+{transactions_table}
 
 REQUIRED RESPONSE FORMAT (STRICT TABLE FORMAT):
 | Transaction_ID | Risk_Level | Explanation |
@@ -45,6 +115,15 @@ REQUIRED RESPONSE FORMAT (STRICT TABLE FORMAT):
 Continue for all transactions. Maintain exact table format.
 """
 
+# config['responseFormat'] = 'json' asks for one JSON object per line instead of the
+# Markdown table. Same task and fields, so cached verdicts are shared between formats.
+JSON_PROMPT = DEFAULT_PROMPT[:DEFAULT_PROMPT.index("REQUIRED RESPONSE FORMAT")] + """REQUIRED RESPONSE FORMAT (JSON LINES, one object per transaction, nothing else):
+{{"transaction_id": "TXN_001", "risk_level": "LOW", "explanation": "Concise explanation under {max_chars} chars"}}
+{{"transaction_id": "TXN_002", "risk_level": "HIGH", "explanation": "Concise explanation under {max_chars} chars"}}
+
+risk_level is LOW, MEDIUM or HIGH. Continue for all transactions.
+"""
+
 def generate_sample_transactions(count: int = 10) -> List[Dict[str, Any]]:
     transactions = []
     for i in range(count):
@@ -73,163 +152,670 @@ def generate_sample_transactions(count: int = 10) -> List[Dict[str, Any]]:
         transactions.append(transaction)
     return transactions
 
-def analyze_transactions(transactions: List[Dict[str, Any]], config: Dict[str, Any]) -> List[Dict[str, Any]]:
-    BATCH_SIZE = 50
-    all_results = []
+def run_analysis_pipeline(
+    transactions: List[Dict[str, Any]],
+    config: Dict[str, Any],
+    on_batch: Optional[Callable[[int, int, List[Dict[str, Any]]], None]] = None,
+    dead_letter: Optional[List[Dict[str, Any]]] = None,
+    on_settled: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+) -> List[Dict[str, Any]]:
+    # Entry point used by the API. Rows are settled by the cheapest stage that can:
+    # deterministic pre-screen, then the result cache, then a confident match in the
+    # similarity index, then the LLM for the rest. on_settled gets the rows settled
+    # before the LLM, on_batch each LLM batch (see analyze_transactions).
+    # Output keeps input order. Rows the LLM could not analyze are appended to dead_letter.
+    transactions = _with_account_features(_as_transaction_list(transactions), config)
+    settled, pending = _settle_without_llm(transactions, config)
+    if on_settled and settled:
+        on_settled([settled[i] for i in sorted(settled)])
+    
+    llm_results = analyze_transactions([transactions[i] for i in pending], config, on_batch, dead_letter) if pending else []
+    _store_in_cache(llm_results, config)
+    _store_in_similarity_index(llm_results, config)
+    llm_by_id = {res['transaction_id']: res for res in llm_results}
+    for index in pending:
+        res = llm_by_id.get(transactions[index]['transaction_id'])
+        if res:
+            settled[index] = {'source': 'llm', **res}
+    
+    return [settled[i] for i in range(len(transactions)) if i in settled]
+
+def stream_analysis_pipeline(
+    transactions: List[Dict[str, Any]],
+    config: Dict[str, Any],
+    dead_letter: Optional[List[Dict[str, Any]]] = None
+) -> Iterator[Dict[str, Any]]:
+    # Same stages as run_analysis_pipeline, but yields each result as soon as it is
+    # known: pre-screened and cached rows first, then LLM rows as their table lines
+    # stream in. Output is in completion order, not input order.
+    transactions = _with_account_features(_as_transaction_list(transactions), config)
+    settled, pending = _settle_without_llm(transactions, config)
+    for index in sorted(settled):
+        yield settled[index]
+    if not pending:
+        return
+    
+    batches = build_batches([transactions[i] for i in pending], config)
+    concurrency = max(1, int(config.get('concurrency', DEFAULT_CONCURRENCY)))
+    concurrency = min(concurrency, MAX_CONCURRENCY, len(batches))
+    
+    # Worker threads push parsed rows onto the queue; a marker signals a finished batch
+    results_queue: "queue.Queue[Any]" = queue.Queue()
+    batch_done = object()
+    
+    def run_batch(batch_number: int, batch: List[Dict[str, Any]]):
+        try:
+            _analyze_batch(batch, batch_number, config, dead_letter, on_result=results_queue.put)
+        finally:
+            results_queue.put(batch_done)
+    
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="analysis-stream")
+    llm_results = []
+    try:
+        for batch_number, batch in enumerate(batches, start=1):
+            executor.submit(run_batch, batch_number, batch)
+        finished = 0
+        while finished < len(batches):
+            item = results_queue.get()
+            if item is batch_done:
+                finished += 1
+                continue
+            llm_results.append(item)
+            yield {'source': 'llm', **item}
+    finally:
+        # If the client disconnects, queued batches are dropped; running ones finish
+        executor.shutdown(wait=False, cancel_futures=True)
+        _store_in_cache(llm_results, config)
+        _store_in_similarity_index(llm_results, config)
+
+def _with_account_features(transactions: List[Dict[str, Any]], config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Rows with a user_account get velocity / device / account-age features from the
+    # feature store; config['enrichFeatures'] = False turns this off
+    if not config.get('enrichFeatures', True) or not any(txn.get('user_account') for txn in transactions):
+        return transactions
+    with metrics.time_stage("enrich", len(transactions)):
+        feature_store.sync()
+        return feature_store.get_feature_store().enrich(transactions)
+
+def _settle_without_llm(
+    transactions: List[Dict[str, Any]],
+    config: Dict[str, Any]
+) -> Tuple[Dict[int, Dict[str, Any]], List[int]]:
+    # Returns ({input index: result} for rows settled by pre-screen, cache or
+    # similarity index, [indexes that still need the LLM])
+    analyzed_at = datetime.utcnow().isoformat()
+    settled: Dict[int, Dict[str, Any]] = {}
+    pending = list(range(len(transactions)))
+    
+    prescreen_config = {**DEFAULT_PRESCREEN_CONFIG, **config.get('prescreen', {})}
+    if prescreen_config['enabled'] and pending:
+        with metrics.time_stage("prescreen", len(pending)):
+            settled.update(prescreen_transactions(transactions, prescreen_config))
+        pending = [i for i in pending if i not in settled]
+    
+    cache = _result_cache_for(config)
+    if cache is not None and pending:
+        model = config.get('model', DEFAULT_MODEL)
+        temperature = config.get('temperature', DEFAULT_TEMPERATURE)
+        with metrics.time_stage("cache_lookup", len(pending)):
+            cached, _ = cache.lookup([transactions[i] for i in pending], model, temperature, PROMPT_VERSION)
+        for local_index, verdict in cached.items():
+            index = pending[local_index]
+            settled[index] = {**transactions[index], **verdict, 'analyzed_at': analyzed_at, 'source': 'cache'}
+        pending = [i for i in pending if i not in settled]
+    
+    index_config = _similarity_config(config)
+    if index_config is not None and pending:
+        index = similarity_index.get_index(_similarity_index_name(config))
+        with metrics.time_stage("similarity", len(pending)):
+            matches = index.match([transactions[i] for i in pending], index_config, analyzed_at)
+        for local_index, res in matches.items():
+            settled[pending[local_index]] = {**res, 'source': 'similar'}
+        pending = [i for i in pending if i not in settled]
+    
+    return settled, pending
+
+def _result_cache_for(config: Dict[str, Any]) -> Optional[result_cache.ResultCache]:
+    # Classifier verdicts are cheaper to recompute than to look up, and change when
+    # the model is retrained, so they are not cached
+    if not config.get('useCache', True):
+        return None
+    if providers.get_provider(config.get('model', DEFAULT_MODEL)).kind == "classifier":
+        return None
+    return result_cache.get_result_cache()
+
+def _store_in_cache(llm_results: List[Dict[str, Any]], config: Dict[str, Any]):
+    cache = _result_cache_for(config)
+    if cache is not None and llm_results:
+        model = config.get('model', DEFAULT_MODEL)
+        temperature = config.get('temperature', DEFAULT_TEMPERATURE)
+        cache.store(llm_results, model, temperature, PROMPT_VERSION)
+
+def _similarity_config(config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # Only LLM verdicts are indexed, so classifier runs skip the stage
+    index_config = {**similarity_index.DEFAULT_SIMILARITY_CONFIG, **config.get('similarity', {})}
+    if not index_config['enabled']:
+        return None
+    if providers.get_provider(config.get('model', DEFAULT_MODEL)).kind == "classifier":
+        return None
+    return index_config
+
+def _similarity_index_name(config: Dict[str, Any]) -> str:
+    # Verdicts are only reused for the model and prompt that produced them
+    return f"{config.get('model', DEFAULT_MODEL)}-{PROMPT_VERSION}"
+
+def _store_in_similarity_index(llm_results: List[Dict[str, Any]], config: Dict[str, Any]):
+    if llm_results and _similarity_config(config) is not None:
+        similarity_index.get_index(_similarity_index_name(config)).add(llm_results)
+
+def prescreen_transactions(transactions: List[Dict[str, Any]], prescreen_config: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+    # Scores the whole upload at once and returns {input index: result} for rows that
+    # are clearly LOW or clearly HIGH. Everything else is left for the LLM.
+    if not transactions:
+        return {}
+    df = pd.DataFrame.from_records(transactions)
     
-    # print(f"DEBUG: transactions type: {type(transactions)}")
+    def numeric(column: str) -> pd.Series:
+        if column not in df:
+            return pd.Series(np.nan, index=df.index)
+        return pd.to_numeric(df[column], errors='coerce')
+    
+    def flag(column: str, risky_value: str) -> pd.Series:
+        # 1.0 when the row has the risky value, 0.0 when it has another value, NaN when unknown
+        if column not in df:
+            return pd.Series(np.nan, index=df.index)
+        values = df[column].astype('string').str.strip().str.lower()
+        return (values == risky_value.lower()).astype(float).where(values.notna())
+    
+    tml_score = numeric('TMLScore')
+    amount = numeric('amount')
+    velocity = numeric('velocity_count')
+    auth = df['auth_strength'].astype('string').str.strip().str.lower() if 'auth_strength' in df else pd.Series(pd.NA, index=df.index, dtype='string')
+    
+    factors = pd.DataFrame({
+        'new_beneficiary': flag('new_beneficiary', "Yes"),
+        'high_risk_country': flag('high_risk_country', "Yes"),
+        'device_mismatch': flag('device_match', "No"),
+        'weak_auth': (auth == "weak").astype(float).where(auth.notna()),
+        'high_velocity': (velocity > prescreen_config['velocityLimit']).astype(float).where(velocity.notna()),
+        'large_amount': (amount > prescreen_config['amountLimit']).astype(float).where(amount.notna())
+    })
+    
+    # Composite 0-100 score: TMLScore carries half the weight, behavioural flags the rest
+    score = (
+        tml_score.clip(0, 999) / 999 * 50
+        + factors['new_beneficiary'].fillna(0) * 10
+        + factors['high_risk_country'].fillna(0) * 15
+        + factors['device_mismatch'].fillna(0) * 10
+        + factors['weak_auth'].fillna(0) * 8
+        + (auth == "medium").fillna(False).astype(float) * 3
+        + (velocity.clip(0, 20) / 20 * 10).fillna(0)
+        + (amount.clip(0, 20000) / 20000 * 7).fillna(0)
+    ).round(1)
+    
+    flag_count = factors.fillna(0).sum(axis=1)
+    fully_known = factors.notna().all(axis=1) & tml_score.notna()
+    
+    # LOW needs every signal present, a low TMLScore and few flags; HIGH needs a high
+    # TMLScore backed by the composite score. Mixed signals are left for the LLM.
+    is_low = (
+        fully_known
+        & (tml_score <= prescreen_config['lowTmlScore'])
+        & (flag_count <= prescreen_config['lowMaxFlags'])
+        & (factors['high_risk_country'] == 0)
+        & (score <= prescreen_config['lowThreshold'])
+    )
+    is_high = (tml_score >= prescreen_config['highTmlScore']) & (score >= prescreen_config['highThreshold'])
+    
+    analyzed_at = datetime.utcnow().isoformat()
+    settled = {}
+    factor_names = factors.columns.tolist()
+    factor_values = factors.fillna(0).to_numpy()
+    for index in np.flatnonzero((is_low | is_high).to_numpy()):
+        if is_high.iat[index]:
+            triggered = [name.replace('_', ' ') for name, value in zip(factor_names, factor_values[index]) if value]
+            risk_level = "HIGH"
+            explanation = f"Pre-screened HIGH (score {score.iat[index]}): TMLScore {int(tml_score.iat[index])}" + (
+                f", {', '.join(triggered)}" if triggered else ""
+            )
+        else:
+            risk_level = "LOW"
+            triggered = [name.replace('_', ' ') for name, value in zip(factor_names, factor_values[index]) if value]
+            explanation = f"Pre-screened LOW (score {score.iat[index]}): TMLScore {int(tml_score.iat[index])}, " + (
+                f"only {', '.join(triggered)}" if triggered else "no risk flags"
+            )
+        settled[int(index)] = {
+            **transactions[index],
+            'risk_level': risk_level,
+            'explanation': explanation,
+            'analyzed_at': analyzed_at,
+            'source': 'prescreen',
+            'prescreen_score': float(score.iat[index])
+        }
+    return settled
+
+def _as_transaction_list(transactions: Any) -> List[Dict[str, Any]]:
     if isinstance(transactions, dict):
-        # print("DEBUG: transactions is a dict, converting to list values...")
-        transactions = list(transactions.values())
+        return list(transactions.values())
     elif not isinstance(transactions, list):
-        # print(f"DEBUG: transactions is {type(transactions)}, forcing list conversion...")
-        transactions = list(transactions)
+        return list(transactions)
+    return transactions
 
-    # Split transactions into batches
-    for i in range(0, len(transactions), BATCH_SIZE):
-        batch = transactions[i:i + BATCH_SIZE]
-        print(f"DEBUG: Processing batch {i//BATCH_SIZE + 1} ({len(batch)} transactions)")
-        
-        try:
-            model = config.get('model', 'qwen/qwen3-32b')
-            temperature = config.get('temperature', 0.6)
-            max_tokens = config.get('maxTokens', 4096)
-            
-            prompt_vars = {
-                'transaction_count': len(batch),
-                'max_chars': 250,
-                'tmlscore_range': "1-999 (1=very low, 999=suspicious)",
-                'transactions_json': json.dumps(batch, indent=2)
-            }
-            
-            prompt = DEFAULT_PROMPT.format(**prompt_vars)
+def analyze_transactions(
+    transactions: List[Dict[str, Any]],
+    config: Dict[str, Any],
+    on_batch: Optional[Callable[[int, int, List[Dict[str, Any]]], None]] = None,
+    dead_letter: Optional[List[Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
+    # on_batch(batch_number, total_batches, batch_results) is called as each batch
+    # finishes. With concurrency > 1 it runs on worker threads and out of order.
+    # Rows that still have no result after retries are appended to dead_letter.
+    transactions = _as_transaction_list(transactions)
+
+    # Split transactions into batches sized to the model's token budget
+    batches = build_batches(transactions, config)
+    
+    # Number of batches sent to the LLM at the same time (1 = sequential)
+    concurrency = max(1, int(config.get('concurrency', DEFAULT_CONCURRENCY)))
+    concurrency = min(concurrency, MAX_CONCURRENCY, max(1, len(batches)))
+    
+    def run_batch(batch_number: int, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        results = _analyze_batch(batch, batch_number, config, dead_letter)
+        if on_batch:
+            on_batch(batch_number, len(batches), results)
+        return results
+    
+    if concurrency == 1:
+        batch_results = [run_batch(number, batch) for number, batch in enumerate(batches, start=1)]
+    else:
+        # Batches are independent LLM round trips, so a thread pool overlaps the
+        # network wait. map() yields in submission order, which keeps output ordered.
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="analysis-batch") as executor:
+            batch_results = list(executor.map(run_batch, range(1, len(batches) + 1), batches))
+    
+    all_results = []
+    for results in batch_results:
+        all_results.extend(results)
             
-            completion = client.chat.completions.create(
+    return all_results
+
+def estimate_tokens(text: str) -> int:
+    # Rough tokenizer-free estimate: ~4 characters per token for this kind of text
+    return len(text) // 4 + 1
+
+def encode_transactions_compact(transactions: List[Dict[str, Any]]) -> str:
+    # Header once, then one pipe-separated line per row. Much smaller than indented
+    # JSON, which repeats every key for every row.
+    columns = _table_columns(transactions)
+    lines = ["|".join(columns)]
+    for txn in transactions:
+        lines.append(_encode_row(txn, columns))
+    return "\n".join(lines)
+
+def _table_columns(transactions: List[Dict[str, Any]]) -> List[str]:
+    # Account features stay out of the prompt; the columns derived from them are in it
+    columns = {}
+    for txn in transactions:
+        for key in txn:
+            if key != feature_store.FEATURES_FIELD:
+                columns.setdefault(key, None)
+    return list(columns)
+
+def _encode_row(txn: Dict[str, Any], columns: List[str]) -> str:
+    cells = []
+    for column in columns:
+        value = txn.get(column)
+        cells.append("" if value is None else str(value).replace("|", "/").replace("\n", " "))
+    return "|".join(cells)
+
+def completion_token_limit(config: Dict[str, Any]) -> int:
+    # config['maxTokens'], capped so at least half of the model's context is left for the prompt
+    model = config.get('model', DEFAULT_MODEL)
+    context_tokens = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+    return min(int(config.get('maxTokens', DEFAULT_MAX_TOKENS)), context_tokens // 2)
+
+def build_batches(transactions: List[Dict[str, Any]], config: Dict[str, Any]) -> List[List[Dict[str, Any]]]:
+    # Greedily packs rows into prompts so that each prompt fits the model's context
+    # window and each expected response table fits in max_completion_tokens.
+    if not transactions:
+        return []
+    model = config.get('model', DEFAULT_MODEL)
+    if providers.get_provider(model).kind == "classifier":
+        # No prompt, so no token budget
+        size = providers.CLASSIFIER_BATCH_ROWS
+        return [transactions[i:i + size] for i in range(0, len(transactions), size)]
+    max_tokens = completion_token_limit(config)
+    max_rows = max(1, int(config.get('batchSize', MAX_BATCH_ROWS)))
+    context_tokens = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+
+    columns = _table_columns(transactions)
+    fixed_input_tokens = estimate_tokens(SYSTEM_PROMPT + DEFAULT_PROMPT) + estimate_tokens("|".join(columns))
+    input_budget = context_tokens - max_tokens - fixed_input_tokens
+    output_rows = max(1, int(max_tokens * OUTPUT_BUDGET_SHARE) // OUTPUT_TOKENS_PER_ROW)
+    max_rows = min(max_rows, output_rows)
+
+    batches = []
+    batch = []
+    batch_input_tokens = 0
+    for txn in transactions:
+        row_tokens = estimate_tokens(_encode_row(txn, columns)) + 1
+        if batch and (len(batch) >= max_rows or batch_input_tokens + row_tokens > input_budget):
+            batches.append(batch)
+            batch = []
+            batch_input_tokens = 0
+        batch.append(txn)
+        batch_input_tokens += row_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _analyze_batch(
+    batch: List[Dict[str, Any]],
+    batch_number: int,
+    config: Dict[str, Any],
+    dead_letter: Optional[List[Dict[str, Any]]] = None,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> List[Dict[str, Any]]:
+    # With on_result the LLM response is streamed and each row is passed to
+    # on_result as soon as its table line is complete.
+    provider = providers.get_provider(config.get('model', DEFAULT_MODEL))
+    if provider.kind == "classifier":
+        return _classify_batch(provider, batch, batch_number, dead_letter, on_result)
+    retries = int(config.get('missingRowRetries', MISSING_ROW_RETRIES))
+    # Shared by the first request and the retries, as is the batch's timestamp
+    index = response_parser.TransactionIndex(batch)
+    analyzed_at = datetime.utcnow().isoformat()
+    
+    results = []
+    pending = batch
+    failure = "No result in LLM response"
+    for attempt in range(retries + 1):
+        try:
+            attempt_results, missing_ids = _request_batch(pending, batch_number, config, index, analyzed_at, on_result)
+        except Exception as e:
+            # The scheduler already retried transient errors; give up on these rows
+            # but continue with the other batches
+            logger.error("Error in analysis batch %d: %s", batch_number, e)
+            failure = f"{type(e).__name__}: {e}"
+            break
+        results.extend(attempt_results)
+        
+        # Rows the model skipped or that were cut off by the token limit are re-sent
+        pending = [index.by_id[txn_id] for txn_id in missing_ids]
+        if not pending:
+            break
+        if attempt < retries:
+            shown = ", ".join(missing_ids[:5]) + (", ..." if len(missing_ids) > 5 else "")
+            logger.debug("Batch %d missing %d rows (%s), retrying them", batch_number, len(pending), shown)
+    
+    if pending:
+        logger.warning("Batch %d: %d transactions got no result", batch_number, len(pending))
+        if dead_letter is not None:
+            # list.extend is atomic, so concurrent batches can share one list
+            dead_letter.extend(
+                {'transaction_id': txn['transaction_id'], 'batch': batch_number, 'error': failure, 'transaction': txn}
+                for txn in pending
+            )
+    return results
+
+def _classify_batch(
+    provider: providers.ClassifierProvider,
+    batch: List[Dict[str, Any]],
+    batch_number: int,
+    dead_letter: Optional[List[Dict[str, Any]]] = None,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> List[Dict[str, Any]]:
+    try:
+        with metrics.time_stage("classifier", len(batch)):
+            results = provider.score(batch, datetime.utcnow().isoformat(), MAX_EXPLANATION_CHARS)
+    except Exception as e:
+        logger.error("Error in classifier batch %d: %s", batch_number, e)
+        if dead_letter is not None:
+            dead_letter.extend(
+                {'transaction_id': txn['transaction_id'], 'batch': batch_number, 'error': f"{type(e).__name__}: {e}", 'transaction': txn}
+                for txn in batch
+            )
+        return []
+    if on_result:
+        for res in results:
+            on_result(res)
+    return results
+
+def _request_batch(
+    batch: List[Dict[str, Any]],
+    batch_number: int,
+    config: Dict[str, Any],
+    index: response_parser.TransactionIndex,
+    analyzed_at: str,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    # Returns (results, IDs from the batch that got no result)
+    model = config.get('model', DEFAULT_MODEL)
+    provider = providers.get_provider(model)
+    temperature = config.get('temperature', DEFAULT_TEMPERATURE)
+    max_tokens = completion_token_limit(config)
+    
+    with metrics.time_stage("prompt_build", len(batch)):
+        prompt_vars = {
+            'transaction_count': len(batch),
+            'max_chars': MAX_EXPLANATION_CHARS,
+            'tmlscore_range': "1-999 (1=very low, 999=suspicious)",
+            'transactions_table': encode_transactions_compact(batch)
+        }
+        
+        json_output = config.get('responseFormat', "table") == "json"
+        system_prompt = JSON_SYSTEM_PROMPT if json_output else SYSTEM_PROMPT
+        prompt = (JSON_PROMPT if json_output else DEFAULT_PROMPT).format(**prompt_vars)
+    # What the call is expected to count against the tokens-per-minute quota
+    estimated_tokens = estimate_tokens(system_prompt + prompt) + len(batch) * OUTPUT_TOKENS_PER_ROW
+    parser = response_parser.ResponseParser(index, [txn['transaction_id'] for txn in batch], analyzed_at)
+    stream = on_result is not None
+    
+    llm_started = time.perf_counter()
+    try:
+        completion = llm_scheduler.get_scheduler().call(
+            lambda: provider.client.chat.completions.create(
                 messages=[
                     {
                         "role": "system",
-                        "content": "You are a financial crime analyst. Provide responses in exact table format as requested. Be concise and quantitative."
+                        "content": system_prompt
                     },
                     {"role": "user", "content": prompt}
                 ],
-                model=model,
+                model=provider.model_name(model),
                 temperature=temperature,
-                max_completion_tokens=max_tokens,
+                max_tokens=max_tokens,
                 top_p=0.95,
-                stream=False
-            )
-            
-            response_text = completion.choices[0].message.content
-            # print(f"DEBUG: LLM Response (Batch {i//BATCH_SIZE + 1}):\n{response_text[:500]}...") 
-            
-            batch_results = parse_table_response(response_text, batch)
-            all_results.extend(batch_results)
-            
+                stream=stream
+            ),
+            estimated_tokens=estimated_tokens
+        )
+    except Exception:
+        metrics.LLM_CALLS.labels(model, "error").inc()
+        raise
+    metrics.LLM_CALLS.labels(model, "success").inc()
+    
+    if stream:
+        # Only opening the stream is retried by the scheduler. If it breaks midway,
+        # rows parsed so far are kept and the rest are retried as missing rows.
+        # Parsing overlaps the stream, so it is counted in llm_call here.
+        results = []
+        usage = None
+        try:
+            for chunk in completion:
+                # Usage arrives on the final chunk: under x_groq from Groq, as
+                # chunk.usage from OpenAI-compatible servers
+                chunk_usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None) or getattr(chunk, 'usage', None)
+                if chunk_usage is not None:
+                    usage = chunk_usage
+                    metrics.record_llm_usage(model, usage)
+                if not chunk.choices:
+                    continue
+                for res in parser.feed(chunk.choices[0].delta.content or ""):
+                    results.append(res)
+                    on_result(res)
         except Exception as e:
-            print(f"Error in analysis batch {i//BATCH_SIZE + 1}: {str(e)}")
-            # Continue to next batch even if one fails
-            continue
-            
-    return all_results
+            logger.error("Error while streaming batch %d: %s", batch_number, e)
+        # A stream cut off before its last chunk keeps the estimate
+        llm_scheduler.get_scheduler().reconcile_tokens(usage, estimated_tokens)
+        for res in parser.close():
+            results.append(res)
+            on_result(res)
+        metrics.STAGE_SECONDS.labels("llm_call").observe(time.perf_counter() - llm_started)
+        metrics.STAGE_ROWS.labels("llm_call").inc(len(batch))
+        return results, parser.missing_ids()
+    
+    metrics.STAGE_SECONDS.labels("llm_call").observe(time.perf_counter() - llm_started)
+    metrics.STAGE_ROWS.labels("llm_call").inc(len(batch))
+    metrics.record_llm_usage(model, getattr(completion, 'usage', None))
+    response_text = completion.choices[0].message.content
+    
+    with metrics.time_stage("parse", len(batch)):
+        results = parser.parse(response_text or "")
+    return results, parser.missing_ids()
 
 def parse_table_response(response_text: str, original_transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    results = []
-    lines = response_text.strip().split('\n')
-    table_start = -1
-    
-    # Find table start
-    for i, line in enumerate(lines):
-        if '|' in line and 'Transaction_ID' in line:
-            table_start = i + 2 # Skip header and separator
-            break
-            
-    if table_start == -1 or table_start >= len(lines):
-        return []
+    # One-shot parse of a complete answer (table or JSON lines) for a batch
+    return response_parser.ResponseParser(response_parser.TransactionIndex(original_transactions)).parse(response_text)
+
+def save_results_to_db(results: List[Dict[str, Any]], db: Session):
+    with metrics.time_stage("db_persist", len(results)):
+        # Keep the first result per transaction_id; later duplicates in the same upload are ignored
+        unique_results = {}
+        for res in results:
+            unique_results.setdefault(res['transaction_id'], res)
+        if not unique_results:
+            return 0
         
-    transaction_map = {t['transaction_id']: t for t in original_transactions}
-    
-    for line in lines[table_start:]:
-        line = line.strip()
-        if not line.startswith('|'):
-            continue
-            
-        parts = [part.strip() for part in line.split('|') if part.strip()]
-        if len(parts) < 3:
-            continue
-            
-        txn_id = parts[0]
-        risk_level_raw = parts[1]
-        explanation = parts[2]
+        # One IN lookup per chunk instead of a SELECT per result
+        existing_ids = get_existing_transaction_ids(db, list(unique_results))
+        new_results = [res for txn_id, res in unique_results.items() if txn_id not in existing_ids]
+        if not new_results:
+            return 0
         
-        # Clean risk level
-        risk_level = "UNKNOWN"
-        if 'LOW' in risk_level_raw.upper():
-            risk_level = "LOW"
-        elif 'MEDIUM' in risk_level_raw.upper():
-            risk_level = "MEDIUM"
-        elif 'HIGH' in risk_level_raw.upper():
-            risk_level = "HIGH"
-            
-        if txn_id in transaction_map:
-            original = transaction_map[txn_id]
-            results.append({
-                **original,
-                'risk_level': risk_level,
-                'explanation': explanation,
-                'analyzed_at': datetime.utcnow().isoformat()
+        now = datetime.utcnow()
+        transaction_rows = []
+        for res in new_results:
+            transaction_rows.append({
+                'transaction_id': res['transaction_id'],
+                'amount': float(res['amount']),
+                'currency': "USD",
+                'transaction_type': "Payment", # Default
+                'risk_score': float(res.get('TMLScore', 0)) / 10.0, # Convert 1-999 to approx 0-100
+                'is_flagged': res['risk_level'] == 'HIGH',
+                'risk_level': res['risk_level'],
+                'explanation': res.get('explanation'),
+                'verdict_source': res.get('source'),
+                'analysis_features': providers.classifier_feature_values(res),
+                'user_account': res.get('user_account'),
+                'device_id': res.get('device_id'),
+                'ip_address': res.get('ip_address'),
+                'timestamp': now
             })
-            
-    return results
-
-def save_results_to_db(results: List[Dict[str, Any]], db: Session):
-    saved_count = 0
-    for res in results:
-        # Create transaction record
-        # Check if exists first
-        existing = db.query(models.Transaction).filter(models.Transaction.transaction_id == res['transaction_id']).first()
         
-        risk_score = res.get('TMLScore', 0) / 10.0 # Convert 1-999 to approx 0-100
-        is_flagged = res['risk_level'] == 'HIGH'
+        # Resolved before the inserts so creating the user never shares their transaction
+        system_user_id = None
+        if any(row['is_flagged'] for row in transaction_rows):
+            system_user_id = get_system_user_id(db)
         
-        if not existing:
-            db_txn = models.Transaction(
-                transaction_id=res['transaction_id'],
-                amount=float(res['amount']),
-                transaction_type="Payment", # Default
-                risk_score=risk_score,
-                is_flagged=is_flagged,
-                timestamp=datetime.utcnow()
+        try:
+            inserted_ids = _insert_transactions(db, transaction_rows)
+        
+            # If High Risk, create an Alert linked to its transaction row
+            flagged = [res for res in new_results if res['risk_level'] == 'HIGH' and res['transaction_id'] in inserted_ids]
+            missing_pks = [res['transaction_id'] for res in flagged if inserted_ids[res['transaction_id']] is None]
+            if missing_pks:
+                inserted_ids.update(get_transaction_pks(db, missing_pks))
+            if flagged:
+                db.execute(insert(models.Alert), [
+                    {
+                        'alert_type': "High Risk Transaction",
+                        'severity': "high",
+                        'description': res['explanation'],
+                        'status': "new",
+                        'transaction_id': inserted_ids[res['transaction_id']],
+                        'created_by_id': system_user_id,
+                        'created_at': now
+                    }
+                    for res in flagged
+                ])
+        
+            stats_service.record_transactions(
+                db, [row for row in transaction_rows if row['transaction_id'] in inserted_ids]
             )
-            db.add(db_txn)
+        
+            # Transactions, alerts and dashboard counters land in a single commit
             db.commit()
-            db.refresh(db_txn)
-            
-            # If High Risk, create an Alert
-            if is_flagged:
-                # Ensure system user exists
-                system_user = db.query(models.User).filter(models.User.username == "system").first()
-                if not system_user:
-                    system_user = models.User(
-                        username="system",
-                        email="system@truesight.ai",
-                        hashed_password="hashed_system_password", # Placeholder
-                        full_name="System Admin",
-                        role="admin"
-                    )
-                    db.add(system_user)
-                    db.commit()
-                    db.refresh(system_user)
-                
-                alert = models.Alert(
-                    alert_type="High Risk Transaction",
-                    severity="high",
-                    description=res['explanation'],
-                    status="new",
-                    created_by_id=system_user.id
-                )
-                db.add(alert)
-                db.commit()
-            
-            saved_count += 1
+        except Exception:
+            db.rollback()
+            raise
+        
+        feature_store.record_stored(row for row in transaction_rows if row['transaction_id'] in inserted_ids)
             
-    return saved_count
+        return len(inserted_ids)
+
+def get_existing_transaction_ids(db: Session, transaction_ids: List[str]) -> set:
+    existing = set()
+    for i in range(0, len(transaction_ids), LOOKUP_CHUNK_SIZE):
+        chunk = transaction_ids[i:i + LOOKUP_CHUNK_SIZE]
+        rows = db.execute(
+            select(models.Transaction.transaction_id).where(models.Transaction.transaction_id.in_(chunk))
+        )
+        existing.update(row[0] for row in rows)
+    return existing
+
+def get_transaction_pks(db: Session, transaction_ids: List[str]) -> Dict[str, int]:
+    # Maps transaction_id to the row's primary key, one IN lookup per chunk
+    pks = {}
+    for i in range(0, len(transaction_ids), LOOKUP_CHUNK_SIZE):
+        chunk = transaction_ids[i:i + LOOKUP_CHUNK_SIZE]
+        rows = db.execute(
+            select(models.Transaction.transaction_id, models.Transaction.id).where(models.Transaction.transaction_id.in_(chunk))
+        )
+        pks.update({row[0]: row[1] for row in rows})
+    return pks
+
+def _insert_transactions(db: Session, rows: List[Dict[str, Any]]) -> Dict[str, Optional[int]]:
+    # Returns {transaction_id: primary key} for the rows that were actually inserted.
+    # The key is None when the driver cannot return it from an executemany.
+    dialect = db.get_bind().dialect
+    if dialect.name == "postgresql":
+        # A concurrent run may have inserted the same IDs since the lookup; skip those
+        # rows instead of failing the whole batch on the unique constraint.
+        stmt = pg_insert(models.Transaction).on_conflict_do_nothing(
+            index_elements=[models.Transaction.transaction_id]
+        ).returning(models.Transaction.transaction_id, models.Transaction.id)
+        return {row[0]: row[1] for row in db.execute(stmt, rows)}
+    
+    if dialect.insert_executemany_returning:
+        # SQLite 3.35+: still one batched statement, with the new keys returned
+        stmt = insert(models.Transaction).returning(models.Transaction.transaction_id, models.Transaction.id)
+        return {row[0]: row[1] for row in db.execute(stmt, rows)}
+    
+    # executemany: one statement, many parameter sets
+    db.execute(insert(models.Transaction), rows)
+    return {row['transaction_id']: None for row in rows}
+
+def get_system_user_id(db: Session) -> int:
+    # The "system" user owns auto-generated alerts. Its ID is looked up (or created)
+    # once per database and reused for every later save.
+    cache_key = str(db.get_bind().url)
+    system_user_id = _system_user_ids.get(cache_key)
+    if system_user_id is not None:
+        return system_user_id
+    
+    with _system_user_lock:
+        system_user = db.query(models.User).filter(models.User.username == "system").first()
+        if not system_user:
+            system_user = models.User(
+                username="system",
+                email="system@truesight.ai",
+                hashed_password="hashed_system_password", # Placeholder
+                full_name="System Admin",
+                role="admin"
+            )
+            db.add(system_user)
+            db.commit()
+            db.refresh(system_user)
+        _system_user_ids[cache_key] = system_user.id
+    return system_user.id
@@ -0,0 +1,44 @@
+import os
+from typing import List, Dict, Any, Optional
+import numpy as np
+import pandas as pd
+
+# Seeded synthetic transactions with the same columns and TMLScore mix as
+# analysis_service.generate_sample_transactions (25% low, 50% medium, 25% high),
+# generated column-wise so 1M rows take seconds. The same (count, seed) always gives
+# the same rows.
+
+def generate_frame(count: int, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    bucket = rng.random(count)
+    tml_score = np.where(
+        bucket < 0.25, rng.integers(1, 101, count),
+        np.where(bucket < 0.75, rng.integers(301, 601, count), rng.integers(801, 1000, count))
+    )
+    yes_no = np.array(["No", "Yes"])
+    return pd.DataFrame({
+        'transaction_id': [f"BENCH_{seed}_{i:07d}" for i in range(count)],
+        'amount': rng.integers(100, 20001, count),
+        'TMLScore': tml_score,
+        'new_beneficiary': yes_no[(rng.random(count) > 0.7).astype(int)],
+        'account_age_days': rng.integers(1, 366, count),
+        'high_risk_country': yes_no[(rng.random(count) > 0.8).astype(int)],
+        'velocity_count': rng.integers(1, 21, count),
+        'device_match': yes_no[(rng.random(count) > 0.3).astype(int)],
+        'auth_strength': np.array(["Weak", "Medium", "Strong"])[rng.integers(0, 3, count)],
+        'time_of_day': [f"{h:02d}:{m:02d}" for h, m in zip(rng.integers(0, 24, count), rng.integers(0, 60, count))],
+        'merchant_category': np.array(["Retail", "E-commerce", "International", "Services"])[rng.integers(0, 4, count)]
+    })
+
+def load_transactions(count: int, seed: int = 42, cache_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    # With cache_dir, the frame is written once as Parquet and read back on later runs
+    path = os.path.join(cache_dir, f"transactions-{count}-{seed}.parquet") if cache_dir else None
+    if path and os.path.exists(path):
+        frame = pd.read_parquet(path)
+    else:
+        frame = generate_frame(count, seed)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            frame.to_parquet(path, index=False)
+    # Plain Python ints/strs, as the API would hand them to the pipeline
+    return frame.astype(object).to_dict(orient='records')
@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fake_llm
+
+# OpenAI/Groq-compatible chat completions stub for benchmarks. Point the Groq SDK at
+# it with GROQ_BASE_URL=http://host:port (it serves /openai/v1/chat/completions and
+# /v1/chat/completions). Answers are built from the transactions table in the prompt,
+# like fake_llm, so every stage downstream of the HTTP call runs for real.
+#
+# Response shapes:
+#   table      clean Markdown table, as the prompt asks for
+#   noisy      preamble text, **bold** / `code` IDs, '|' inside explanations and a
+#              trailing note
+#   truncated  a share of rows (--drop-rate) left out, as when max tokens cut the answer
+# Prompts that ask for JSON lines get JSON lines (in a code fence for noisy).
+SHAPES = ("table", "noisy", "truncated")
+
+class StubConfig:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        per_row_latency: float = 0.0,
+        shape: str = "table",
+        drop_rate: float = 0.1,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        if shape not in SHAPES:
+            raise ValueError(f"Unknown shape '{shape}'. Choose from {', '.join(SHAPES)}")
+        self.latency = latency  # seconds per request
+        self.per_row_latency = per_row_latency  # extra seconds per row in the prompt
+        self.shape = shape
+        self.drop_rate = drop_rate
+        self.error_rate = error_rate  # share of requests answered with a 503
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+def build_content(prompt: str, rows: List[Dict[str, str]], config: StubConfig) -> str:
+    if config.shape == "truncated":
+        with config.lock:
+            rows = [row for row in rows if config.random.random() >= config.drop_rate]
+    if config.shape != "noisy":
+        return fake_llm.render_answer(prompt, rows)
+    if "JSON LINES" in prompt:
+        return "```json\n" + fake_llm.render_json_lines(rows) + "\n```"
+
+    lines = [
+        "Here is the risk assessment for the submitted transactions:",
+        "",
+        "| Transaction_ID | Risk_Level | Explanation |",
+        "|:---|:---|:---|"
+    ]
+    for i, row in enumerate(rows):
+        verdict = fake_llm.fake_verdict(row)
+        txn_id = row.get('transaction_id', '')
+        txn_id = f"**{txn_id}**" if i % 2 == 0 else f"`{txn_id}`"
+        lines.append(f"| {txn_id} | **{verdict['risk_level']}** | {verdict['explanation']} | amount {row.get('amount', '')} |")
+    lines += ["", "Note: scores are indicative only."]
+    return "\n".join(lines)
+
+def completion_body(content: str, model: str, prompt_tokens: int) -> Dict[str, Any]:
+    completion_tokens = len(content) // 4 + 1
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "logprobs": None,
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+def stream_events(content: str, model: str, chunk_chars: int = 16):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    pieces = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)]
+    for piece in pieces + [None]:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "delta": {"role": "assistant", "content": piece} if piece is not None else {},
+                "logprobs": None,
+                "finish_reason": None if piece is not None else "stop"
+            }]
+        }
+        yield f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+    yield b"data: [DONE]\n\n"
+
+def make_handler(config: StubConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes; without this, Nagle plus delayed
+        # ACKs add ~40 ms to every keep-alive response
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = request["messages"][-1]["content"]
+            model = request.get("model", "stub")
+            rows = fake_llm.extract_prompt_rows(prompt)
+
+            with config.lock:
+                config.requests += 1
+                failed = config.random.random() < config.error_rate
+            time.sleep(config.latency + config.per_row_latency * len(rows))
+            if failed:
+                self._send_json(503, {"error": {"message": "Service unavailable", "type": "server_error"}})
+                return
+
+            content = build_content(prompt, rows, config)
+            if not request.get("stream"):
+                self._send_json(200, completion_body(content, model, len(prompt) // 4 + 1))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for event in stream_events(content, model):
+                self.wfile.write(f"{len(event):X}\r\n".encode("ascii") + event + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+def start_server(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    # Serves on a background thread; port 0 picks a free port. Returns (server, base URL).
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-llm-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI/Groq-compatible stub server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--per-row-latency", type=float, default=0.0)
+    parser.add_argument("--shape", choices=SHAPES, default="table")
+    parser.add_argument("--drop-rate", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    stub_config = StubConfig(args.latency, args.per_row_latency, args.shape, args.drop_rate, args.error_rate, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(stub_config))
+    print(f"Fake LLM server on http://{args.host}:{args.port} (set GROQ_BASE_URL to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional
+import httpx
+
+# Load test for the multi-worker launch mode (serve.py). Run from truesight/backend:
+#
+#   python benchmarks/load_test.py --workers 1,2,4 --duration 15
+#   python benchmarks/load_test.py --workers 1,4 --paths /api/stats,/api/cases
+#
+# A throwaway SQLite database is seeded through the bulk endpoint, then for each
+# worker count the server is started with serve.py and the read endpoints are hit
+# by --clients client processes (--concurrency connections each) for --duration
+# seconds. The report gives requests/s, p50/p99 latency and the speedup over the
+# first worker count. Scaling needs spare cores: the clients run on the same host,
+# so leave some free (workers + clients <= cores).
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+
+DEFAULT_PATHS = [
+    "/api/stats",
+    "/api/cases?limit=50",
+    "/api/alerts?limit=50",
+    "/api/investigation/feed?limit=50",
+    "/api/analysis/jobs"
+]
+STARTUP_TIMEOUT_SECONDS = 60
+BULK_CHUNK_ROWS = 5000
+
+def percentile(values: List[float], share: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+def seed_rows(count: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [{
+        'transaction_id': f"LOAD_{seed}_{i:07d}",
+        'amount': rng.randint(10, 20000),
+        'transaction_type': rng.choice(["purchase", "transfer", "withdrawal"]),
+        'merchant': f"Merchant {rng.randint(1, 200)}",
+        'location': rng.choice(["New York", "London", "Lagos", "Singapore", "Unknown"]),
+        'ip_address': f"10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+        'device_id': f"device-{rng.randint(1, 5000)}",
+        'user_account': f"acct-{rng.randint(1, 2000)}"
+    } for i in range(count)]
+
+def start_server(workers: int, port: int, env: Dict[str, str]) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    url = f"http://127.0.0.1:{port}/"
+    ready = 0
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve.py exited with code {process.returncode}")
+        try:
+            # Every worker has to be up; several answers in a row are a fair sign
+            if httpx.get(url, timeout=1).status_code == 200:
+                ready += 1
+                if ready >= 3 * workers:
+                    return process
+                continue
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f"Server with {workers} workers did not start in {STARTUP_TIMEOUT_SECONDS}s")
+
+def stop_server(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+async def _client_loop(base_url: str, paths: List[str], duration: float, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def worker(offset: int):
+            nonlocal errors
+            i = offset
+            while time.perf_counter() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code >= 400:
+                        errors += 1
+                        continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return {"latencies": latencies, "errors": errors}
+
+def client_process(base_url: str, paths: List[str], duration: float, concurrency: int) -> Dict[str, Any]:
+    return asyncio.run(_client_loop(base_url, paths, duration, concurrency))
+
+def run_load(base_url: str, paths: List[str], duration: float, clients: int, concurrency: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=clients) as pool:
+        outcomes = list(pool.map(
+            client_process, [base_url] * clients, [paths] * clients, [duration] * clients, [concurrency] * clients
+        ))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for outcome in outcomes for latency in outcome["latencies"]]
+    return {
+        "requests": len(latencies),
+        "errors": sum(outcome["errors"] for outcome in outcomes),
+        "requests_per_second": round(len(latencies) / min(elapsed, duration), 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test read endpoints across worker counts")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of load per worker count")
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--clients", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="client processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="connections per client process")
+    parser.add_argument("--rows", type=int, default=20000, help="transactions seeded before the runs")
+    parser.add_argument("--paths", default=",".join(DEFAULT_PATHS))
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="report path (default benchmarks/results/load-<time>.json)")
+    args = parser.parse_args()
+
+    worker_counts = [int(count) for count in args.workers.split(",") if count.strip()]
+    paths = [path for path in args.paths.split(",") if path.strip()]
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix="truesight-load-") as work_dir:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{os.path.join(work_dir, 'load.db')}",
+            "COORDINATION_PATH": os.path.join(work_dir, "coordination.sqlite3"),
+            "ANALYSIS_CACHE_PATH": os.path.join(work_dir, "analysis_cache.sqlite3"),
+            "PROMETHEUS_MULTIPROC_DIR": os.path.join(work_dir, "prometheus"),
+            "FEATURE_STORE_PATH": "",
+            "SIMILARITY_INDEX_DIR": os.path.join(work_dir, "similarity"),
+            "LLM_BACKEND": "fake"
+        }
+
+        process = start_server(1, args.port, env)
+        try:
+            rows = seed_rows(args.rows, args.seed)
+            for start in range(0, len(rows), BULK_CHUNK_ROWS):
+                body = "\n".join(json.dumps(row) for row in rows[start:start + BULK_CHUNK_ROWS])
+                httpx.post(
+                    f"{base_url}/api/transactions/bulk?include_created=false", content=body,
+                    headers={"Content-Type": "application/x-ndjson"}, timeout=300
+                ).raise_for_status()
+        finally:
+            stop_server(process)
+        print(f"Seeded {args.rows} transactions")
+
+        for workers in worker_counts:
+            process = start_server(workers, args.port, env)
+            try:
+                run_load(base_url, paths, args.warmup, args.clients, args.concurrency)
+                result = {"workers": workers, **run_load(base_url, paths, args.duration, args.clients, args.concurrency)}
+            finally:
+                stop_server(process)
+            baseline = results[0] if results else result
+            result["speedup"] = round(result["requests_per_second"] / max(baseline["requests_per_second"], 1e-9), 2)
+            result["efficiency"] = round(result["speedup"] * baseline["workers"] / workers, 2)
+            results.append(result)
+            print(
+                f"{workers:>3} workers  {result['requests_per_second']:>9.1f} req/s  "
+                f"p50 {result['p50_ms']} ms  p99 {result['p99_ms']} ms  "
+                f"speedup {result['speedup']}x  errors {result['errors']}"
+            )
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "clients": args.clients,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "rows": args.rows,
+            "paths": paths
+        },
+        "results": results
+    }
+    output = args.output or os.path.join(BENCH_DIR, "results", f"load-{datetime.utcnow():%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Optional
+
+# Micro-benchmark: response_parser against the table parser it replaced, on clean
+# tables, tables with format drift and JSON lines. Run from truesight/backend:
+#
+#   python benchmarks/parser_benchmark.py --rows 100 --repeat 200
+#
+# Reports rows/s and the share of rows each parser recovered.
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import fake_llm
+import response_parser
+import bench_data
+
+# The parser as it was before response_parser, kept here only for comparison
+def legacy_parse_table_response(response_text: str, original_transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    results = []
+    lines = response_text.strip().split('\n')
+    table_start = -1
+    for i, line in enumerate(lines):
+        if '|' in line and 'Transaction_ID' in line:
+            table_start = i + 2
+            break
+    if table_start == -1 or table_start >= len(lines):
+        return []
+    transaction_map = {t['transaction_id']: t for t in original_transactions}
+    for line in lines[table_start:]:
+        line = line.strip()
+        if not line.startswith('|'):
+            continue
+        parts = [part.strip() for part in line.split('|') if part.strip()]
+        if len(parts) < 3:
+            continue
+        txn_id, risk_level_raw, explanation = parts[0], parts[1], parts[2]
+        risk_level = "UNKNOWN"
+        if 'LOW' in risk_level_raw.upper():
+            risk_level = "LOW"
+        elif 'MEDIUM' in risk_level_raw.upper():
+            risk_level = "MEDIUM"
+        elif 'HIGH' in risk_level_raw.upper():
+            risk_level = "HIGH"
+        if txn_id not in transaction_map:
+            continue
+        results.append({
+            **transaction_map[txn_id],
+            'risk_level': risk_level,
+            'explanation': explanation,
+            'analyzed_at': datetime.utcnow().isoformat()
+        })
+    return results
+
+def new_parse(response_text: str, original_transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    index = response_parser.TransactionIndex(original_transactions)
+    return response_parser.ResponseParser(index).parse(response_text)
+
+def noisy_table(rows: List[Dict[str, str]]) -> str:
+    lines = ["Here is my assessment:", "", "| Transaction_ID | Risk_Level | Explanation |", "|:---|:---|:---|"]
+    for i, row in enumerate(rows):
+        verdict = fake_llm.fake_verdict(row)
+        txn_id = f"**{row['transaction_id']}**" if i % 3 == 0 else f"`{row['transaction_id']}`" if i % 3 == 1 else row['transaction_id']
+        lines.append(f"| {txn_id} | {verdict['risk_level']} | {verdict['explanation']} | velocity {row['velocity_count']} |")
+    return "\n".join(lines + ["", "Let me know if you need more detail."])
+
+CASES = {
+    "clean_table": fake_llm.render_table,
+    "noisy_table": noisy_table,
+    "json_lines": fake_llm.render_json_lines
+}
+PARSERS = {"legacy": legacy_parse_table_response, "response_parser": new_parse}
+
+def time_parser(parse: Callable, response: str, batch: List[Dict[str, Any]], repeat: int) -> Dict[str, Any]:
+    recovered = len(parse(response, batch))
+    started = time.perf_counter()
+    for _ in range(repeat):
+        parse(response, batch)
+    seconds = time.perf_counter() - started
+    return {
+        "rows_per_s": round(len(batch) * repeat / seconds, 1),
+        "us_per_batch": round(seconds / repeat * 1e6, 1),
+        "recovered_share": round(recovered / len(batch), 4)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare LLM response parsers")
+    parser.add_argument("--rows", type=int, default=100, help="rows per response (one batch)")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", default=None, help="optional JSON report path")
+    args = parser.parse_args()
+
+    batch = bench_data.load_transactions(args.rows)
+    prompt_rows = [{k: str(v) for k, v in txn.items()} for txn in batch]
+    report: Dict[str, Any] = {"rows": args.rows, "repeat": args.repeat, "cases": {}}
+    for case, render in CASES.items():
+        response = render(prompt_rows)
+        report["cases"][case] = {name: time_parser(parse, response, batch, args.repeat) for name, parse in PARSERS.items()}
+        for name, result in report["cases"][case].items():
+            print(f"{case:<12} {name:<16} {result['rows_per_s']:>12,.0f} rows/s  {result['us_per_batch']:>9,.1f} us/batch  recovered {result['recovered_share']:.0%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import os
+import time
+import base64
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import select, update, func, and_, or_, case as sql_case
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+import models
+import schemas
+import stats_service
+import change_versions
+import investigation_service
+import fast_responses
+
+# Case dossier: a case with its assignee, a page of its alerts, a page of its
+# transactions and totals over all of both, in five queries however large the
+# case is:
+#   1. the case joined to its assignee (joinedload)
+#   2. one page of its alerts, newest first, keyset-paginated on id
+#   3. alert count per severity (one aggregate)
+#   4. count / amount sum / risk distribution of its transactions (one aggregate)
+#   5. one page of its transactions, newest first, keyset-paginated like the feed
+#
+# Dossiers are cached per case for DOSSIER_CACHE_TTL_SECONDS, and retired early in
+# every worker when the case's version in change_versions moves: on any committed
+# write to the case, or to an alert or transaction in it (see change_versions), and
+# on attach, which updates by statement and bumps the cases itself.
+DEFAULT_DOSSIER_TRANSACTIONS = 50
+MAX_DOSSIER_TRANSACTIONS = 500
+DEFAULT_DOSSIER_ALERTS = 50
+MAX_DOSSIER_ALERTS = 500
+DOSSIER_CACHE_TTL_SECONDS = float(os.getenv("DOSSIER_CACHE_TTL_SECONDS", "30"))
+DOSSIER_CACHE_MAX_CASES = 1024
+# Ids accepted per attach request
+MAX_ATTACH_IDS = 10000
+
+CASE_FIELDS = list(schemas.Case.model_fields)
+ALERT_FIELDS = list(schemas.Alert.model_fields)
+ASSIGNEE_FIELDS = ["id", "username", "full_name", "email", "role"]
+TRANSACTION_COLUMNS = fast_responses.columns_for(models.Transaction, schemas.Transaction)
+
+class CaseNotFound(Exception):
+    pass
+
+# {case_id: {(limit, cursor, alerts_limit, alerts_cursor): (stored_at, case version, dossier)}}
+_cache: Dict[int, Dict[Tuple[Any, ...], Tuple[float, int, Dict[str, Any]]]] = {}
+_cache_lock = threading.Lock()
+
+def case_version_key(case_id: int) -> str:
+    return change_versions.case_key(case_id)
+
+def encode_alert_cursor(alert_id: int) -> str:
+    return base64.urlsafe_b64encode(f"alert|{alert_id}".encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_alert_cursor(cursor: str) -> int:
+    # Raises ValueError for malformed cursors
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        kind, alert_id = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").split("|")
+        if kind != "alert":
+            raise ValueError
+        return int(alert_id)
+    except Exception:
+        raise ValueError("Invalid alerts cursor")
+
+def build_case_query(case_id: int):
+    return (
+        select(models.Case)
+        .options(joinedload(models.Case.assigned_to))
+        .where(models.Case.id == case_id)
+    )
+
+def build_alerts_query(case_id: int, limit: int, cursor: Optional[int] = None):
+    # One extra row tells whether there is a next page
+    alert = models.Alert
+    conditions = [alert.case_id == case_id]
+    if cursor is not None:
+        conditions.append(alert.id < cursor)
+    return select(*[getattr(alert, field) for field in ALERT_FIELDS]).where(*conditions).order_by(alert.id.desc()).limit(limit + 1)
+
+def build_alert_totals_query(case_id: int):
+    alert = models.Alert
+    return select(alert.severity, func.count(alert.id)).where(alert.case_id == case_id).group_by(alert.severity)
+
+def build_totals_query(case_id: int):
+    txn = models.Transaction
+    level = stats_service.risk_level_expression()
+    return select(
+        func.count(txn.id).label("transaction_count"),
+        func.coalesce(func.sum(txn.amount), 0.0).label("amount_sum"),
+        func.coalesce(func.max(txn.amount), 0.0).label("amount_max"),
+        func.coalesce(func.sum(sql_case((txn.is_flagged, 1), else_=0)), 0).label("flagged_count"),
+        func.min(txn.timestamp).label("first_transaction_at"),
+        func.max(txn.timestamp).label("last_transaction_at"),
+        *[
+            func.coalesce(func.sum(sql_case((level == risk, 1), else_=0)), 0).label(risk)
+            for risk in investigation_service.RISK_LEVELS
+        ]
+    ).where(txn.case_id == case_id)
+
+def build_transactions_query(case_id: int, limit: int, cursor: Optional[Tuple[datetime, int]] = None):
+    # One extra row tells whether there is a next page
+    txn = models.Transaction
+    conditions = [txn.case_id == case_id]
+    if cursor is not None:
+        cursor_timestamp, cursor_id = cursor
+        conditions.append(or_(
+            txn.timestamp < cursor_timestamp,
+            and_(txn.timestamp == cursor_timestamp, txn.id < cursor_id)
+        ))
+    return (
+        select(*TRANSACTION_COLUMNS)
+        .where(*conditions)
+        .order_by(txn.timestamp.desc(), txn.id.desc())
+        .limit(limit + 1)
+    )
+
+def _fields(obj: Any, fields: List[str]) -> Dict[str, Any]:
+    return {field: getattr(obj, field) for field in fields}
+
+def serialize_dossier(
+    db_case: models.Case,
+    alert_rows: List[Any],
+    alert_totals: List[Any],
+    totals: Any,
+    rows: List[Any],
+    alerts_limit: int,
+    limit: int
+) -> Dict[str, Any]:
+    next_alerts_cursor = None
+    if len(alert_rows) > alerts_limit:
+        alert_rows = alert_rows[:alerts_limit]
+        next_alerts_cursor = encode_alert_cursor(alert_rows[-1].id)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = investigation_service.encode_cursor(rows[-1].timestamp, rows[-1].id)
+    severity = {level: count for level, count in alert_totals}
+    return {
+        "case": _fields(db_case, CASE_FIELDS),
+        "assigned_to": _fields(db_case.assigned_to, ASSIGNEE_FIELDS) if db_case.assigned_to else None,
+        "alerts": {
+            "items": [row._asdict() for row in alert_rows],
+            "next_cursor": next_alerts_cursor
+        },
+        "totals": {
+            "transaction_count": totals.transaction_count,
+            "amount_sum": float(totals.amount_sum),
+            "amount_max": float(totals.amount_max),
+            "flagged_count": int(totals.flagged_count),
+            "first_transaction_at": totals.first_transaction_at,
+            "last_transaction_at": totals.last_transaction_at,
+            "risk_distribution": {risk: int(getattr(totals, risk)) for risk in investigation_service.RISK_LEVELS},
+            "alert_count": sum(severity.values()),
+            "alert_severity": severity
+        },
+        "transactions": {
+            "items": [row._asdict() for row in rows],
+            "next_cursor": next_cursor
+        }
+    }
+
+async def get_dossier(
+    db: AsyncSession,
+    case_id: int,
+    limit: int = DEFAULT_DOSSIER_TRANSACTIONS,
+    cursor: Optional[str] = None,
+    alerts_limit: int = DEFAULT_DOSSIER_ALERTS,
+    alerts_cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    # Raises CaseNotFound, or ValueError for a malformed cursor
+    limit = max(1, min(limit, MAX_DOSSIER_TRANSACTIONS))
+    alerts_limit = max(1, min(alerts_limit, MAX_DOSSIER_ALERTS))
+    decoded_cursor = investigation_service.decode_cursor(cursor) if cursor else None
+    decoded_alerts_cursor = decode_alert_cursor(alerts_cursor) if alerts_cursor else None
+    key = (limit, cursor, alerts_limit, alerts_cursor)
+    # Read before the queries: a change landing meanwhile leaves an entry that is
+    # already outdated by the version, never one that looks current
+    version = change_versions.version(case_version_key(case_id))
+    cached = _cache_get(case_id, key, version)
+    if cached is not None:
+        return cached
+
+    db_case = (await db.execute(build_case_query(case_id))).unique().scalar_one_or_none()
+    if db_case is None:
+        raise CaseNotFound(case_id)
+    alert_rows = (await db.execute(build_alerts_query(case_id, alerts_limit, decoded_alerts_cursor))).all()
+    alert_totals = (await db.execute(build_alert_totals_query(case_id))).all()
+    totals = (await db.execute(build_totals_query(case_id))).one()
+    rows = (await db.execute(build_transactions_query(case_id, limit, decoded_cursor))).all()
+    dossier = serialize_dossier(db_case, alert_rows, alert_totals, totals, rows, alerts_limit, limit)
+    _cache_put(case_id, key, version, dossier)
+    return dossier
+
+def _cache_get(case_id: int, key: Tuple[Any, ...], version: int) -> Optional[Dict[str, Any]]:
+    with _cache_lock:
+        entry = _cache.get(case_id, {}).get(key)
+    if entry is None:
+        return None
+    stored_at, stored_version, dossier = entry
+    if stored_version != version or time.monotonic() - stored_at > DOSSIER_CACHE_TTL_SECONDS:
+        return None
+    return dossier
+
+def _cache_put(case_id: int, key: Tuple[Any, ...], version: int, dossier: Dict[str, Any]):
+    with _cache_lock:
+        pages = _cache.pop(case_id, None) or {}
+        # Entries from an older version of the case are dropped with it
+        pages = {k: v for k, v in pages.items() if v[1] == version}
+        pages[key] = (time.monotonic(), version, dossier)
+        _cache[case_id] = pages  # re-inserted last: dict order is least recently written first
+        while len(_cache) > DOSSIER_CACHE_MAX_CASES:
+            del _cache[next(iter(_cache))]
+
+def invalidate(case_id: int):
+    # This process's entries go at once; other workers see the version bump
+    change_versions.bump([case_version_key(case_id)])
+    with _cache_lock:
+        _cache.pop(case_id, None)
+
+async def _attach(db: AsyncSession, case_id: int, model, ids: List[int]) -> Dict[str, Any]:
+    ids = sorted(set(ids))
+    if len(ids) > MAX_ATTACH_IDS:
+        raise ValueError(f"At most {MAX_ATTACH_IDS} ids per request")
+    if await db.get(models.Case, case_id) is None:
+        raise CaseNotFound(case_id)
+    # {id: case it is attached to now}; moving rows between cases changes both
+    found = dict((await db.execute(select(model.id, model.case_id).where(model.id.in_(ids)))).all()) if ids else {}
+    missing = [row_id for row_id in ids if row_id not in found]
+    if found:
+        await db.execute(
+            update(model).where(model.id.in_(list(found))).values(case_id=case_id),
+            execution_options={"synchronize_session": False}
+        )
+        await db.commit()
+        for affected in {case_id, *found.values()} - {None}:
+            invalidate(affected)
+    return {"case_id": case_id, "attached": sorted(found), "missing": missing}
+
+async def attach_alerts(db: AsyncSession, case_id: int, alert_ids: List[int]) -> Dict[str, Any]:
+    return await _attach(db, case_id, models.Alert, alert_ids)
+
+async def attach_transactions(db: AsyncSession, case_id: int, transaction_ids: List[int]) -> Dict[str, Any]:
+    return await _attach(db, case_id, models.Transaction, transaction_ids)
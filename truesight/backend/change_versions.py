@@ -0,0 +1,102 @@
+import uuid
+import threading
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+import coordination
+
+# Per-table change counters. A committed session that inserted, updated or deleted
+# rows of a table bumps that table's version, whether the write went through the
+# unit of work (session.add) or an ORM-enabled statement (session.execute(insert(
+# models.Transaction), rows)). List endpoints build their ETags from the versions of
+# the tables they read, so an unchanged list is answered with 304 without a query.
+#
+# Writes that bypass the session (raw DBAPI cursors) must call mark() themselves.
+# Versions live in this process, or in the coordination store when several workers
+# serve the API (a write in one worker then invalidates ETags in all of them). The
+# epoch changes on every start so ETags issued before a restart never match.
+#
+# Besides tables, each case has a version (case_key) for the cached case dossiers:
+# it moves when the case row changes or when an alert or transaction that belongs,
+# or belonged, to it is written through the session or inserted by statement.
+# UPDATE/DELETE statements on those tables do not say which cases they touch; the
+# callers bump the cases themselves (case_service._attach) or leave case rows alone
+# (storage_lifecycle only archives transactions outside cases).
+
+_epoch = uuid.uuid4().hex[:8]
+_shared_epoch: Optional[str] = None
+_versions: Dict[str, int] = {}
+_lock = threading.Lock()
+
+def epoch() -> str:
+    global _shared_epoch
+    if not coordination.enabled():
+        return _epoch
+    if _shared_epoch is None:
+        # Shared by all workers of one server start; read once per process
+        _shared_epoch = coordination.get_store().epoch()
+    return _shared_epoch
+
+def version(table: str) -> int:
+    return versions([table])[0]
+
+def versions(tables: Iterable[str]) -> List[int]:
+    tables = list(tables)
+    if coordination.enabled():
+        shared = coordination.get_store().versions(tables)
+        return [shared.get(table, 0) for table in tables]
+    return [_versions.get(table, 0) for table in tables]
+
+def bump(tables: Iterable[str]):
+    if coordination.enabled():
+        coordination.get_store().bump(tables)
+        return
+    with _lock:
+        for table in tables:
+            _versions[table] = _versions.get(table, 0) + 1
+
+def case_key(case_id: int) -> str:
+    return f"case:{case_id}"
+
+def mark(session: Session, table: str):
+    # Records a pending change; the version moves when the session commits
+    session.info.setdefault("changed_tables", set()).add(table)
+
+def _case_ids(obj, table: str) -> List[int]:
+    if table == "cases":
+        return [obj.id] if obj.id is not None else []
+    if not hasattr(obj, "case_id"):
+        return []
+    # Current value plus the one it replaced, so moving a row changes both cases
+    history = inspect(obj).attrs.case_id.history
+    return [case_id for case_id in {obj.case_id, *history.deleted} if case_id is not None]
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table:
+            mark(session, table)
+            for case_id in _case_ids(obj, table):
+                mark(session, case_key(case_id))
+
+@event.listens_for(Session, "do_orm_execute")
+def _do_orm_execute(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            mark(orm_execute_state.session, mapper.local_table.name)
+    if orm_execute_state.is_insert:
+        rows = orm_execute_state.parameters
+        for row in (rows if isinstance(rows, list) else [rows] if rows else []):
+            if row.get("case_id") is not None:
+                mark(orm_execute_state.session, case_key(row["case_id"]))
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    # Marks are only cleared by a commit. A rolled-back change may therefore bump a
+    # version at the next commit, which costs one extra full response, never a
+    # stale 304.
+    tables = session.info.pop("changed_tables", None)
+    if tables:
+        bump(tables)
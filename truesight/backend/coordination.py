@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+import numpy as np
+
+# Cross-process state for running several API workers on one host (serve.py).
+# A SQLite file in WAL mode holds what the workers must agree on:
+#   rate_buckets     LLM request and token budgets (llm_scheduler)
+#   table_versions   change counters behind ETags and the stats cache (change_versions)
+#   jobs, job_items  the analysis job queue, job progress and results (job_service)
+#   leases           which worker runs a singleton background task (retention)
+#   meta             the ETag epoch of the current server start
+# With COORDINATION_PATH unset (the default, one process) nothing here is used and
+# each of those modules keeps its state in memory.
+
+COORDINATION_PATH = os.getenv("COORDINATION_PATH", "")
+# Seconds a writer waits for another process's write lock before failing
+BUSY_TIMEOUT_SECONDS = 30.0
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS rate_buckets (name TEXT PRIMARY KEY, available REAL NOT NULL, updated_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, owner INTEGER, error TEXT, "
+    "payload TEXT, state TEXT NOT NULL, created_at REAL NOT NULL, finished_at REAL)",
+    "CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status, created_at)",
+    "CREATE TABLE IF NOT EXISTS job_items ("
+    "job_id TEXT NOT NULL, kind TEXT NOT NULL, seq INTEGER NOT NULL, body TEXT NOT NULL, "
+    "PRIMARY KEY (job_id, kind, seq))"
+]
+
+RUNNING_STATUSES = ("running", "saving")
+
+def enabled() -> bool:
+    return bool(COORDINATION_PATH)
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, default=_json_default)
+
+def pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class CoordinationStore:
+    # One connection per process, used under a lock like SQLiteCacheBackend.
+    # Read-modify-write steps run in BEGIN IMMEDIATE transactions, which take the
+    # file's write lock up front, so they are atomic across processes.
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql: str, params: Iterable[Any] = ()) -> List[Tuple]:
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def reset(self):
+        # Called once by serve.py before the workers start: a new ETag epoch, fresh
+        # versions and leases, and jobs that were running when the last server
+        # stopped are marked failed. Queued jobs are kept and picked up again.
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex[:8],))
+            conn.execute("DELETE FROM table_versions")
+            conn.execute("DELETE FROM leases")
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Server restarted', finished_at = ? WHERE status IN (?, ?)",
+                (time.time(), *RUNNING_STATUSES)
+            )
+
+    def epoch(self) -> str:
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex[:8],))
+            return conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+    # Rate buckets
+
+    def take(self, name: str, amount: float, rate_per_second: float, capacity: float) -> float:
+        # Same rules as llm_scheduler.TokenBucket. Takes `amount` and returns 0 when
+        # enough is available, otherwise leaves the bucket as is and returns the
+        # seconds until it will be.
+        now = time.time()
+        with self._transaction() as conn:
+            available = self._refilled(conn, name, now, rate_per_second, capacity)
+            needed = min(amount, capacity)
+            wait = 0.0
+            if available >= needed:
+                available -= amount
+            else:
+                wait = (needed - available) / rate_per_second
+            conn.execute("INSERT OR REPLACE INTO rate_buckets (name, available, updated_at) VALUES (?, ?, ?)", (name, available, now))
+        return wait
+
+    def adjust(self, name: str, amount: float, rate_per_second: float, capacity: float):
+        now = time.time()
+        with self._transaction() as conn:
+            available = self._refilled(conn, name, now, rate_per_second, capacity) - amount
+            conn.execute("INSERT OR REPLACE INTO rate_buckets (name, available, updated_at) VALUES (?, ?, ?)", (name, available, now))
+
+    def _refilled(self, conn, name: str, now: float, rate_per_second: float, capacity: float) -> float:
+        row = conn.execute("SELECT available, updated_at FROM rate_buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return capacity
+        return min(capacity, row[0] + max(0.0, now - row[1]) * rate_per_second)
+
+    # Table versions
+
+    def versions(self, tables: List[str]) -> Dict[str, int]:
+        placeholders = ",".join("?" * len(tables))
+        return dict(self._query(f"SELECT name, version FROM table_versions WHERE name IN ({placeholders})", tables))
+
+    def bump(self, tables: Iterable[str]):
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO table_versions (name, version) VALUES (?, 1) "
+                "ON CONFLICT (name) DO UPDATE SET version = version + 1",
+                [(table,) for table in tables]
+            )
+
+    # Leases
+
+    def acquire_lease(self, name: str, holder: str, seconds: float) -> bool:
+        # True if `holder` now holds the lease for `seconds`: it was free, expired,
+        # or already held by the same holder (renewal)
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != holder and row[1] > now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)", (name, holder, now + seconds))
+            return True
+
+    # Jobs
+
+    def insert_job(self, job_id: str, kind: str, payload: Dict[str, Any], state: Dict[str, Any]):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, state, created_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, dumps(payload), dumps(state), time.time())
+            )
+
+    def claim_job(self, owner: int, max_running: int) -> Optional[Tuple[str, str, Dict[str, Any], Dict[str, Any]]]:
+        # Oldest queued job as (id, kind, payload, state), marked running for
+        # `owner`, unless max_running jobs are already running on the host
+        with self._transaction() as conn:
+            running = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", RUNNING_STATUSES
+            ).fetchone()[0]
+            if running >= max_running:
+                return None
+            row = conn.execute(
+                "SELECT id, kind, payload, state FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET status = 'running', owner = ? WHERE id = ?", (owner, row[0]))
+        return row[0], row[1], json.loads(row[2]), json.loads(row[3])
+
+    def update_job(
+        self,
+        job_id: str,
+        state: Dict[str, Any],
+        results: Optional[List[Dict[str, Any]]] = None,
+        dead_letter: Optional[List[Dict[str, Any]]] = None,
+        replace_results: bool = False
+    ):
+        # Writes the job's to_dict() and appends results / dead-letter rows (or,
+        # with replace_results, swaps in the final result list)
+        finished = state['status'] in ("completed", "failed")
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, state = ?, finished_at = ?, "
+                "payload = CASE WHEN ? THEN NULL ELSE payload END WHERE id = ?",
+                (state['status'], state.get('error'), dumps(state), time.time() if finished else None, finished, job_id)
+            )
+            if replace_results:
+                conn.execute("DELETE FROM job_items WHERE job_id = ? AND kind = 'result'", (job_id,))
+            for kind, items in (("result", results), ("dead_letter", dead_letter)):
+                if not items:
+                    continue
+                start = conn.execute(
+                    "SELECT COALESCE(MAX(seq) + 1, 0) FROM job_items WHERE job_id = ? AND kind = ?", (job_id, kind)
+                ).fetchone()[0]
+                conn.executemany(
+                    "INSERT INTO job_items (job_id, kind, seq, body) VALUES (?, ?, ?, ?)",
+                    [(job_id, kind, start + i, dumps(item)) for i, item in enumerate(items)]
+                )
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT status, owner, error, state FROM jobs WHERE id = ?", (job_id,))
+        return self._job_view(rows[0]) if rows else None
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        rows = self._query("SELECT status, owner, error, state FROM jobs ORDER BY created_at DESC")
+        return [self._job_view(row) for row in rows]
+
+    def _job_view(self, row: Tuple) -> Dict[str, Any]:
+        # The status and error columns win over the state snapshot: reset() and
+        # fail_orphaned_jobs() only update the columns
+        state = json.loads(row[3])
+        state['status'] = row[0]
+        state['error'] = row[2] or state.get('error')
+        state['owner'] = row[1]
+        return state
+
+    def job_items(self, job_id: str, kind: str, offset: int = 0, limit: int = -1) -> List[Dict[str, Any]]:
+        rows = self._query(
+            "SELECT body FROM job_items WHERE job_id = ? AND kind = ? AND seq >= ? ORDER BY seq LIMIT ?",
+            (job_id, kind, offset, limit)
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def count_job_items(self, job_id: str, kind: str) -> int:
+        return self._query("SELECT COUNT(*) FROM job_items WHERE job_id = ? AND kind = ?", (job_id, kind))[0][0]
+
+    def fail_orphaned_jobs(self) -> int:
+        # Running jobs whose worker process is gone (killed, crashed) are marked failed
+        rows = self._query("SELECT id, owner FROM jobs WHERE status IN (?, ?)", RUNNING_STATUSES)
+        orphaned = [row[0] for row in rows if not pid_alive(row[1])]
+        if orphaned:
+            with self._transaction() as conn:
+                conn.executemany(
+                    "UPDATE jobs SET status = 'failed', error = 'Worker process exited', finished_at = ? "
+                    "WHERE id = ? AND status IN (?, ?)",
+                    [(time.time(), job_id, *RUNNING_STATUSES) for job_id in orphaned]
+                )
+        return len(orphaned)
+
+    def prune_jobs(self, finished_before: float) -> int:
+        with self._transaction() as conn:
+            expired = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (finished_before,)
+            ).fetchall()]
+            conn.executemany("DELETE FROM job_items WHERE job_id = ?", [(job_id,) for job_id in expired])
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+        return len(expired)
+
+_store: Optional[CoordinationStore] = None
+_store_lock = threading.Lock()
+
+def get_store() -> CoordinationStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if not COORDINATION_PATH:
+                    raise ValueError("COORDINATION_PATH is not set")
+                _store = CoordinationStore(COORDINATION_PATH)
+    return _store
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import random
+import threading
+from typing import List, Dict, Any, Iterator, Optional
+
+# Local stand-in for the Groq client (client.chat.completions.create) for tests and
+# offline runs. It reads the transactions table out of the prompt and answers with a
+# well-formed result table, deciding risk from TMLScore. Latency and failures can be
+# injected to exercise the scheduler. Enable with LLM_BACKEND=fake.
+
+class FakeLLMError(Exception):
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class _Message:
+    def __init__(self, content: str):
+        self.role = "assistant"
+        self.content = content
+
+class _Choice:
+    def __init__(self, content: str):
+        self.index = 0
+        self.message = _Message(content)
+        self.finish_reason = "stop"
+
+class _Usage:
+    def __init__(self, prompt_tokens: int, completion_tokens: int):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.total_tokens = prompt_tokens + completion_tokens
+
+class _Completion:
+    def __init__(self, content: str, model: str, prompt_tokens: int):
+        self.model = model
+        self.choices = [_Choice(content)]
+        self.usage = _Usage(prompt_tokens, len(content) // 4 + 1)
+
+class _Delta:
+    def __init__(self, content: Optional[str]):
+        self.role = "assistant"
+        self.content = content
+
+class _ChunkChoice:
+    def __init__(self, content: Optional[str], finish_reason: Optional[str] = None):
+        self.index = 0
+        self.delta = _Delta(content)
+        self.finish_reason = finish_reason
+
+class _XGroq:
+    def __init__(self, usage: _Usage):
+        self.usage = usage
+
+class _Chunk:
+    def __init__(self, content: Optional[str], model: str, finish_reason: Optional[str] = None, usage: Optional[_Usage] = None):
+        self.model = model
+        self.choices = [_ChunkChoice(content, finish_reason)]
+        if usage is not None:
+            # Where Groq puts the usage of a streamed response
+            self.x_groq = _XGroq(usage)
+
+def extract_prompt_rows(prompt: str) -> List[Dict[str, str]]:
+    # Parses the pipe-separated transactions table that follows "TRANSACTIONS DATA"
+    lines = prompt.split("\n")
+    start = next((i for i, line in enumerate(lines) if line.startswith("TRANSACTIONS DATA")), None)
+    if start is None or start + 1 >= len(lines):
+        return []
+    header = lines[start + 1].split("|")
+    rows = []
+    for line in lines[start + 2:]:
+        if not line.strip():
+            break
+        rows.append(dict(zip(header, line.split("|"))))
+    return rows
+
+def fake_verdict(row: Dict[str, str]) -> Dict[str, str]:
+    try:
+        tml_score = int(float(row.get("TMLScore") or 0))
+    except ValueError:
+        tml_score = 0
+    if tml_score >= 800:
+        return {'risk_level': "🔴 HIGH", 'explanation': f"TMLScore {tml_score} is in the suspicious range"}
+    if tml_score >= 300:
+        return {'risk_level': "🟡 MEDIUM", 'explanation': f"TMLScore {tml_score} is elevated; review behavioural factors"}
+    return {'risk_level': "🟢 LOW", 'explanation': f"TMLScore {tml_score} is low with no strong risk factors"}
+
+def render_table(rows: List[Dict[str, str]]) -> str:
+    lines = [
+        "| Transaction_ID | Risk_Level | Explanation |",
+        "|----------------|------------|-------------|"
+    ]
+    for row in rows:
+        verdict = fake_verdict(row)
+        lines.append(f"| {row.get('transaction_id', '')} | {verdict['risk_level']} | {verdict['explanation']} |")
+    return "\n".join(lines)
+
+def render_json_lines(rows: List[Dict[str, str]]) -> str:
+    # Answer shape for prompts that ask for JSON lines (config['responseFormat'] = 'json')
+    lines = []
+    for row in rows:
+        verdict = fake_verdict(row)
+        lines.append(json.dumps({
+            'transaction_id': row.get('transaction_id', ''),
+            'risk_level': verdict['risk_level'].split()[-1],
+            'explanation': verdict['explanation']
+        }))
+    return "\n".join(lines)
+
+def render_answer(prompt: str, rows: List[Dict[str, str]]) -> str:
+    return render_json_lines(rows) if "JSON LINES" in prompt else render_table(rows)
+
+class _FakeCompletions:
+    def __init__(self, owner: "FakeLLMClient"):
+        self._owner = owner
+
+    def create(self, messages: List[Dict[str, str]], model: str = "fake", stream: bool = False, **kwargs):
+        completion = self._owner.complete(messages, model, stream)
+        if stream:
+            return self._owner.stream_chunks(completion)
+        return completion
+
+class _FakeChat:
+    def __init__(self, owner: "FakeLLMClient"):
+        self.completions = _FakeCompletions(owner)
+
+class FakeLLMClient:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        # failure_rate: share of calls failing with a 503
+        # rate_limit_rate: share of calls failing with a 429 + Retry-After
+        # drop_rate: share of rows silently left out of the response table
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.drop_rate = drop_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = _FakeChat(self)
+
+    @classmethod
+    def from_env(cls) -> "FakeLLMClient":
+        return cls(
+            latency=float(os.getenv("FAKE_LLM_LATENCY", "0")),
+            failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0")),
+            rate_limit_rate=float(os.getenv("FAKE_LLM_RATE_LIMIT_RATE", "0")),
+            drop_rate=float(os.getenv("FAKE_LLM_DROP_RATE", "0")),
+            seed=int(os.environ["FAKE_LLM_SEED"]) if os.getenv("FAKE_LLM_SEED") else None
+        )
+
+    def complete(self, messages: List[Dict[str, str]], model: str, stream: bool = False):
+        prompt = messages[-1]["content"]
+        rows = extract_prompt_rows(prompt)
+        with self._lock:
+            self.calls += 1
+            roll = self._random.random()
+            if self.drop_rate:
+                rows = [row for row in rows if self._random.random() >= self.drop_rate]
+
+        # When streaming, the latency is spread over the chunks instead
+        if self.latency and not stream:
+            time.sleep(self.latency)
+        if roll < self.rate_limit_rate:
+            raise FakeLLMError("Rate limit reached", status_code=429, retry_after=0.1)
+        if roll < self.rate_limit_rate + self.failure_rate:
+            raise FakeLLMError("Service unavailable", status_code=503)
+        return _Completion(render_answer(prompt, rows), model, len(prompt) // 4 + 1)
+
+    def stream_chunks(self, completion: _Completion, chunk_chars: int = 16) -> Iterator[_Chunk]:
+        # Splits a finished completion into small deltas, like a token stream
+        content = completion.choices[0].message.content
+        pieces = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)] or [""]
+        delay = self.latency / len(pieces)
+        for piece in pieces:
+            if delay:
+                time.sleep(delay)
+            yield _Chunk(piece, completion.model)
+        yield _Chunk(None, completion.model, finish_reason="stop", usage=completion.usage)
@@ -0,0 +1,173 @@
+import zlib
+import hashlib
+from typing import List, Dict, Any, Iterable, Optional
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+import change_versions
+
+# Response path for the list endpoints: column rows instead of ORM objects and
+# Pydantic models, encoded with orjson; ETags from change_versions for conditional
+# GETs; and response compression.
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:
+    orjson = None
+    FastJSONResponse = JSONResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+COMPRESSION_MINIMUM_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+# Streams are left alone so each line / event still goes out as soon as it is written
+UNCOMPRESSED_TYPES = ("text/event-stream", "application/x-ndjson", "application/zip", "image/")
+
+def columns_for(model, schema) -> List[Any]:
+    # The table columns behind a response schema's fields, for select(*columns)
+    table = model.__table__
+    return [table.c[name] for name in schema.model_fields if name in table.c]
+
+def json_response(content: Any, headers: Optional[Dict[str, str]] = None, status_code: int = 200) -> Response:
+    return FastJSONResponse(content=content, headers=headers, status_code=status_code)
+
+def rows_response(rows: Iterable[Any], headers: Optional[Dict[str, str]] = None) -> Response:
+    # SQLAlchemy result rows (select of columns) as a JSON array of objects
+    return json_response([row._asdict() for row in rows], headers=headers)
+
+def etag_for(request: Request, tables: List[str]) -> str:
+    # Weak ETag from the versions of the tables a response reads plus the query
+    # string (pagination and filters). Take it before running the query: a change
+    # that lands meanwhile then yields a newer ETag on the next request.
+    query = hashlib.blake2b(str(request.url.query).encode("utf-8"), digest_size=6).hexdigest()
+    parts = "-".join(str(version) for version in change_versions.versions(tables))
+    return f'W/"{change_versions.epoch()}-{parts}-{query}"'
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison: W/ prefixes are ignored
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith("W/") else candidate) == wanted:
+            return True
+    return False
+
+def conditional_headers(etag: str) -> Dict[str, str]:
+    # no-cache: browsers keep the body but revalidate with If-None-Match every time
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers=conditional_headers(etag))
+
+def _accepted_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+def _compressor(encoding: str):
+    # Incremental compressor with compress(data) / finish() for either encoding
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+    return compressor.compress, compressor.flush
+
+class CompressionMiddleware:
+    # Compresses responses of at least minimum_size bytes with brotli when the
+    # brotli package is installed and the client accepts it, otherwise gzip. The
+    # body is buffered up to minimum_size and compressed incrementally after that.
+    # Streaming content types (NDJSON, SSE) pass through untouched.
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict((key.decode("latin-1"), value.decode("latin-1")) for key, value in scope.get("headers", []))
+        encoding = _accepted_encoding(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+        buffered = b""
+        compress = finish = None
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough, buffered, compress, finish
+            if message["type"] == "http.response.start":
+                response_headers = {key.lower(): value for key, value in message["headers"]}
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in response_headers or content_type.startswith(UNCOMPRESSED_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Held back until the body shows whether it is worth compressing
+                    start_message = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compress is not None:
+                data = compress(body)
+                if not more_body:
+                    data += finish()
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+
+            buffered += body
+            if more_body and len(buffered) < self.minimum_size:
+                return
+            if len(buffered) < self.minimum_size:
+                await send(start_message)
+                await send({"type": "http.response.body", "body": buffered, "more_body": False})
+                return
+
+            compress, finish = _compressor(encoding)
+            data = compress(buffered)
+            buffered = b""
+            if not more_body:
+                data += finish()
+            new_headers = [
+                (key, value) for key, value in start_message["headers"]
+                if key.lower() not in (b"content-length", b"etag")
+            ]
+            # A compressed body is a different representation; keep the ETag weak
+            etag = next((value for key, value in start_message["headers"] if key.lower() == b"etag"), None)
+            if etag is not None:
+                new_headers.append((b"etag", etag if etag.startswith(b"W/") else b"W/" + etag))
+            new_headers += [(b"content-encoding", encoding.encode("latin-1")), (b"vary", b"Accept-Encoding")]
+            if not more_body:
+                new_headers.append((b"content-length", str(len(data)).encode("latin-1")))
+            await send({**start_message, "headers": new_headers})
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,395 @@
+import os
+import gzip
+import json
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+import numpy as np
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+import models
+import coordination
+import change_versions
+
+logger = logging.getLogger(__name__)
+
+# In-process per-account behavioural features: transaction counts and amount sums
+# over the last 1h / 24h / 7d, distinct devices and IPs over 7d, and account age.
+# Every stored transaction with a user_account updates its account in O(1), so
+# analysis rows can be enriched without querying history.
+#
+# State is a set of numpy arrays with one row per account and a ring of time buckets
+# per window: 60 one-minute buckets for 1h, 168 one-hour buckets for 24h and 7d.
+# Windows are therefore exact to the minute (1h) or hour (24h, 7d). Buckets that
+# have scrolled out are cleared lazily when the account is next written.
+#
+# With several API workers (coordination enabled) each worker keeps its own store
+# and none is fed directly by the write paths: before a store is read, sync() replays
+# the transactions committed since its last sync (by any worker) from the database,
+# keyed on the transactions table version. No snapshot is written in that mode, as
+# the next start replays the last 7 days from the database anyway.
+
+MINUTE_SLOTS = 60
+HOUR_SLOTS = 168
+# Distinct devices / IPs remembered per account (most recently seen win)
+MAX_TRACKED_VALUES = 32
+SEVEN_DAYS = 7 * 24 * 3600
+
+# Snapshot written on shutdown and read on startup; empty disables it and the store
+# is rebuilt from the last 7 days of transactions instead
+FEATURE_STORE_PATH = os.getenv("FEATURE_STORE_PATH", "feature_store.json.gz")
+SNAPSHOT_VERSION = 1
+# Row field enrich() puts the account's features under. Not part of the LLM prompt
+# or the result cache key (see analysis_service, result_cache).
+FEATURES_FIELD = "account_features"
+
+def to_epoch(value: Any) -> Optional[float]:
+    # datetime (naive = UTC, as stored) or ISO string -> seconds since epoch
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return None
+
+class FeatureStore:
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.Lock()
+        self.index: Dict[str, int] = {}
+        self.accounts: List[str] = []
+        self.devices: List[Dict[str, float]] = []
+        self.ips: List[Dict[str, float]] = []
+        self.updated_at = 0.0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        self.minute_counts = np.zeros((capacity, MINUTE_SLOTS), dtype=np.int32)
+        self.minute_sums = np.zeros((capacity, MINUTE_SLOTS), dtype=np.float64)
+        self.hour_counts = np.zeros((capacity, HOUR_SLOTS), dtype=np.int32)
+        self.hour_sums = np.zeros((capacity, HOUR_SLOTS), dtype=np.float64)
+        # Newest bucket number written per account (epoch minutes / hours)
+        self.minute_head = np.zeros(capacity, dtype=np.int64)
+        self.hour_head = np.zeros(capacity, dtype=np.int64)
+        self.first_seen = np.zeros(capacity, dtype=np.float64)
+        self.last_seen = np.zeros(capacity, dtype=np.float64)
+
+    def _grow(self):
+        size = len(self.accounts)
+        old = {name: getattr(self, name) for name in _ARRAYS}
+        self._allocate(max(1024, len(self.minute_head) * 2))
+        for name, array in old.items():
+            getattr(self, name)[:size] = array[:size]
+
+    def _row(self, account: str, epoch: float) -> int:
+        row = self.index.get(account)
+        if row is None:
+            row = len(self.accounts)
+            if row >= len(self.minute_head):
+                self._grow()
+            self.index[account] = row
+            self.accounts.append(account)
+            self.devices.append({})
+            self.ips.append({})
+            self.first_seen[row] = epoch
+            self.minute_head[row] = int(epoch // 60)
+            self.hour_head[row] = int(epoch // 3600)
+        return row
+
+    def record(
+        self,
+        account: str,
+        amount: float,
+        epoch: float,
+        device_id: Optional[str] = None,
+        ip_address: Optional[str] = None
+    ):
+        with self._lock:
+            self._record(account, amount, epoch, device_id, ip_address)
+
+    def record_rows(self, rows: Iterable[Dict[str, Any]]):
+        # Rows as stored: user_account, amount, timestamp, device_id, ip_address.
+        # Rows without an account are skipped.
+        with self._lock:
+            for row in rows:
+                account = row.get('user_account')
+                if not account:
+                    continue
+                epoch = to_epoch(row.get('timestamp'))
+                self._record(
+                    str(account), _as_amount(row.get('amount')),
+                    epoch if epoch is not None else datetime.now(timezone.utc).timestamp(),
+                    row.get('device_id'), row.get('ip_address')
+                )
+
+    def _record(self, account: str, amount: float, epoch: float, device_id: Optional[str], ip_address: Optional[str]):
+        row = self._row(account, epoch)
+        self.first_seen[row] = min(self.first_seen[row], epoch)
+        self.last_seen[row] = max(self.last_seen[row], epoch)
+        _add_to_ring(self.minute_counts, self.minute_sums, self.minute_head, row, int(epoch // 60), MINUTE_SLOTS, amount)
+        _add_to_ring(self.hour_counts, self.hour_sums, self.hour_head, row, int(epoch // 3600), HOUR_SLOTS, amount)
+        if device_id:
+            _remember(self.devices[row], str(device_id), epoch)
+        if ip_address:
+            _remember(self.ips[row], str(ip_address), epoch)
+        self.updated_at = max(self.updated_at, epoch)
+
+    def features(
+        self,
+        account: str,
+        now: Optional[float] = None,
+        device_id: Optional[str] = None,
+        ip_address: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        # None for an account never seen
+        now = now if now is not None else datetime.now(timezone.utc).timestamp()
+        with self._lock:
+            row = self.index.get(account)
+            if row is None:
+                return None
+            minute_now, hour_now = int(now // 60), int(now // 3600)
+            count_1h, sum_1h = _window(self.minute_counts, self.minute_sums, self.minute_head[row], row, minute_now, 60, MINUTE_SLOTS)
+            count_24h, sum_24h = _window(self.hour_counts, self.hour_sums, self.hour_head[row], row, hour_now, 24, HOUR_SLOTS)
+            count_7d, sum_7d = _window(self.hour_counts, self.hour_sums, self.hour_head[row], row, hour_now, HOUR_SLOTS, HOUR_SLOTS)
+            week_ago = now - SEVEN_DAYS
+            features = {
+                'txn_count_1h': count_1h,
+                'txn_count_24h': count_24h,
+                'txn_count_7d': count_7d,
+                'amount_sum_1h': round(sum_1h, 2),
+                'amount_sum_24h': round(sum_24h, 2),
+                'amount_sum_7d': round(sum_7d, 2),
+                'distinct_devices_7d': sum(1 for seen in self.devices[row].values() if seen >= week_ago),
+                'distinct_ips_7d': sum(1 for seen in self.ips[row].values() if seen >= week_ago),
+                'account_age_days': max(0, int((now - self.first_seen[row]) // 86400))
+            }
+            if device_id:
+                features['known_device'] = str(device_id) in self.devices[row]
+            if ip_address:
+                features['known_ip'] = str(ip_address) in self.ips[row]
+            return features
+
+    def enrich(self, transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Returns the rows with their account's features under FEATURES_FIELD (new
+        # dicts; rows without a known user_account are returned unchanged). The
+        # prompt columns the features stand in for (velocity_count, account_age_days,
+        # device_match) are filled in when the caller did not supply them.
+        enriched = []
+        for txn in transactions:
+            account = txn.get('user_account')
+            features = self.features(str(account), to_epoch(txn.get('timestamp')), txn.get('device_id'), txn.get('ip_address')) if account else None
+            if features is None:
+                enriched.append(txn)
+                continue
+            derived = {'velocity_count': features['txn_count_24h'], 'account_age_days': features['account_age_days']}
+            if 'known_device' in features:
+                derived['device_match'] = "Yes" if features['known_device'] else "No"
+            enriched.append({**derived, **txn, FEATURES_FIELD: features})
+        return enriched
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def snapshot(self, path: str):
+        with self._lock:
+            size = len(self.accounts)
+            state = {
+                'version': SNAPSHOT_VERSION,
+                'updated_at': self.updated_at,
+                'accounts': self.accounts,
+                'devices': self.devices,
+                'ips': self.ips,
+                **{name: getattr(self, name)[:size].tolist() for name in _ARRAYS}
+            }
+        # Written next to the target and renamed, so a crash never leaves half a file
+        temp_path = f"{path}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            json.dump(state, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def restore(cls, path: str) -> "FeatureStore":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported feature store snapshot version {state.get('version')}")
+        store = cls(capacity=max(1024, len(state['accounts'])))
+        size = len(state['accounts'])
+        for name in _ARRAYS:
+            array = getattr(store, name)
+            array[:size] = np.asarray(state[name], dtype=array.dtype).reshape((size,) + array.shape[1:])
+        store.accounts = state['accounts']
+        store.index = {account: row for row, account in enumerate(store.accounts)}
+        store.devices = state['devices']
+        store.ips = state['ips']
+        store.updated_at = state['updated_at']
+        return store
+
+_ARRAYS = [
+    'minute_counts', 'minute_sums', 'hour_counts', 'hour_sums',
+    'minute_head', 'hour_head', 'first_seen', 'last_seen'
+]
+
+def _add_to_ring(counts: np.ndarray, sums: np.ndarray, heads: np.ndarray, row: int, bucket: int, slots: int, amount: float):
+    head = int(heads[row])
+    if bucket > head:
+        # Clear the buckets between the old head and the new one (at most `slots`)
+        if bucket - head >= slots:
+            counts[row] = 0
+            sums[row] = 0
+        else:
+            stale = np.arange(head + 1, bucket + 1) % slots
+            counts[row, stale] = 0
+            sums[row, stale] = 0
+        heads[row] = head = bucket
+    if head - bucket < slots:
+        # Late rows still count if their bucket is inside the ring
+        counts[row, bucket % slots] += 1
+        sums[row, bucket % slots] += amount
+
+def _window(counts: np.ndarray, sums: np.ndarray, head: int, row: int, now_bucket: int, width: int, slots: int):
+    # Count and sum of the `width` buckets ending at now_bucket
+    head = int(head)
+    oldest = max(now_bucket - width + 1, head - slots + 1)
+    newest = min(head, now_bucket)
+    if newest < oldest:
+        return 0, 0.0
+    buckets = np.arange(oldest, newest + 1) % slots
+    return int(counts[row, buckets].sum()), float(sums[row, buckets].sum())
+
+def _remember(values: Dict[str, float], value: str, epoch: float):
+    values[value] = max(values.get(value, epoch), epoch)
+    if len(values) > MAX_TRACKED_VALUES:
+        del values[min(values, key=values.get)]
+
+def _as_amount(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def rebuild_from_db(db: Session, store: FeatureStore, since: datetime, batch_rows: int = 10000) -> int:
+    # Replays stored transactions newer than `since` (naive UTC) into the store
+    query = (
+        select(
+            models.Transaction.user_account, models.Transaction.amount, models.Transaction.timestamp,
+            models.Transaction.device_id, models.Transaction.ip_address
+        )
+        .where(models.Transaction.user_account.isnot(None), models.Transaction.timestamp > since)
+        .order_by(models.Transaction.timestamp)
+        .execution_options(yield_per=batch_rows)
+    )
+    replayed = 0
+    for partition in db.execute(query).partitions():
+        store.record_rows(row._asdict() for row in partition)
+        replayed += len(partition)
+    return replayed
+
+_feature_store: Optional[FeatureStore] = None
+_feature_store_lock = threading.Lock()
+# Shared mode: highest transaction id replayed and the table version it was read at
+_synced_id = 0
+_synced_version: Optional[int] = None
+
+def get_feature_store() -> FeatureStore:
+    global _feature_store
+    if _feature_store is None:
+        with _feature_store_lock:
+            if _feature_store is None:
+                _feature_store = FeatureStore()
+    return _feature_store
+
+def record_stored(rows: Iterable[Dict[str, Any]]):
+    # Called by the write paths after their commit. In shared mode the rows reach
+    # the store through sync() instead, in every worker.
+    if not coordination.enabled():
+        get_feature_store().record_rows(rows)
+
+def sync():
+    # Shared mode: replays transactions committed since the last call. A no-op (one
+    # version read) while the transactions table is unchanged.
+    global _synced_id, _synced_version
+    if not coordination.enabled():
+        return
+    version = change_versions.version("transactions")
+    if version == _synced_version:
+        return
+    from database import SessionLocal
+    with _feature_store_lock:
+        if version == _synced_version:
+            return
+        db = SessionLocal()
+        try:
+            _synced_id, _ = _replay_after_id(db, get_feature_store(), _synced_id)
+        finally:
+            db.close()
+        _synced_version = version
+
+def _replay_after_id(db: Session, store: FeatureStore, after_id: int, batch_rows: int = 10000) -> Tuple[int, int]:
+    # Replays transactions with id > after_id; returns (highest id seen, rows replayed)
+    query = (
+        select(
+            models.Transaction.id, models.Transaction.user_account, models.Transaction.amount,
+            models.Transaction.timestamp, models.Transaction.device_id, models.Transaction.ip_address
+        )
+        .where(models.Transaction.id > after_id)
+        .order_by(models.Transaction.id)
+        .execution_options(yield_per=batch_rows)
+    )
+    replayed = 0
+    for partition in db.execute(query).partitions():
+        store.record_rows(row._asdict() for row in partition)
+        after_id = partition[-1].id
+        replayed += len(partition)
+    return after_id, replayed
+
+def load(db: Session, path: Optional[str] = FEATURE_STORE_PATH) -> FeatureStore:
+    # Startup: restore the snapshot if there is one, then replay the transactions
+    # stored after it was taken (all writes stamp rows with the server clock, so
+    # "newer than the snapshot" is exactly what it is missing). Without a snapshot
+    # the last 7 days are replayed.
+    global _feature_store
+    if coordination.enabled():
+        return _load_shared(db)
+    store = None
+    if path and os.path.exists(path):
+        try:
+            store = FeatureStore.restore(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable feature store snapshot %s: %s", path, e)
+    since = datetime.utcnow() - timedelta(seconds=SEVEN_DAYS)
+    if store is None:
+        store = FeatureStore()
+    elif store.updated_at:
+        since = max(since, datetime.fromtimestamp(store.updated_at, timezone.utc).replace(tzinfo=None))
+    replayed = rebuild_from_db(db, store, since)
+    logger.info("Feature store ready: %d accounts, %d transactions replayed", len(store), replayed)
+    with _feature_store_lock:
+        _feature_store = store
+    return store
+
+def _load_shared(db: Session) -> FeatureStore:
+    # Shared mode: the last 7 days by id, which also sets sync()'s watermark
+    global _feature_store, _synced_id, _synced_version
+    version = change_versions.version("transactions")
+    since = datetime.utcnow() - timedelta(seconds=SEVEN_DAYS)
+    first_id = db.execute(
+        select(func.min(models.Transaction.id)).where(models.Transaction.timestamp > since)
+    ).scalar()
+    if first_id is None:
+        first_id = (db.execute(select(func.max(models.Transaction.id))).scalar() or 0) + 1
+    store = FeatureStore()
+    last_id, replayed = _replay_after_id(db, store, first_id - 1)
+    logger.info("Feature store ready: %d accounts, %d transactions replayed", len(store), replayed)
+    with _feature_store_lock:
+        _feature_store = store
+        _synced_id, _synced_version = last_id, version
+    return store
+
+def save(path: Optional[str] = FEATURE_STORE_PATH):
+    if path and _feature_store is not None and not coordination.enabled():
+        _feature_store.snapshot(path)
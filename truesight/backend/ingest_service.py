@@ -0,0 +1,133 @@
+import os
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import pandas as pd
+
+# Chunked reading and validation of uploaded transaction files (CSV or Parquet).
+# Files are read UPLOAD_CHUNK_ROWS rows at a time so memory stays flat regardless
+# of file size.
+UPLOAD_CHUNK_ROWS = int(os.getenv("ANALYSIS_UPLOAD_CHUNK_ROWS", "5000"))
+# Validation errors reported back per upload; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+# Columns produced by analysis_service.generate_sample_transactions and their kinds
+TRANSACTION_COLUMNS = {
+    'transaction_id': 'string',
+    'amount': 'number',
+    'TMLScore': 'integer',
+    'new_beneficiary': 'yes_no',
+    'account_age_days': 'integer',
+    'high_risk_country': 'yes_no',
+    'velocity_count': 'integer',
+    'device_match': 'yes_no',
+    'auth_strength': 'auth_strength',
+    'time_of_day': 'string',
+    'merchant_category': 'string'
+}
+REQUIRED_COLUMNS = ['transaction_id', 'amount', 'TMLScore']
+AUTH_STRENGTHS = {'weak': "Weak", 'medium': "Medium", 'strong': "Strong"}
+
+def detect_file_format(filename: str) -> str:
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension in (".parquet", ".pq"):
+        return "parquet"
+    if extension in (".csv", ".txt", ""):
+        return "csv"
+    raise ValueError(f"Unsupported file type '{extension}'. Upload a .csv or .parquet file")
+
+def iter_file_chunks(path: str, file_format: str, chunk_rows: int = UPLOAD_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    if file_format == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Parquet uploads require the pyarrow package")
+        parquet_file = pq.ParquetFile(path)
+        for record_batch in parquet_file.iter_batches(batch_size=chunk_rows):
+            yield record_batch.to_pandas()
+    else:
+        # Read every column as text; typing happens in validate_chunk so bad cells
+        # become per-row errors instead of failing the whole file
+        with pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False, na_values=[""]) as reader:
+            yield from reader
+
+def count_rows(path: str, file_format: str) -> Optional[int]:
+    # Row total for progress reporting. Exact for Parquet (footer metadata),
+    # a newline count for CSV.
+    if file_format == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            return None
+        return pq.ParquetFile(path).metadata.num_rows
+    newlines = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            newlines += block.count(b"\n")
+    return max(newlines - 1, 0)  # minus the header
+
+def check_columns(columns: List[str]):
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+
+def validate_chunk(df: pd.DataFrame, first_row_number: int = 1) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    # Returns (valid transactions, errors). Row numbers in errors are 1-based data rows.
+    check_columns(list(df.columns))
+    known = [column for column in TRANSACTION_COLUMNS if column in df.columns]
+    typed = pd.DataFrame(index=df.index)
+    invalid = pd.Series(False, index=df.index)
+    reasons = pd.Series("", index=df.index, dtype=object)
+
+    def reject(mask: pd.Series, reason: str):
+        nonlocal invalid
+        new = mask & ~invalid
+        reasons[new] = reason
+        invalid = invalid | mask
+
+    for column in known:
+        kind = TRANSACTION_COLUMNS[column]
+        raw = df[column]
+        present = raw.notna() & (raw.astype(str).str.strip() != "")
+
+        if kind in ('number', 'integer'):
+            values = pd.to_numeric(raw, errors='coerce')
+            reject(present & values.isna(), f"{column} is not a number")
+            if kind == 'integer':
+                reject(values.notna() & (values % 1 != 0), f"{column} is not an integer")
+            typed[column] = values
+        elif kind == 'yes_no':
+            values = raw.astype(str).str.strip().str.lower().map({'yes': "Yes", 'no': "No", 'true': "Yes", 'false': "No", '1': "Yes", '0': "No"})
+            reject(present & values.isna(), f"{column} must be Yes or No")
+            typed[column] = values
+        elif kind == 'auth_strength':
+            values = raw.astype(str).str.strip().str.lower().map(AUTH_STRENGTHS)
+            reject(present & values.isna(), f"{column} must be Weak, Medium or Strong")
+            typed[column] = values
+        else:
+            typed[column] = raw.where(present).astype(object)
+
+        if column in REQUIRED_COLUMNS:
+            reject(~present, f"{column} is required")
+
+    # Keep any extra columns as-is; the LLM prompt may still use them
+    for column in df.columns:
+        if column not in TRANSACTION_COLUMNS:
+            typed[column] = df[column]
+
+    valid_rows = typed[~invalid]
+    transactions = []
+    for record in valid_rows.to_dict(orient='records'):
+        txn = {}
+        for key, value in record.items():
+            if value is None or (isinstance(value, float) and pd.isna(value)):
+                continue
+            if TRANSACTION_COLUMNS.get(key) == 'integer' or (key == 'amount' and float(value).is_integer()):
+                value = int(value)
+            txn[key] = value
+        txn['transaction_id'] = str(txn['transaction_id']).strip()
+        transactions.append(txn)
+
+    errors = [
+        {"row": first_row_number + position, "error": reasons.iat[position]}
+        for position in range(len(df)) if invalid.iat[position]
+    ]
+    return transactions, errors
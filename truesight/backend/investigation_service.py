@@ -0,0 +1,144 @@
+import base64
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime
+from sqlalchemy import select, and_, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+import models
+import stats_service
+
+# Investigation feed: newest transactions first, paginated with a keyset cursor on
+# (timestamp, id) so every page is an index range scan no matter how deep it is.
+DEFAULT_FEED_LIMIT = 50
+MAX_FEED_LIMIT = 500
+
+RISK_LEVELS = ("LOW", "MEDIUM", "HIGH")
+
+# Columns the feed items are built from
+FEED_COLUMNS = [
+    models.Transaction.id, models.Transaction.transaction_id, models.Transaction.amount,
+    models.Transaction.risk_level, models.Transaction.risk_score, models.Transaction.transaction_type,
+    models.Transaction.explanation, models.Transaction.is_flagged, models.Transaction.timestamp
+]
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    # Raises ValueError for malformed cursors
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def parse_risk_levels(risk: Optional[str]) -> List[str]:
+    # Accepts "HIGH" or a comma-separated list such as "high,medium"
+    if not risk:
+        return []
+    levels = [level.strip().upper() for level in risk.split(",") if level.strip()]
+    unknown = [level for level in levels if level not in RISK_LEVELS]
+    if unknown:
+        raise ValueError(f"Unknown risk level(s): {', '.join(unknown)}")
+    return levels
+
+def build_feed_query(
+    risk_levels: Optional[List[str]] = None,
+    flagged: Optional[bool] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[Tuple[datetime, int]] = None,
+    limit: int = DEFAULT_FEED_LIMIT
+):
+    txn = models.Transaction
+    conditions = []
+    if risk_levels:
+        # Matches the level serialize_feed_item shows (stored verdict first)
+        conditions.append(stats_service.risk_level_filter(risk_levels))
+    if flagged is not None:
+        conditions.append(txn.is_flagged == flagged)
+    if min_amount is not None:
+        conditions.append(txn.amount >= min_amount)
+    if max_amount is not None:
+        conditions.append(txn.amount <= max_amount)
+    if start is not None:
+        conditions.append(txn.timestamp >= start)
+    if end is not None:
+        # Half-open [start, end), like storage_lifecycle.read_cold for archived rows
+        conditions.append(txn.timestamp < end)
+    if cursor is not None:
+        # Rows strictly after the cursor in (timestamp DESC, id DESC) order
+        cursor_timestamp, cursor_id = cursor
+        conditions.append(or_(
+            txn.timestamp < cursor_timestamp,
+            and_(txn.timestamp == cursor_timestamp, txn.id < cursor_id)
+        ))
+
+    # One extra row tells us whether there is a next page. Plain column rows, not
+    # ORM objects: the feed is read-only and this is its hot path.
+    return (
+        select(*FEED_COLUMNS)
+        .where(*conditions)
+        .order_by(txn.timestamp.desc(), txn.id.desc())
+        .limit(limit + 1)
+    )
+
+def build_alerts_query(transaction_pks: List[int]):
+    # Alerts of one page in a single IN query, oldest first per transaction
+    alert = models.Alert
+    return (
+        select(alert.transaction_id, alert.id, alert.status)
+        .where(alert.transaction_id.in_(transaction_pks))
+        .order_by(alert.id)
+    )
+
+def serialize_feed_item(t: Any, alerts: List[Any]) -> Dict[str, Any]:
+    # t is a FEED_COLUMNS row (or a Transaction); alerts are its (id, status) rows.
+    # Rows saved before verdicts were stored fall back to the score-derived level.
+    status = "New" if t.is_flagged else "Closed"
+    if alerts:
+        status = alerts[-1].status.capitalize()
+    return {
+        "id": t.transaction_id,
+        "amount": t.amount,
+        "risk": stats_service.effective_risk_level(t.risk_level, t.risk_score),
+        "score": int(t.risk_score or 0),
+        "type": t.transaction_type,
+        "explanation": t.explanation or "Analyzed by TrueSight AI",
+        "status": status,
+        "alert_ids": [alert.id for alert in alerts],
+        "timestamp": t.timestamp
+    }
+
+def _page_rows(rows: List[Any], limit: int) -> Tuple[List[Any], Optional[str]]:
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return rows, None
+
+def _feed_page(rows: List[Any], alert_rows: List[Any], next_cursor: Optional[str]) -> Dict[str, Any]:
+    alerts_by_pk: Dict[int, List[Any]] = {}
+    for alert in alert_rows:
+        alerts_by_pk.setdefault(alert.transaction_id, []).append(alert)
+    return {
+        "items": [serialize_feed_item(t, alerts_by_pk.get(t.id, [])) for t in rows],
+        "next_cursor": next_cursor
+    }
+
+def get_feed(db: Session, limit: int = DEFAULT_FEED_LIMIT, cursor: Optional[str] = None, **filters) -> Dict[str, Any]:
+    limit = max(1, min(limit, MAX_FEED_LIMIT))
+    query = build_feed_query(cursor=decode_cursor(cursor) if cursor else None, limit=limit, **filters)
+    rows, next_cursor = _page_rows(db.execute(query).all(), limit)
+    alert_rows = db.execute(build_alerts_query([t.id for t in rows])).all() if rows else []
+    return _feed_page(rows, alert_rows, next_cursor)
+
+async def get_feed_async(db: AsyncSession, limit: int = DEFAULT_FEED_LIMIT, cursor: Optional[str] = None, **filters) -> Dict[str, Any]:
+    limit = max(1, min(limit, MAX_FEED_LIMIT))
+    query = build_feed_query(cursor=decode_cursor(cursor) if cursor else None, limit=limit, **filters)
+    rows, next_cursor = _page_rows((await db.execute(query)).all(), limit)
+    alert_rows = (await db.execute(build_alerts_query([t.id for t in rows]))).all() if rows else []
+    return _feed_page(rows, alert_rows, next_cursor)
@@ -0,0 +1,416 @@
+import os
+import time
+import uuid
+import shutil
+import tempfile
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from database import SessionLocal
+import analysis_service
+import ingest_service
+import stats_service
+import coordination
+
+logger = logging.getLogger(__name__)
+
+# Background analysis jobs. Submitting returns immediately with a job ID; a small
+# worker pool runs the LLM analysis plus the DB save and records per-batch progress.
+#
+# With several API workers (coordination enabled) jobs go through the shared queue
+# in the coordination store instead: any worker with a free slot claims the next
+# one, at most JOB_WORKERS run on the host at a time, and the running worker
+# publishes progress, results and dead-letter rows there so every worker can
+# answer status and result requests.
+JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+# How often an idle worker checks the shared queue
+JOB_POLL_SECONDS = float(os.getenv("ANALYSIS_JOB_POLL_SECONDS", "0.5"))
+# Dead-letter rows kept per upload job; further failures are only counted
+UPLOAD_DEAD_LETTER_LIMIT = 10000
+# Finished jobs (and their results) are dropped after this long
+JOB_RETENTION = timedelta(minutes=int(os.getenv("ANALYSIS_JOB_RETENTION_MINUTES", "60")))
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="analysis-job")
+_jobs: Dict[str, "AnalysisJob"] = {}
+_jobs_lock = threading.Lock()
+# Shared-queue dispatcher state
+_dispatcher: Optional[threading.Thread] = None
+_dispatcher_wake = threading.Event()
+_dispatcher_stop = threading.Event()
+_claimed_slots = threading.Semaphore(JOB_WORKERS)
+
+class AnalysisJob:
+    def __init__(
+        self,
+        transactions: List[Dict[str, Any]],
+        config: Dict[str, Any],
+        kind: str = "transactions",
+        total_transactions: Optional[int] = None
+    ):
+        self.id = uuid.uuid4().hex
+        self.kind = kind  # transactions (JSON body) or upload (CSV/Parquet file)
+        self.transactions = transactions
+        self.config = config
+        self.status = "queued"  # queued, running, saving, completed, failed
+        self.total_transactions = len(transactions) if total_transactions is None else total_transactions
+        # LLM batches only; rows settled by pre-screen, cache or similarity index
+        # need none. Progress is counted in rows (settled_count).
+        self.total_batches = 0
+        self.completed_batches = 0
+        # Upload jobs: batches of the chunks before the current one
+        self._batch_offset = 0
+        # Rows with a verdict so far, plus for uploads the rows rejected by validation
+        self.settled_count = 0
+        self.processed_count = 0
+        self.saved_count = 0
+        # Upload jobs: rows read from the file and rows rejected by validation
+        self.rows_read = 0
+        self.invalid_count = 0
+        self.validation_errors: List[Dict[str, Any]] = []
+        # Rows the LLM could not analyze (see analysis_service dead_letter)
+        self.dead_letter: List[Dict[str, Any]] = []
+        self.upload_failed_count = 0
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        # Results are appended as batches finish, so they are in completion order
+        self.results: List[Dict[str, Any]] = []
+        # Claimed from the shared queue: progress is published to the coordination store
+        self.shared = False
+        self._lock = threading.Lock()
+
+    def record_settled(self, results: List[Dict[str, Any]]):
+        # Rows settled before the LLM (pre-screen, cache, similarity index)
+        self._record_results(results)
+
+    def record_batch(self, batch_number: int, total_batches: int, batch_results: List[Dict[str, Any]]):
+        with self._lock:
+            self.total_batches = self._batch_offset + total_batches
+            self.completed_batches += 1
+        self._record_results(batch_results)
+
+    def _record_results(self, results: List[Dict[str, Any]]):
+        # Upload jobs keep only counts; their processed_count is added per chunk
+        with self._lock:
+            self.settled_count += len(results)
+            if self.kind != "upload":
+                self.processed_count += len(results)
+                self.results.extend(results)
+        _publish(self, results=results if self.kind != "upload" else None)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def progress(self) -> float:
+        # Share of the job's rows that are settled: given a verdict by any stage,
+        # dead-lettered, or (uploads) rejected by validation
+        if self.status == "completed":
+            return 1.0
+        if not self.total_transactions:
+            return 0.0
+        settled = self.settled_count + (len(self.dead_letter) if self.kind != "upload" else 0)
+        return round(min(settled / self.total_transactions, 1.0), 4)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            job = {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "progress": self.progress(),
+                "total_transactions": self.total_transactions,
+                "total_batches": self.total_batches,
+                "completed_batches": self.completed_batches,
+                "settled_count": self.settled_count,
+                "processed_count": self.processed_count,
+                "saved_count": self.saved_count,
+                "failed_count": self.upload_failed_count if self.kind == "upload" else len(self.dead_letter),
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at
+            }
+            if self.kind == "upload":
+                job["rows_read"] = self.rows_read
+                job["invalid_count"] = self.invalid_count
+                job["validation_errors"] = self.validation_errors
+            return job
+
+    def results_page(self, offset: int = 0, limit: int = 500) -> Dict[str, Any]:
+        with self._lock:
+            page = self.results[offset:offset + limit]
+            available = len(self.results)
+        next_offset = offset + len(page)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "offset": offset,
+            "results": page,
+            "next_offset": next_offset,
+            # More results may still arrive while the job is running
+            "has_more": next_offset < available or not self.is_finished
+        }
+
+def submit_analysis_job(transactions: List[Dict[str, Any]], config: Dict[str, Any]) -> AnalysisJob:
+    _prune_finished_jobs()
+    job = AnalysisJob(transactions, config)
+    if coordination.enabled():
+        _enqueue_shared(job, {'transactions': transactions, 'config': config})
+        return job
+    with _jobs_lock:
+        _jobs[job.id] = job
+    _executor.submit(_run_job, job)
+    return job
+
+def submit_upload_job(upload_file, filename: str, config: Dict[str, Any]) -> AnalysisJob:
+    # Spools the upload to a temp file, checks its header, and queues a job that
+    # reads it back in chunks. Raises ValueError for unusable files.
+    file_format = ingest_service.detect_file_format(filename)
+    fd, path = tempfile.mkstemp(prefix="truesight-upload-", suffix=f".{file_format}")
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            shutil.copyfileobj(upload_file, spool, 1024 * 1024)
+        first_chunk = next(ingest_service.iter_file_chunks(path, file_format, chunk_rows=1), None)
+        if first_chunk is None:
+            raise ValueError("Uploaded file has no rows")
+        ingest_service.check_columns(list(first_chunk.columns))
+        total_rows = ingest_service.count_rows(path, file_format)
+    except Exception:
+        os.remove(path)
+        raise
+
+    _prune_finished_jobs()
+    job = AnalysisJob([], config, kind="upload", total_transactions=total_rows)
+    if coordination.enabled():
+        # Workers share the host, so whichever claims the job can read the spooled file
+        _enqueue_shared(job, {'path': path, 'file_format': file_format, 'config': config})
+        return job
+    with _jobs_lock:
+        _jobs[job.id] = job
+    _executor.submit(_run_upload_job, job, path, file_format)
+    return job
+
+def get_job(job_id: str):
+    # An AnalysisJob, or a SharedJob for a job queued or run by another worker
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None and coordination.enabled():
+        state = coordination.get_store().get_job(job_id)
+        return SharedJob(state) if state else None
+    return job
+
+def list_jobs() -> List[Any]:
+    if coordination.enabled():
+        return [get_job(state['job_id']) or SharedJob(state) for state in coordination.get_store().list_jobs()]
+    with _jobs_lock:
+        return sorted(_jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+class SharedJob:
+    # Read-only view of a job in the coordination store, with the same interface
+    # as AnalysisJob for the API endpoints
+    def __init__(self, state: Dict[str, Any]):
+        self.state = state
+        self.id = state['job_id']
+        self.status = state['status']
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    @property
+    def dead_letter(self) -> List[Dict[str, Any]]:
+        return coordination.get_store().job_items(self.id, "dead_letter")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: value for key, value in self.state.items() if key != 'owner'}
+
+    def results_page(self, offset: int = 0, limit: int = 500) -> Dict[str, Any]:
+        store = coordination.get_store()
+        page = store.job_items(self.id, "result", offset, limit)
+        next_offset = offset + len(page)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "offset": offset,
+            "results": page,
+            "next_offset": next_offset,
+            "has_more": next_offset < store.count_job_items(self.id, "result") or not self.is_finished
+        }
+
+def _enqueue_shared(job: AnalysisJob, payload: Dict[str, Any]):
+    coordination.get_store().insert_job(job.id, job.kind, payload, job.to_dict())
+    _dispatcher_wake.set()
+
+def _publish(
+    job: AnalysisJob,
+    results: Optional[List[Dict[str, Any]]] = None,
+    dead_letter: Optional[List[Dict[str, Any]]] = None,
+    replace_results: bool = False
+):
+    # Pushes a shared job's current state to the coordination store. A failed write
+    # only delays what other workers see; the job itself carries on.
+    if not job.shared:
+        return
+    try:
+        coordination.get_store().update_job(job.id, job.to_dict(), results, dead_letter, replace_results)
+    except Exception:
+        logger.exception("Could not publish job %s", job.id)
+
+def start_dispatcher():
+    # Called on application startup; only does anything with coordination enabled
+    global _dispatcher
+    if not coordination.enabled() or _dispatcher is not None:
+        return
+    _dispatcher_stop.clear()
+    _dispatcher = threading.Thread(target=_dispatch_shared_jobs, name="analysis-job-dispatcher", daemon=True)
+    _dispatcher.start()
+
+def stop_dispatcher():
+    # Stops claiming new jobs; jobs already running in this worker finish first
+    global _dispatcher
+    if _dispatcher is None:
+        return
+    _dispatcher_stop.set()
+    _dispatcher_wake.set()
+    _dispatcher.join()
+    _dispatcher = None
+
+def _dispatch_shared_jobs():
+    store = coordination.get_store()
+    while not _dispatcher_stop.is_set():
+        claimed = None
+        try:
+            store.fail_orphaned_jobs()
+            if _claimed_slots.acquire(blocking=False):
+                try:
+                    claimed = store.claim_job(os.getpid(), JOB_WORKERS)
+                finally:
+                    if claimed is None:
+                        _claimed_slots.release()
+        except Exception:
+            logger.exception("Job dispatcher error")
+        if claimed is None:
+            _dispatcher_wake.wait(JOB_POLL_SECONDS)
+            _dispatcher_wake.clear()
+            continue
+        _start_claimed_job(*claimed)
+
+def _start_claimed_job(job_id: str, kind: str, payload: Dict[str, Any], state: Dict[str, Any]):
+    job = AnalysisJob(payload.get('transactions', []), payload['config'], kind=kind, total_transactions=state['total_transactions'])
+    job.id = job_id
+    job.created_at = datetime.fromisoformat(state['created_at'])
+    job.shared = True
+    with _jobs_lock:
+        _jobs[job.id] = job
+
+    def run():
+        try:
+            if kind == "upload":
+                _run_upload_job(job, payload['path'], payload['file_format'])
+            else:
+                _run_job(job)
+        finally:
+            with _jobs_lock:
+                _jobs.pop(job.id, None)
+            _claimed_slots.release()
+            _dispatcher_wake.set()
+
+    _executor.submit(run)
+
+def _run_job(job: AnalysisJob):
+    job.status = "running"
+    job.started_at = datetime.utcnow()
+    _publish(job)
+    started = time.perf_counter()
+    try:
+        results = analysis_service.run_analysis_pipeline(
+            job.transactions, job.config, on_batch=job.record_batch, dead_letter=job.dead_letter,
+            on_settled=job.record_settled
+        )
+
+        job.status = "saving"
+        _publish(job)
+        db = SessionLocal()
+        try:
+            job.saved_count = analysis_service.save_results_to_db(results, db)
+            stats_service.record_processing(db, time.perf_counter() - started, job.total_transactions)
+        finally:
+            db.close()
+
+        # Replace the completion-ordered partial results with the input-ordered final list
+        with job._lock:
+            job.results = results
+            job.processed_count = len(results)
+        job.status = "completed"
+    except Exception as e:
+        logger.exception("Job %s failed", job.id)
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        job.finished_at = datetime.utcnow()
+        # The input rows are no longer needed once the job is done
+        job.transactions = []
+        completed = job.status == "completed"
+        _publish(job, results=job.results if completed else None, dead_letter=job.dead_letter, replace_results=completed)
+
+def _run_upload_job(job: AnalysisJob, path: str, file_format: str):
+    # Each chunk is validated, analyzed and saved before the next one is read.
+    # Only counts are kept on the job so memory does not grow with the file.
+    job.status = "running"
+    job.started_at = datetime.utcnow()
+    _publish(job)
+    db = SessionLocal()
+    try:
+        for chunk in ingest_service.iter_file_chunks(path, file_format):
+            transactions, errors = ingest_service.validate_chunk(chunk, first_row_number=job.rows_read + 1)
+            dead_letter = []
+            started = time.perf_counter()
+            with job._lock:
+                # Rows rejected by validation are settled as soon as they are read
+                job.settled_count += len(errors)
+                job._batch_offset = job.total_batches
+            _publish(job)
+            results = analysis_service.run_analysis_pipeline(
+                transactions, job.config, on_batch=job.record_batch, dead_letter=dead_letter,
+                on_settled=job.record_settled
+            ) if transactions else []
+            saved_count = analysis_service.save_results_to_db(results, db)
+            stats_service.record_processing(db, time.perf_counter() - started, len(transactions))
+
+            with job._lock:
+                job.rows_read += len(chunk)
+                # Also covers the chunk's dead-lettered rows
+                job.settled_count = job.rows_read
+                job.invalid_count += len(errors)
+                job.processed_count += len(results)
+                job.saved_count += saved_count
+                job.upload_failed_count += len(dead_letter)
+                kept_dead_letter = dead_letter[:max(0, UPLOAD_DEAD_LETTER_LIMIT - len(job.dead_letter))]
+                job.dead_letter.extend(kept_dead_letter)
+                room = ingest_service.MAX_REPORTED_ERRORS - len(job.validation_errors)
+                if room > 0:
+                    job.validation_errors.extend(errors[:room])
+            _publish(job, dead_letter=kept_dead_letter)
+        job.status = "completed"
+    except Exception as e:
+        logger.exception("Job %s failed", job.id)
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        db.close()
+        job.finished_at = datetime.utcnow()
+        os.remove(path)
+        _publish(job)
+
+def _prune_finished_jobs():
+    cutoff = datetime.utcnow() - JOB_RETENTION
+    with _jobs_lock:
+        expired = [job_id for job_id, job in _jobs.items() if job.is_finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del _jobs[job_id]
+    if coordination.enabled():
+        coordination.get_store().prune_jobs(time.time() - JOB_RETENTION.total_seconds())
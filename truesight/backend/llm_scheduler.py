@@ -0,0 +1,247 @@
+import os
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+import metrics
+import coordination
+
+logger = logging.getLogger(__name__)
+
+# Scheduling layer around LLM calls: request and token rate limits, retries with
+# exponential backoff and jitter (honouring Retry-After), and a circuit breaker that
+# stops hammering a provider that keeps failing. With several workers the rate
+# limits are shared through the coordination store; the breaker stays per process.
+
+# Provider quotas. 0 disables the corresponding limit.
+REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "5"))
+BASE_RETRY_DELAY = float(os.getenv("LLM_BASE_RETRY_DELAY", "1.0"))
+MAX_RETRY_DELAY = float(os.getenv("LLM_MAX_RETRY_DELAY", "60.0"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    pass
+
+class TokenBucket:
+    # Refills continuously at rate_per_minute up to capacity. acquire() blocks until
+    # the requested amount is available. Requests larger than the capacity are let
+    # through once the bucket is full, leaving it in debt.
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def acquire(self, amount: float = 1.0):
+        while True:
+            with self._lock:
+                self._refill()
+                needed = min(amount, self.capacity)
+                if self.available >= needed:
+                    self.available -= amount
+                    return
+                wait = (needed - self.available) / self.rate_per_second
+            time.sleep(wait)
+
+    def adjust(self, amount: float):
+        # Corrects an earlier estimate once the real usage is known (positive = used more)
+        with self._lock:
+            self._refill()
+            self.available -= amount
+
+class SharedTokenBucket:
+    # TokenBucket whose level is kept in the coordination store, so every worker
+    # process on the host draws from the same provider quota
+    def __init__(self, name: str, rate_per_minute: float, capacity: Optional[float] = None):
+        self.name = name
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+
+    def acquire(self, amount: float = 1.0):
+        while True:
+            wait = coordination.get_store().take(self.name, amount, self.rate_per_second, self.capacity)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def adjust(self, amount: float):
+        coordination.get_store().adjust(self.name, amount, self.rate_per_second, self.capacity)
+
+def make_bucket(name: str, rate_per_minute: float):
+    # None when the limit is disabled (0)
+    if rate_per_minute <= 0:
+        return None
+    if coordination.enabled():
+        return SharedTokenBucket(name, rate_per_minute)
+    return TokenBucket(rate_per_minute)
+
+class CircuitBreaker:
+    # closed: calls flow. open: calls fail fast until reset_seconds pass.
+    # half_open: one trial call; success closes the breaker, failure re-opens it.
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    raise CircuitOpenError("LLM circuit breaker is open; provider is failing")
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open":
+                if self._trial_in_flight:
+                    raise CircuitOpenError("LLM circuit breaker is half-open; trial call in progress")
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        # For outcomes that say nothing about provider health (429s, bad requests):
+        # the breaker state is unchanged, but a half-open trial slot is freed
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+def is_retryable(error: Exception) -> bool:
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    # Timeouts and connection failures (groq.APITimeoutError, groq.APIConnectionError, ...)
+    name = type(error).__name__
+    return isinstance(error, (TimeoutError, ConnectionError)) or "Timeout" in name or "Connection" in name
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return float(retry_after)
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class LLMScheduler:
+    def __init__(
+        self,
+        requests_per_minute: float = REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = TOKENS_PER_MINUTE,
+        max_attempts: int = MAX_ATTEMPTS,
+        base_delay: float = BASE_RETRY_DELAY,
+        max_delay: float = MAX_RETRY_DELAY,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.request_bucket = make_bucket("llm_requests", requests_per_minute)
+        self.token_bucket = make_bucket("llm_tokens", tokens_per_minute)
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        # Full jitter: uniform in [0, base * 2^attempt], capped. A server-provided
+        # Retry-After is treated as a floor.
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def call(self, fn: Callable[[], Any], estimated_tokens: int = 0) -> Any:
+        # Runs fn() under the rate limits, retrying transient failures. Raises the
+        # last error (or CircuitOpenError) when the call cannot be completed.
+        for attempt in range(self.max_attempts):
+            self.breaker.before_call()
+            if self.request_bucket:
+                self.request_bucket.acquire(1)
+            if self.token_bucket and estimated_tokens:
+                self.token_bucket.acquire(estimated_tokens)
+
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.release_trial()
+                    raise
+                if getattr(e, "status_code", None) == 429:
+                    self.breaker.release_trial()
+                else:
+                    self.breaker.record_failure()
+                if attempt == self.max_attempts - 1:
+                    raise
+                metrics.LLM_RETRIES.labels("rate_limited" if getattr(e, "status_code", None) == 429 else "error").inc()
+                delay = self.backoff_delay(attempt, retry_after_seconds(e))
+                logger.warning("LLM call failed (%s: %s); retry %d in %.1fs", type(e).__name__, e, attempt + 1, delay)
+                time.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            # A stream has no usage yet; its caller reconciles once it is drained
+            self.reconcile_tokens(getattr(result, "usage", None), estimated_tokens)
+            return result
+
+    def reconcile_tokens(self, usage: Any, estimated_tokens: int):
+        # Charges the token bucket the difference between a call's real usage and the
+        # estimate acquired for it. Without usage the estimate stands.
+        if not self.token_bucket or usage is None:
+            return
+        total_tokens = getattr(usage, "total_tokens", None) or (
+            (getattr(usage, "prompt_tokens", None) or 0) + (getattr(usage, "completion_tokens", None) or 0)
+        )
+        if total_tokens:
+            self.token_bucket.adjust(total_tokens - estimated_tokens)
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
@@ -1,21 +1,121 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from database import engine, get_db, Base
+from fastapi.responses import StreamingResponse, Response
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import engine, async_engine, get_async_db, Base, SessionLocal
 import models
 import schemas
 import analysis_service
-from typing import List, Dict, Any
+import job_service
+import result_cache
+import stats_service
+import investigation_service
+import case_service
+import transaction_service
+import metrics
+import providers
+import feature_store
+import similarity_index
+import storage_lifecycle
+import change_versions
+import coordination
+import fast_responses
+from typing import List, Dict, Any, Optional
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import logging
+import os
+import time
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Level for the application's loggers (LOG_LEVEL=DEBUG for more detail)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(levelname)s:%(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+# Period of the hot-to-cold retention job in seconds; 0 leaves it to
+# POST /api/storage/retention (or cron)
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "0"))
+
+def _run_retention(days: int) -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        return storage_lifecycle.run_retention(db, days)
+    finally:
+        db.close()
+
+async def _retention_loop():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
+        # With several workers only the holder of the lease runs the job
+        if coordination.enabled() and not coordination.get_store().acquire_lease(
+            "retention", str(os.getpid()), 2 * RETENTION_INTERVAL_SECONDS
+        ):
+            continue
+        try:
+            await loop.run_in_executor(None, _run_retention, storage_lifecycle.HOT_RETENTION_DAYS)
+        except Exception:
+            logger.exception("Retention job failed")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup work lives here rather than at import, so the module can be imported
+    # (by workers, scripts, tests) without a reachable database or API keys.
+    # LLM clients are created by providers on first use.
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        stats_service.ensure_stats_row(db)
+        feature_store.load(db)
+    finally:
+        db.close()
+    retention_task = asyncio.create_task(_retention_loop()) if RETENTION_INTERVAL_SECONDS > 0 else None
+    job_service.start_dispatcher()
+    yield
+    if retention_task is not None:
+        retention_task.cancel()
+    job_service.stop_dispatcher()
+    providers.close_all()
+    feature_store.save()
+    similarity_index.save_all()
 
 app = FastAPI(
     title="TrueSight API",
     description="Fraud Analysis and Investigation Platform",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=fast_responses.FastJSONResponse
 )
 
+# Streamed results are written to the DB in groups of this many rows
+STREAM_SAVE_EVERY = 100
+
+# /api/analysis/run calls block for the whole LLM round trip. They run on their own
+# pool so they cannot use up the shared threadpool that serves the sync endpoints.
+ANALYSIS_REQUEST_WORKERS = int(os.getenv("ANALYSIS_REQUEST_WORKERS", "8"))
+_analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_REQUEST_WORKERS, thread_name_prefix="analysis-request")
+
+# Query counts and latencies for both engines
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # For streamed responses this is the time to the first byte
+        route = metrics.route_label(request.scope)
+        metrics.HTTP_REQUESTS.labels(request.method, route, str(status_code)).inc()
+        metrics.HTTP_SECONDS.labels(request.method, route).observe(time.perf_counter() - started)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -23,56 +123,207 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the frontend read ETags for conditional GETs
+    expose_headers=["ETag"],
 )
 
+# gzip (or brotli, if installed) for complete responses of 1 KB or more
+app.add_middleware(fast_responses.CompressionMiddleware)
+
 # Analysis Endpoints
 @app.post("/api/analysis/generate-sample")
 def generate_sample_data(count: int = 10):
     return analysis_service.generate_sample_transactions(count)
 
+def _run_analysis_and_save(transactions: List[Dict[str, Any]], config: Dict[str, Any]) -> Dict[str, Any]:
+    dead_letter = []
+    started = time.perf_counter()
+    results = analysis_service.run_analysis_pipeline(transactions, config, dead_letter=dead_letter)
+    
+    # Save results to DB
+    db = SessionLocal()
+    try:
+        saved_count = analysis_service.save_results_to_db(results, db)
+        stats_service.record_processing(db, time.perf_counter() - started, len(transactions))
+    finally:
+        db.close()
+    
+    return {
+        "status": "success" if not dead_letter else "partial",
+        "processed_count": len(results),
+        "saved_count": saved_count,
+        "failed_count": len(dead_letter),
+        "results": results,
+        # Rows that could not be analyzed, with the reason; safe to resubmit
+        "dead_letter": dead_letter
+    }
+
 @app.post("/api/analysis/run")
-def run_analysis(request: Dict[str, Any], db: Session = Depends(get_db)):
+async def run_analysis(request: Dict[str, Any]):
     transactions = request.get('transactions', [])
     config = request.get('config', {})
     
     if not transactions:
         raise HTTPException(status_code=400, detail="No transactions provided")
-        
-    results = analysis_service.analyze_transactions(transactions, config)
     
-    # Save results to DB
-    saved_count = analysis_service.save_results_to_db(results, db)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_analysis_executor, _run_analysis_and_save, transactions, config)
+
+@app.post("/api/analysis/stream")
+def stream_analysis(request: Dict[str, Any], format: str = "ndjson"):
+    # Streams each classified transaction as soon as it is parsed, as NDJSON lines
+    # (default) or server-sent events (?format=sse). Every line/event is
+    # {"type": "result" | "dead_letter" | "summary", ...}.
+    transactions = request.get('transactions', [])
+    config = request.get('config', {})
     
-    return {
-        "status": "success",
-        "processed_count": len(results),
-        "saved_count": saved_count,
-        "results": results
-    }
+    if not transactions:
+        raise HTTPException(status_code=400, detail="No transactions provided")
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or sse")
+    
+    def encode(event: Dict[str, Any]) -> str:
+        payload = json.dumps(event, default=str)
+        if format == "sse":
+            return f"event: {event['type']}\ndata: {payload}\n\n"
+        return payload + "\n"
+    
+    def events():
+        # The request-scoped session is closed before streaming starts, so the
+        # generator owns its own session and saves results in small groups
+        db = SessionLocal()
+        dead_letter = []
+        unsaved = []
+        processed_count = 0
+        saved_count = 0
+        started = time.perf_counter()
+        try:
+            for result in analysis_service.stream_analysis_pipeline(transactions, config, dead_letter=dead_letter):
+                processed_count += 1
+                unsaved.append(result)
+                if len(unsaved) >= STREAM_SAVE_EVERY:
+                    saved_count += analysis_service.save_results_to_db(unsaved, db)
+                    unsaved = []
+                yield encode({"type": "result", "result": result})
+            saved_count += analysis_service.save_results_to_db(unsaved, db)
+            stats_service.record_processing(db, time.perf_counter() - started, len(transactions))
+            for row in dead_letter:
+                yield encode({"type": "dead_letter", **row})
+            yield encode({
+                "type": "summary",
+                "status": "success" if not dead_letter else "partial",
+                "processed_count": processed_count,
+                "saved_count": saved_count,
+                "failed_count": len(dead_letter)
+            })
+        finally:
+            db.close()
+    
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+@app.post("/api/analysis/jobs", status_code=status.HTTP_202_ACCEPTED)
+def submit_analysis_job(request: Dict[str, Any]):
+    transactions = request.get('transactions', [])
+    config = request.get('config', {})
+
+    if not transactions:
+        raise HTTPException(status_code=400, detail="No transactions provided")
+
+    job = job_service.submit_analysis_job(transactions, config)
+    return job.to_dict()
+
+@app.post("/api/analysis/upload", status_code=status.HTTP_202_ACCEPTED)
+def upload_transactions_file(file: UploadFile = File(...), config: str = Form("{}")):
+    # CSV or Parquet file; processed in chunks by a background job
+    try:
+        job = job_service.submit_upload_job(file.file, file.filename, json.loads(config or "{}"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.to_dict()
+
+# The job endpoints are not async: with several workers they read the
+# coordination store
+@app.get("/api/analysis/jobs")
+def list_analysis_jobs():
+    return [job.to_dict() for job in job_service.list_jobs()]
+
+@app.get("/api/analysis/jobs/{job_id}")
+def get_analysis_job(job_id: str):
+    job = job_service.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/api/analysis/jobs/{job_id}/results")
+def get_analysis_job_results(job_id: str, offset: int = 0, limit: int = 500):
+    job = job_service.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.results_page(offset, limit)
+
+@app.get("/api/analysis/cache/stats")
+def get_analysis_cache_stats():
+    cache = result_cache.get_result_cache()
+    if cache is None:
+        return {"backend": "none"}
+    return cache.stats()
+
+@app.delete("/api/analysis/cache", status_code=status.HTTP_204_NO_CONTENT)
+def clear_analysis_cache():
+    cache = result_cache.get_result_cache()
+    if cache is not None:
+        cache.clear()
+
+@app.get("/api/analysis/similarity/stats")
+def get_similarity_index_stats():
+    return similarity_index.stats()
+
+@app.get("/api/analysis/jobs/{job_id}/dead-letter")
+def get_analysis_job_dead_letter(job_id: str):
+    job = job_service.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job.id, "status": job.status, "dead_letter": job.dead_letter}
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {
         "message": "Welcome to TrueSight API",
         "version": "1.0.0",
         "docs": "/docs"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 # Health check
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "healthy"}
 
 # Cases endpoints
+# Columns behind the list responses (the fields of schemas.Case / schemas.Alert)
+CASE_COLUMNS = fast_responses.columns_for(models.Case, schemas.Case)
+ALERT_COLUMNS = fast_responses.columns_for(models.Alert, schemas.Alert)
+# Tables the investigation feed reads
+FEED_TABLES = ["transactions", "alerts"]
+
 @app.get("/api/cases", response_model=List[schemas.Case])
-def get_cases(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    cases = db.query(models.Case).offset(skip).limit(limit).all()
-    return cases
+async def get_cases(request: Request, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    # Column rows straight to orjson; unchanged pages answer If-None-Match with 304
+    etag = fast_responses.etag_for(request, ["cases"])
+    if fast_responses.is_not_modified(request, etag):
+        return fast_responses.not_modified_response(etag)
+    rows = await db.execute(select(*CASE_COLUMNS).offset(skip).limit(limit))
+    return fast_responses.rows_response(rows, headers=fast_responses.conditional_headers(etag))
 
 @app.post("/api/cases", response_model=schemas.Case, status_code=status.HTTP_201_CREATED)
-def create_case(case: schemas.CaseCreate, db: Session = Depends(get_db)):
+async def create_case(case: schemas.CaseCreate, db: AsyncSession = Depends(get_async_db)):
     # Generate case number
-    case_count = db.query(models.Case).count()
+    case_count = await db.scalar(select(func.count()).select_from(models.Case))
     case_number = f"CASE-{case_count + 1001:04d}"
     
     db_case = models.Case(
@@ -80,115 +331,246 @@ def create_case(case: schemas.CaseCreate, db: Session = Depends(get_db)):
         case_number=case_number
     )
     db.add(db_case)
-    db.commit()
-    db.refresh(db_case)
+    await db.commit()
+    await db.refresh(db_case)
     return db_case
 
 @app.get("/api/cases/{case_id}", response_model=schemas.Case)
-def get_case(case_id: int, db: Session = Depends(get_db)):
-    case = db.query(models.Case).filter(models.Case.id == case_id).first()
+async def get_case(case_id: int, db: AsyncSession = Depends(get_async_db)):
+    case = await db.get(models.Case, case_id)
     if not case:
         raise HTTPException(status_code=404, detail="Case not found")
     return case
 
+@app.get("/api/cases/{case_id}/dossier")
+async def get_case_dossier(
+    case_id: int,
+    limit: int = case_service.DEFAULT_DOSSIER_TRANSACTIONS,
+    cursor: Optional[str] = None,
+    alerts_limit: int = case_service.DEFAULT_DOSSIER_ALERTS,
+    alerts_cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Case, assignee, totals and one page each of alerts and transactions in a fixed
+    # number of queries. Pass transactions.next_cursor back as cursor, and
+    # alerts.next_cursor as alerts_cursor, for the following pages.
+    try:
+        dossier = await case_service.get_dossier(db, case_id, limit, cursor, alerts_limit, alerts_cursor)
+    except case_service.CaseNotFound:
+        raise HTTPException(status_code=404, detail="Case not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return fast_responses.json_response(dossier)
+
+@app.post("/api/cases/{case_id}/alerts")
+async def attach_case_alerts(case_id: int, attachment: schemas.CaseAttachment, db: AsyncSession = Depends(get_async_db)):
+    try:
+        return await case_service.attach_alerts(db, case_id, attachment.ids)
+    except case_service.CaseNotFound:
+        raise HTTPException(status_code=404, detail="Case not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/cases/{case_id}/transactions")
+async def attach_case_transactions(case_id: int, attachment: schemas.CaseAttachment, db: AsyncSession = Depends(get_async_db)):
+    try:
+        return await case_service.attach_transactions(db, case_id, attachment.ids)
+    except case_service.CaseNotFound:
+        raise HTTPException(status_code=404, detail="Case not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Alerts endpoints
 @app.get("/api/alerts", response_model=List[schemas.Alert])
-def get_alerts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    alerts = db.query(models.Alert).offset(skip).limit(limit).all()
-    return alerts
+async def get_alerts(request: Request, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    etag = fast_responses.etag_for(request, ["alerts"])
+    if fast_responses.is_not_modified(request, etag):
+        return fast_responses.not_modified_response(etag)
+    rows = await db.execute(select(*ALERT_COLUMNS).offset(skip).limit(limit))
+    return fast_responses.rows_response(rows, headers=fast_responses.conditional_headers(etag))
 
 @app.post("/api/alerts", response_model=schemas.Alert, status_code=status.HTTP_201_CREATED)
-def create_alert(alert: schemas.AlertCreate, db: Session = Depends(get_db)):
+async def create_alert(alert: schemas.AlertCreate, db: AsyncSession = Depends(get_async_db)):
     # For now, set created_by_id to 1 (will be replaced with auth)
     db_alert = models.Alert(**alert.dict(), created_by_id=1)
     db.add(db_alert)
-    db.commit()
-    db.refresh(db_alert)
+    await db.commit()
+    await db.refresh(db_alert)
     return db_alert
 
 # Transactions endpoints
+def _feed_filters(
+    risk: Optional[str] = None,
+    flagged: Optional[bool] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Dict[str, Any]:
+    try:
+        risk_levels = investigation_service.parse_risk_levels(risk)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "risk_levels": risk_levels,
+        "flagged": flagged,
+        "min_amount": min_amount,
+        "max_amount": max_amount,
+        "start": start,
+        "end": end
+    }
+
+@app.get("/api/investigation/feed")
+async def get_investigation_feed(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = investigation_service.DEFAULT_FEED_LIMIT,
+    filters: Dict[str, Any] = Depends(_feed_filters),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Newest first. Pass next_cursor back as ?cursor= to get the following page.
+    etag = fast_responses.etag_for(request, FEED_TABLES)
+    if fast_responses.is_not_modified(request, etag):
+        return fast_responses.not_modified_response(etag)
+    try:
+        page = await investigation_service.get_feed_async(db, limit=limit, cursor=cursor, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return fast_responses.json_response(page, headers=fast_responses.conditional_headers(etag))
+
 @app.get("/api/investigation/data")
-def get_investigation_data(db: Session = Depends(get_db)):
-    # Get recent transactions
-    transactions = db.query(models.Transaction).order_by(models.Transaction.timestamp.desc()).limit(100).all()
-    
-    # Get alerts to map explanations
-    alerts = db.query(models.Alert).all()
-    # Create a map of transaction description if we can link them. 
-    # Currently Alert doesn't link to Transaction directly in the model I created earlier (it links to Case), 
-    # but for this MVP analysis flow, we created Alerts from Transactions.
-    # Let's update the analysis service to link them or just store explanation in Transaction for simplicity in this iteration.
-    
-    # Actually, let's just return the transactions and map risk score to level
-    result = []
-    for t in transactions:
-        risk_level = "LOW"
-        if t.risk_score > 80:
-            risk_level = "HIGH"
-        elif t.risk_score > 50:
-            risk_level = "MEDIUM"
-            
-        # Find matching alert if any (naive matching for now since we didn't add transaction_id to Alert)
-        # In a real app, we'd have a foreign key. 
-        # For this MVP, let's just use the description if it's high risk
-        explanation = "Analyzed by TrueSight AI"
-        if t.is_flagged:
-             # Try to find the alert created for this transaction
-             # This is a bit hacky but works for the demo flow
-             pass
-
-        result.append({
-            "id": t.transaction_id,
-            "amount": t.amount,
-            "risk": risk_level,
-            "score": int(t.risk_score),
-            "type": t.transaction_type,
-            "explanation": explanation,
-            "status": "New" if t.is_flagged else "Closed",
-            "timestamp": t.timestamp
-        })
-        
-    return result
+async def get_investigation_data(request: Request, filters: Dict[str, Any] = Depends(_feed_filters), db: AsyncSession = Depends(get_async_db)):
+    # First page of the investigation feed as a plain list (kept for existing clients)
+    etag = fast_responses.etag_for(request, FEED_TABLES)
+    if fast_responses.is_not_modified(request, etag):
+        return fast_responses.not_modified_response(etag)
+    page = await investigation_service.get_feed_async(db, limit=100, **filters)
+    return fast_responses.json_response(page["items"], headers=fast_responses.conditional_headers(etag))
 
 @app.post("/api/transactions", response_model=schemas.Transaction, status_code=status.HTTP_201_CREATED)
-def create_transaction(transaction: schemas.TransactionCreate, db: Session = Depends(get_db)):
-    # Calculate risk score (simple example)
-    risk_score = 0.0
-    if transaction.amount > 10000:
-        risk_score += 30
-    if transaction.location and "suspicious" in transaction.location.lower():
-        risk_score += 40
-    
-    is_flagged = risk_score > 50
-    
+async def create_transaction(transaction: schemas.TransactionCreate, db: AsyncSession = Depends(get_async_db)):
+    risk_score = transaction_service.score_transaction(transaction.amount, transaction.location)
+    is_flagged = risk_score > transaction_service.FLAG_SCORE
+
     db_transaction = models.Transaction(
         **transaction.dict(),
         risk_score=risk_score,
         is_flagged=is_flagged
     )
     db.add(db_transaction)
-    db.commit()
-    db.refresh(db_transaction)
+    await db.run_sync(stats_service.record_transactions, [{'risk_score': risk_score}])
+    await db.commit()
+    await db.refresh(db_transaction)
+    feature_store.record_stored([{
+        'user_account': db_transaction.user_account,
+        'amount': db_transaction.amount,
+        'timestamp': db_transaction.timestamp,
+        'device_id': db_transaction.device_id,
+        'ip_address': db_transaction.ip_address
+    }])
     return db_transaction
 
+@app.get("/api/features/{account}")
+def get_account_features(account: str):
+    # Current feature-store view of an account. Not async: with several workers
+    # sync() may first read new transactions from the database.
+    feature_store.sync()
+    features = feature_store.get_feature_store().features(account)
+    if features is None:
+        raise HTTPException(status_code=404, detail="Account not found")
+    return {"user_account": account, **features}
+
+def _ingest_chunk(items: List[Any], first_index: int) -> List[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        return transaction_service.ingest_chunk(db, items, first_index)
+    finally:
+        db.close()
+
+@app.post("/api/transactions/bulk")
+async def bulk_create_transactions(request: Request, include_created: bool = True):
+    # Body: a JSON array of transactions (or {"transactions": [...]}), or NDJSON with
+    # Content-Type application/x-ndjson, which is ingested while it is still arriving.
+    # Each chunk is committed on its own, so rows reported as created stay stored
+    # even if a later chunk fails. include_created=false leaves created rows out of
+    # the per-row report.
+    loop = asyncio.get_running_loop()
+    statuses: List[Dict[str, Any]] = []
+
+    async def ingest(chunk: List[Any]):
+        statuses.extend(await loop.run_in_executor(None, _ingest_chunk, chunk, len(statuses)))
+
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        chunk: List[Any] = []
+        pending = b""
+        async for data in request.stream():
+            *lines, pending = (pending + data).split(b"\n")
+            for line in lines:
+                if line.strip():
+                    chunk.append(transaction_service.parse_ndjson_line(line))
+            if len(chunk) >= transaction_service.BULK_CHUNK_ROWS:
+                await ingest(chunk)
+                chunk = []
+        chunk.extend(transaction_service.iter_ndjson(pending))
+        if chunk:
+            await ingest(chunk)
+    else:
+        try:
+            items = transaction_service.parse_json_body(await request.body())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        for chunk in transaction_service.iter_chunks(items):
+            await ingest(chunk)
+
+    return transaction_service.summarize(statuses, include_rows=include_created)
+
+@app.get("/api/storage/partitions")
+async def get_storage_partitions(db: AsyncSession = Depends(get_async_db)):
+    # Rows per month in the hot table and in the Parquet cold tier
+    hot = await db.run_sync(storage_lifecycle.hot_partitions)
+    try:
+        cold = await asyncio.get_running_loop().run_in_executor(None, storage_lifecycle.cold_partitions)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"retention_days": storage_lifecycle.HOT_RETENTION_DAYS, "hot": hot, "cold": cold}
+
+@app.post("/api/storage/retention")
+async def run_storage_retention(days: int = storage_lifecycle.HOT_RETENTION_DAYS):
+    # Moves transactions older than `days` to the cold tier now
+    if days < 1:
+        raise HTTPException(status_code=400, detail="days must be at least 1")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, _run_retention, days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/storage/cold/transactions")
+async def get_cold_transactions(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user_account: Optional[str] = None,
+    transaction_id: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    risk: Optional[str] = None,
+    limit: int = 1000
+):
+    # Archived transactions for historical investigations, newest first
+    try:
+        risk_levels = investigation_service.parse_risk_levels(risk)
+        frame = await asyncio.get_running_loop().run_in_executor(None, lambda: storage_lifecycle.read_cold(
+            start=start, end=end, user_account=user_account, transaction_id=transaction_id,
+            min_amount=min_amount, risk_levels=risk_levels, limit=max(1, limit)
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": storage_lifecycle.serialize_cold_frame(frame), "count": len(frame)}
+
 # Stats endpoint
 @app.get("/api/stats")
-def get_stats(db: Session = Depends(get_db)):
-    total_transactions = db.query(models.Transaction).count()
-    high_risk = db.query(models.Transaction).filter(models.Transaction.risk_score > 80).count()
-    medium_risk = db.query(models.Transaction).filter(models.Transaction.risk_score > 50, models.Transaction.risk_score <= 80).count()
-    low_risk = db.query(models.Transaction).filter(models.Transaction.risk_score <= 50).count()
-    
-    # Calculate average processing time (mock for now)
-    avg_processing = 1.2
-    
-    return {
-        "total_analyzed": total_transactions,
-        "high_risk": high_risk,
-        "medium_risk": medium_risk,
-        "low_risk": low_risk,
-        "avg_processing": avg_processing
-    }
+async def get_stats(db: AsyncSession = Depends(get_async_db)):
+    # Served from the TTL cache without touching the database most of the time
+    return await db.run_sync(stats_service.get_stats)
 
 if __name__ == "__main__":
     import uvicorn
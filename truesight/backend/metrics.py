@@ -0,0 +1,116 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Any
+from prometheus_client import Counter, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+
+# Prometheus metrics for the analysis path, HTTP requests and database queries,
+# served by GET /metrics. Stage timings show which step limits throughput:
+#   enrich                    adding feature_store account features to rows
+#   prescreen, cache_lookup   rows settled without the LLM
+#   similarity                nearest-neighbour reuse of earlier LLM verdicts
+#   prompt_build              encoding a batch into the prompt
+#   llm_call                  the provider round trip, including scheduler retries
+#   parse                     turning the response table into results
+#   classifier                in-process scoring (model 'classifier'), instead of the three above
+#   db_persist                save_results_to_db
+
+# Seconds buckets spanning sub-millisecond parsing to multi-second LLM calls
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "truesight_analysis_stage_seconds", "Time spent per analysis stage", ["stage"], buckets=STAGE_BUCKETS
+)
+STAGE_ROWS = Counter(
+    "truesight_analysis_stage_rows_total", "Transactions handled per analysis stage", ["stage"]
+)
+LLM_CALLS = Counter(
+    "truesight_llm_calls_total", "LLM calls by outcome", ["model", "outcome"]
+)
+LLM_RETRIES = Counter(
+    "truesight_llm_retries_total", "LLM calls retried by the scheduler", ["reason"]
+)
+LLM_TOKENS = Counter(
+    "truesight_llm_tokens_total", "Tokens reported in the provider usage field", ["model", "kind"]
+)
+HTTP_REQUESTS = Counter(
+    "truesight_http_requests_total", "HTTP requests", ["method", "route", "status"]
+)
+HTTP_SECONDS = Histogram(
+    "truesight_http_request_seconds", "HTTP request latency", ["method", "route"], buckets=STAGE_BUCKETS
+)
+DB_QUERIES = Counter(
+    "truesight_db_queries_total", "SQL statements sent to the database", ["operation"]
+)
+DB_SECONDS = Histogram(
+    "truesight_db_query_seconds", "SQL statement latency", ["operation"], buckets=STAGE_BUCKETS
+)
+
+@contextmanager
+def time_stage(stage: str, rows: int = 0):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+        if rows:
+            STAGE_ROWS.labels(stage).inc(rows)
+
+def record_llm_usage(model: str, usage: Any):
+    # usage is the provider's usage object (prompt_tokens / completion_tokens); may be None
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if prompt_tokens:
+        LLM_TOKENS.labels(model, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(model, "completion").inc(completion_tokens)
+
+def route_label(scope: dict) -> str:
+    # The route template (/api/cases/{case_id}) keeps label cardinality bounded
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+def _statement_operation(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+def instrument_engine(engine):
+    # Counts and times every statement on a sync Engine (for an AsyncEngine pass
+    # its .sync_engine)
+    if getattr(engine, "_truesight_instrumented", False):
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = _statement_operation(statement)
+        DB_QUERIES.labels(operation).inc()
+        DB_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # Keeps the start-time stack balanced when a statement fails
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+    engine._truesight_instrumented = True
+
+def render() -> tuple:
+    # (body, content type) for the /metrics endpoint. With several workers
+    # (serve.py sets PROMETHEUS_MULTIPROC_DIR before they start) each worker writes
+    # its samples to files in that directory and the response sums all of them, so
+    # any worker answers for the whole server.
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,88 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("username", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("full_name", sa.String()),
+        sa.Column("role", sa.String()),
+        sa.Column("is_active", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+
+    op.create_table(
+        "cases",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("case_number", sa.String(), nullable=False),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("description", sa.Text()),
+        sa.Column("status", sa.String()),
+        sa.Column("priority", sa.String()),
+        sa.Column("fraud_type", sa.String()),
+        sa.Column("assigned_to_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+        sa.Column("closed_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_cases_id", "cases", ["id"])
+    op.create_index("ix_cases_case_number", "cases", ["case_number"], unique=True)
+
+    op.create_table(
+        "alerts",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("alert_type", sa.String(), nullable=False),
+        sa.Column("severity", sa.String()),
+        sa.Column("description", sa.Text()),
+        sa.Column("status", sa.String()),
+        sa.Column("case_id", sa.Integer(), sa.ForeignKey("cases.id"), nullable=True),
+        sa.Column("created_by_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_alerts_id", "alerts", ["id"])
+
+    op.create_table(
+        "transactions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("transaction_id", sa.String(), nullable=False),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("currency", sa.String()),
+        sa.Column("transaction_type", sa.String()),
+        sa.Column("merchant", sa.String()),
+        sa.Column("location", sa.String()),
+        sa.Column("ip_address", sa.String()),
+        sa.Column("device_id", sa.String()),
+        sa.Column("user_account", sa.String()),
+        sa.Column("risk_score", sa.Float()),
+        sa.Column("is_flagged", sa.Boolean()),
+        sa.Column("case_id", sa.Integer(), sa.ForeignKey("cases.id"), nullable=True),
+        sa.Column("timestamp", sa.DateTime()),
+    )
+    op.create_index("ix_transactions_id", "transactions", ["id"])
+    op.create_index("ix_transactions_transaction_id", "transactions", ["transaction_id"], unique=True)
+
+
+def downgrade():
+    op.drop_table("transactions")
+    op.drop_table("alerts")
+    op.drop_table("cases")
+    op.drop_table("users")
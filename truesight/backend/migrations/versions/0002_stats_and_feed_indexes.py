@@ -0,0 +1,41 @@
+"""transaction_stats table and investigation feed indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "transaction_stats",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("total_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("high_risk_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("medium_risk_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("low_risk_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("processed_transactions", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("processing_seconds", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime()),
+    )
+    # The counters are seeded from the existing rows by stats_service.ensure_stats_row
+    # when the app starts
+
+    op.create_index("ix_transactions_timestamp_id", "transactions", ["timestamp", "id"])
+    op.create_index("ix_transactions_flagged_timestamp_id", "transactions", ["is_flagged", "timestamp", "id"])
+    op.create_index("ix_transactions_risk_score_timestamp_id", "transactions", ["risk_score", "timestamp", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_transactions_risk_score_timestamp_id", table_name="transactions")
+    op.drop_index("ix_transactions_flagged_timestamp_id", table_name="transactions")
+    op.drop_index("ix_transactions_timestamp_id", table_name="transactions")
+    op.drop_table("transaction_stats")
@@ -0,0 +1,40 @@
+"""store the analysis verdict on transactions and link alerts to them
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("transactions") as batch_op:
+        batch_op.add_column(sa.Column("risk_level", sa.String(), nullable=True))
+        batch_op.add_column(sa.Column("explanation", sa.Text(), nullable=True))
+
+    with op.batch_alter_table("alerts") as batch_op:
+        batch_op.add_column(sa.Column("transaction_id", sa.Integer(), nullable=True))
+        batch_op.create_foreign_key("fk_alerts_transaction_id", "transactions", ["transaction_id"], ["id"])
+        batch_op.create_index("ix_alerts_transaction_id", ["transaction_id"])
+
+    # Rows saved before this revision have no stored verdict and their alerts carry
+    # no transaction key, so they are left unlinked; the feed falls back to the
+    # score-derived risk level for them.
+
+
+def downgrade():
+    with op.batch_alter_table("alerts") as batch_op:
+        batch_op.drop_index("ix_alerts_transaction_id")
+        batch_op.drop_constraint("fk_alerts_transaction_id", type_="foreignkey")
+        batch_op.drop_column("transaction_id")
+
+    with op.batch_alter_table("transactions") as batch_op:
+        batch_op.drop_column("explanation")
+        batch_op.drop_column("risk_level")
@@ -0,0 +1,29 @@
+"""index the investigation feed's risk filter on the stored verdict
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The feed filters on the stored verdict, falling back to the score bucket for
+    # rows without one, so the index leads with risk_level
+    op.drop_index("ix_transactions_risk_score_timestamp_id", table_name="transactions")
+    op.create_index(
+        "ix_transactions_risk_level_score_timestamp_id", "transactions",
+        ["risk_level", "risk_score", "timestamp", "id"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_transactions_risk_level_score_timestamp_id", table_name="transactions")
+    op.create_index("ix_transactions_risk_score_timestamp_id", "transactions", ["risk_score", "timestamp", "id"])
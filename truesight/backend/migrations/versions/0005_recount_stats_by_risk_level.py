@@ -0,0 +1,37 @@
+"""recount the dashboard risk counters by the stored verdict
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+# stats_service.effective_risk_level: the stored verdict, else the score bucket
+LEVEL = (
+    "COALESCE(risk_level, CASE WHEN risk_score > 80 THEN 'HIGH' "
+    "WHEN risk_score > 50 THEN 'MEDIUM' ELSE 'LOW' END)"
+)
+
+
+def _recount(level_sql):
+    op.execute(
+        "UPDATE transaction_stats SET "
+        f"high_risk_count = (SELECT COUNT(*) FROM transactions WHERE {level_sql} = 'HIGH'), "
+        f"medium_risk_count = (SELECT COUNT(*) FROM transactions WHERE {level_sql} = 'MEDIUM'), "
+        f"low_risk_count = (SELECT COUNT(*) FROM transactions WHERE {level_sql} = 'LOW')"
+    )
+
+
+def upgrade():
+    _recount(LEVEL)
+
+
+def downgrade():
+    # Back to counting by risk_score alone
+    _recount("CASE WHEN risk_score > 80 THEN 'HIGH' WHEN risk_score > 50 THEN 'MEDIUM' ELSE 'LOW' END")
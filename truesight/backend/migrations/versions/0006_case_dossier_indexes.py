@@ -0,0 +1,23 @@
+"""indexes for the case dossier's alert and transaction pages
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_alerts_case_id_id", "alerts", ["case_id", "id"])
+    op.create_index("ix_transactions_case_id_timestamp_id", "transactions", ["case_id", "timestamp", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_transactions_case_id_timestamp_id", table_name="transactions")
+    op.drop_index("ix_alerts_case_id_id", table_name="alerts")
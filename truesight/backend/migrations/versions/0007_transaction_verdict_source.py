@@ -0,0 +1,29 @@
+"""record where each stored verdict came from and the inputs it was given
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("transactions") as batch_op:
+        batch_op.add_column(sa.Column("verdict_source", sa.String(), nullable=True))
+        batch_op.add_column(sa.Column("analysis_features", sa.JSON(), nullable=True))
+
+    # Verdicts stored before this revision have no source, so the classifier does
+    # not train on them: they may be its own or the pre-screen's.
+
+
+def downgrade():
+    with op.batch_alter_table("transactions") as batch_op:
+        batch_op.drop_column("analysis_features")
+        batch_op.drop_column("verdict_source")
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Text, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Text, ForeignKey, Index, JSON
+from sqlalchemy.orm import relationship, column_property
 from database import Base
 from datetime import datetime
 
@@ -45,12 +45,20 @@ class Alert(Base):
     severity = Column(String, default="medium")  # low, medium, high, critical
     description = Column(Text)
     status = Column(String, default="new")  # new, reviewing, escalated, dismissed
-    case_id = Column(Integer, ForeignKey("cases.id"), nullable=True)
+    # active_history: the previous case is known when a row moves (change_versions)
+    case_id = column_property(Column(Integer, ForeignKey("cases.id"), nullable=True), active_history=True)
+    transaction_id = Column(Integer, ForeignKey("transactions.id", name="fk_alerts_transaction_id"), nullable=True, index=True)
     created_by_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
     
     case = relationship("Case", back_populates="alerts")
+    transaction = relationship("Transaction", back_populates="alerts")
     created_by = relationship("User", back_populates="alerts")
+    
+    __table_args__ = (
+        # Case dossier: a case's alerts, newest first (see case_service)
+        Index("ix_alerts_case_id_id", "case_id", "id"),
+    )
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -67,7 +75,41 @@ class Transaction(Base):
     user_account = Column(String)
     risk_score = Column(Float, default=0.0)  # 0-100
     is_flagged = Column(Boolean, default=False)
-    case_id = Column(Integer, ForeignKey("cases.id"), nullable=True)
+    risk_level = Column(String, nullable=True)  # HIGH, MEDIUM, LOW verdict from the analysis
+    explanation = Column(Text, nullable=True)  # analysis explanation for the verdict
+    # Who gave the verdict: llm, analyst, or a stage that reuses earlier verdicts
+    # (prescreen, cache, similar, classifier). The classifier trains on llm/analyst only.
+    verdict_source = Column(String, nullable=True)
+    analysis_features = Column(JSON, nullable=True)  # classifier inputs at analysis time (providers)
+    case_id = column_property(Column(Integer, ForeignKey("cases.id"), nullable=True), active_history=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
     
     case = relationship("Case", back_populates="transactions")
+    alerts = relationship("Alert", back_populates="transaction")
+    
+    __table_args__ = (
+        # Investigation feed: keyset pagination on (timestamp, id), optionally
+        # narrowed by flag status or risk level. The risk filter matches the stored
+        # verdict, or the score bucket of rows without one (stats_service.risk_level_filter).
+        Index("ix_transactions_timestamp_id", "timestamp", "id"),
+        Index("ix_transactions_flagged_timestamp_id", "is_flagged", "timestamp", "id"),
+        Index("ix_transactions_risk_level_score_timestamp_id", "risk_level", "risk_score", "timestamp", "id"),
+        # Case dossier: a case's transactions, newest first
+        Index("ix_transactions_case_id_timestamp_id", "case_id", "timestamp", "id"),
+    )
+
+class TransactionStats(Base):
+    # Single-row summary of the transactions table, kept up to date incrementally
+    # by stats_service so the dashboard never has to scan transactions.
+    __tablename__ = "transaction_stats"
+    
+    id = Column(Integer, primary_key=True)
+    total_count = Column(Integer, default=0, nullable=False)
+    # Counted by the stored verdict, or for rows without one by risk_score
+    # (HIGH > 80, MEDIUM > 50, LOW otherwise); see stats_service.effective_risk_level
+    high_risk_count = Column(Integer, default=0, nullable=False)
+    medium_risk_count = Column(Integer, default=0, nullable=False)
+    low_risk_count = Column(Integer, default=0, nullable=False)
+    processed_transactions = Column(Integer, default=0, nullable=False)  # rows timed by analysis runs
+    processing_seconds = Column(Float, default=0.0, nullable=False)  # total wall time of those runs
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,424 @@
+import os
+import json
+import math
+import logging
+import threading
+import time
+from types import SimpleNamespace
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Scoring providers, selected per run from config['model']:
+#   classifier                 in-process gradient-boosted model trained on stored,
+#                              analyzed transactions (no network)
+#   local:<model>              any OpenAI-compatible server (llama.cpp, vLLM, Ollama)
+#                              at LOCAL_LLM_BASE_URL
+#   fake                       fake_llm, the offline stand-in for tests
+#   anything else              Groq (GROQ_API_KEY, GROQ_BASE_URL)
+# LLM_BACKEND=fake sends every LLM model to fake_llm. Clients are created on first
+# use, not at import, and each provider keeps one client (and its connection pool)
+# for the life of the process.
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq").lower()
+LOCAL_MODEL_PREFIX = "local:"
+CLASSIFIER_MODEL = "classifier"
+
+# Connection pool of each HTTP-based provider
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "32"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "120"))
+
+LOCAL_LLM_BASE_URL = os.getenv("LOCAL_LLM_BASE_URL", "http://localhost:8080/v1")
+LOCAL_LLM_API_KEY = os.getenv("LOCAL_LLM_API_KEY")
+
+# Classifier training: the most recent CLASSIFIER_MAX_TRAINING_ROWS analyzed
+# transactions, refreshed when the model is older than CLASSIFIER_RETRAIN_SECONDS
+CLASSIFIER_MIN_TRAINING_ROWS = int(os.getenv("CLASSIFIER_MIN_TRAINING_ROWS", "50"))
+CLASSIFIER_MAX_TRAINING_ROWS = int(os.getenv("CLASSIFIER_MAX_TRAINING_ROWS", "200000"))
+CLASSIFIER_RETRAIN_SECONDS = float(os.getenv("CLASSIFIER_RETRAIN_SECONDS", "3600"))
+# Rows per batch for the classifier; it has no token budget
+CLASSIFIER_BATCH_ROWS = int(os.getenv("CLASSIFIER_BATCH_ROWS", "5000"))
+
+RISK_LEVELS = ["LOW", "MEDIUM", "HIGH"]
+# Verdict sources the classifier learns from (Transaction.verdict_source). Verdicts
+# of the classifier itself, the pre-screen rules, the cache and the similarity index
+# are left out so retraining never feeds on its own or derived output.
+TRAINING_SOURCES = ["llm", "analyst"]
+# Classifier inputs: the analysis row's risk signals (the ones the pre-screen scores)
+# and its account's feature-store features. Missing values are -1.
+CLASSIFIER_FEATURES = [
+    'amount', 'TMLScore', 'new_beneficiary', 'high_risk_country', 'device_mismatch', 'weak_auth',
+    'velocity_count', 'account_age_days', 'txn_count_1h', 'txn_count_24h', 'txn_count_7d',
+    'amount_sum_24h', 'amount_sum_7d', 'distinct_devices_7d', 'distinct_ips_7d'
+]
+MISSING_FEATURE = -1.0
+
+class ProviderHTTPError(Exception):
+    # Carries status_code / retry_after the way llm_scheduler expects
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+def _namespace(value: Any) -> Any:
+    # JSON -> attribute access, so responses look like the SDK's (choices[0].message.content)
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_namespace(item) for item in value]
+    return value
+
+class _LocalCompletions:
+    def __init__(self, owner: "OpenAICompatibleClient"):
+        self._owner = owner
+
+    def create(self, messages: List[Dict[str, str]], model: str, stream: bool = False, **kwargs):
+        return self._owner.complete(messages, model, stream, **kwargs)
+
+class OpenAICompatibleClient:
+    # Minimal chat.completions.create over httpx for servers speaking the OpenAI API.
+    # One httpx.Client, so connections are kept alive and shared across threads.
+    def __init__(self, base_url: str, api_key: Optional[str] = None):
+        import httpx
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.http = httpx.Client(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=LLM_HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=LLM_HTTP_MAX_CONNECTIONS, max_keepalive_connections=LLM_HTTP_MAX_CONNECTIONS)
+        )
+        self.chat = SimpleNamespace(completions=_LocalCompletions(self))
+
+    def complete(self, messages: List[Dict[str, str]], model: str, stream: bool = False, **kwargs):
+        body = {"model": model, "messages": messages, "stream": stream, **kwargs}
+        if not stream:
+            response = self.http.post("/chat/completions", json=body)
+            self._raise_for_status(response)
+            return _namespace(response.json())
+        request = self.http.build_request("POST", "/chat/completions", json=body)
+        response = self.http.send(request, stream=True)
+        if response.status_code >= 400:
+            response.read()
+            response.close()
+            self._raise_for_status(response)
+        return self._stream_chunks(response)
+
+    def _stream_chunks(self, response) -> Iterator[Any]:
+        # Server-sent events: "data: {...}" lines, ended by "data: [DONE]"
+        try:
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = _namespace(json.loads(data))
+                # Role-only and final chunks leave "content" out of the delta
+                for choice in getattr(chunk, "choices", None) or []:
+                    if not hasattr(choice.delta, "content"):
+                        choice.delta.content = None
+                yield chunk
+        finally:
+            response.close()
+
+    def _raise_for_status(self, response):
+        if response.status_code < 400:
+            return
+        retry_after = response.headers.get("retry-after")
+        try:
+            retry_after = float(retry_after) if retry_after else None
+        except ValueError:
+            retry_after = None
+        raise ProviderHTTPError(
+            f"{response.status_code} from {response.request.url}: {response.text[:200]}",
+            response.status_code,
+            retry_after
+        )
+
+    def close(self):
+        self.http.close()
+
+class LLMProvider:
+    # Chat-completion provider. The client is built by factory() on first access.
+    kind = "llm"
+
+    def __init__(self, name: str, factory):
+        self.name = name
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def model_name(self, model: str) -> str:
+        # What to send as "model" to the API
+        if model.startswith(LOCAL_MODEL_PREFIX):
+            return model[len(LOCAL_MODEL_PREFIX):]
+        return model
+
+    def close(self):
+        close = getattr(self._client, "close", None)
+        if close is not None:
+            close()
+        self._client = None
+
+def _groq_client():
+    import httpx
+    from groq import Groq
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise ValueError("GROQ_API_KEY environment variable is required")
+    # The scheduler does the retrying
+    http_client = httpx.Client(
+        timeout=LLM_HTTP_TIMEOUT,
+        limits=httpx.Limits(max_connections=LLM_HTTP_MAX_CONNECTIONS, max_keepalive_connections=LLM_HTTP_MAX_CONNECTIONS)
+    )
+    return Groq(api_key=api_key, max_retries=0, http_client=http_client)
+
+def _fake_client():
+    import fake_llm
+    return fake_llm.FakeLLMClient.from_env()
+
+def _local_client():
+    return OpenAICompatibleClient(LOCAL_LLM_BASE_URL, LOCAL_LLM_API_KEY)
+
+class GradientBoostedStumps:
+    # Multiclass gradient boosting with depth-1 trees on a softmax loss, with split
+    # points taken from feature quantiles. Used when scikit-learn is not installed;
+    # the model is small (a few features), so stumps do well enough.
+    def __init__(self, n_estimators: int = 100, learning_rate: float = 0.3, max_bins: int = 32):
+        self.n_estimators = n_estimators
+        self.learning_rate = learning_rate
+        self.max_bins = max_bins
+
+    def fit(self, X: np.ndarray, y: np.ndarray) -> "GradientBoostedStumps":
+        self.classes_, labels = np.unique(y, return_inverse=True)
+        n, classes = len(labels), len(self.classes_)
+        targets = np.eye(classes)[labels]
+        prior = targets.mean(axis=0)
+        self.init_ = np.log(np.clip(prior, 1e-6, None))
+        self.stumps_: List[Tuple[int, int, float, float, float]] = []
+
+        # Candidate thresholds per feature, and each row's bin under them
+        self.thresholds_ = [
+            np.unique(np.quantile(X[:, j], np.linspace(0, 1, self.max_bins + 1)[1:-1])) for j in range(X.shape[1])
+        ]
+        bins = [np.searchsorted(thresholds, X[:, j], side="left") for j, thresholds in enumerate(self.thresholds_)]
+
+        scores = np.tile(self.init_, (n, 1))
+        shrink = self.learning_rate * (classes - 1) / classes
+        for _ in range(self.n_estimators):
+            probabilities = _softmax(scores)
+            gradients = targets - probabilities
+            hessians = probabilities * (1 - probabilities)
+            for k in range(classes):
+                best = None
+                for j, thresholds in enumerate(self.thresholds_):
+                    if not len(thresholds):
+                        continue
+                    # Left side of threshold t = rows in bins 0..t
+                    g_left = np.cumsum(np.bincount(bins[j], gradients[:, k], minlength=len(thresholds) + 1))[:-1]
+                    h_left = np.cumsum(np.bincount(bins[j], hessians[:, k], minlength=len(thresholds) + 1))[:-1]
+                    g_right = gradients[:, k].sum() - g_left
+                    h_right = hessians[:, k].sum() - h_left
+                    gain = g_left ** 2 / (h_left + 1e-9) + g_right ** 2 / (h_right + 1e-9)
+                    t = int(np.argmax(gain))
+                    if best is None or gain[t] > best[0]:
+                        best = (gain[t], j, t, g_left[t] / (h_left[t] + 1e-9), g_right[t] / (h_right[t] + 1e-9))
+                if best is None:
+                    continue
+                _, j, t, left_value, right_value = best
+                threshold = float(self.thresholds_[j][t])
+                left_value, right_value = shrink * left_value, shrink * right_value
+                self.stumps_.append((k, j, threshold, left_value, right_value))
+                scores[:, k] += np.where(X[:, j] <= threshold, left_value, right_value)
+        return self
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        scores = np.tile(self.init_, (len(X), 1))
+        for k, j, threshold, left_value, right_value in self.stumps_:
+            scores[:, k] += np.where(X[:, j] <= threshold, left_value, right_value)
+        return _softmax(scores)
+
+def _softmax(scores: np.ndarray) -> np.ndarray:
+    exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+def _make_estimator():
+    try:
+        from sklearn.ensemble import HistGradientBoostingClassifier
+    except ImportError:
+        return GradientBoostedStumps(), "stumps"
+    return HistGradientBoostingClassifier(max_iter=100), "sklearn"
+
+def _yes_no(value: Any, risky: str) -> float:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return MISSING_FEATURE
+    return 1.0 if str(value).strip().lower() == risky else 0.0
+
+def _feature(value: Any) -> float:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return MISSING_FEATURE
+    return number if math.isfinite(number) else MISSING_FEATURE
+
+def classifier_feature_values(txn: Dict[str, Any]) -> Dict[str, float]:
+    # CLASSIFIER_FEATURES of one analysis row (with its feature_store.FEATURES_FIELD,
+    # when enriched). Stored with the verdict, so training sees what scoring sees.
+    import feature_store
+    account = txn.get(feature_store.FEATURES_FIELD) or {}
+    values = {
+        'amount': _feature(txn.get('amount')),
+        'TMLScore': _feature(txn.get('TMLScore')),
+        'new_beneficiary': _yes_no(txn.get('new_beneficiary'), "yes"),
+        'high_risk_country': _yes_no(txn.get('high_risk_country'), "yes"),
+        'device_mismatch': _yes_no(txn.get('device_match'), "no"),
+        'weak_auth': _yes_no(txn.get('auth_strength'), "weak"),
+        'velocity_count': _feature(txn.get('velocity_count')),
+        'account_age_days': _feature(txn.get('account_age_days'))
+    }
+    for name in CLASSIFIER_FEATURES[len(values):]:
+        values[name] = _feature(account.get(name))
+    return values
+
+def classifier_features(rows: List[Dict[str, float]]) -> np.ndarray:
+    # classifier_feature_values dicts -> matrix in CLASSIFIER_FEATURES order
+    return np.array(
+        [[row.get(name, MISSING_FEATURE) for name in CLASSIFIER_FEATURES] for row in rows], dtype=float
+    ).reshape(len(rows), len(CLASSIFIER_FEATURES))
+
+class ClassifierProvider:
+    # Scores batches in-process with a model trained on the LLM and analyst verdicts
+    # already stored in the transactions table (risk_level, with the inputs kept in
+    # analysis_features), so once some history exists, runs need no LLM at all.
+    kind = "classifier"
+
+    def __init__(self, name: str = CLASSIFIER_MODEL):
+        self.name = name
+        self.model = None
+        self.backend = None
+        self.trained_at = 0.0
+        self.training_rows = 0
+        self._lock = threading.Lock()
+
+    def model_name(self, model: str) -> str:
+        return model
+
+    def ensure_trained(self):
+        if self.model is not None and time.time() - self.trained_at < CLASSIFIER_RETRAIN_SECONDS:
+            return
+        with self._lock:
+            if self.model is None or time.time() - self.trained_at >= CLASSIFIER_RETRAIN_SECONDS:
+                from database import SessionLocal
+                db = SessionLocal()
+                try:
+                    self.train(db)
+                finally:
+                    db.close()
+
+    def train(self, db):
+        from sqlalchemy import select
+        import models
+        txn = models.Transaction
+        rows = db.execute(
+            select(txn.amount, txn.risk_score, txn.analysis_features, txn.risk_level)
+            .where(txn.risk_level.in_(RISK_LEVELS), txn.verdict_source.in_(TRAINING_SOURCES))
+            .order_by(txn.id.desc())
+            .limit(CLASSIFIER_MAX_TRAINING_ROWS)
+        ).all()
+        if len(rows) < CLASSIFIER_MIN_TRAINING_ROWS:
+            raise RuntimeError(
+                f"Classifier needs at least {CLASSIFIER_MIN_TRAINING_ROWS} LLM or analyst verdicts to train, found {len(rows)}"
+            )
+        # Rows without stored inputs (e.g. an analyst verdict on an ingested
+        # transaction) contribute amount and TMLScore; stored risk_score is
+        # TMLScore / 10 (see analysis_service.save_results_to_db)
+        X = classifier_features([
+            features or {'amount': _feature(amount), 'TMLScore': _feature(risk_score * 10 if risk_score is not None else None)}
+            for amount, risk_score, features, _ in rows
+        ])
+        y = np.array([row[3] for row in rows])
+        model, backend = _make_estimator()
+        model.fit(X, y)
+        self.model, self.backend = model, backend
+        self.trained_at = time.time()
+        self.training_rows = len(rows)
+        logger.info("Classifier trained on %d transactions (%s)", len(rows), backend)
+
+    def score(self, batch: List[Dict[str, Any]], analyzed_at: str, max_chars: int) -> List[Dict[str, Any]]:
+        self.ensure_trained()
+        amounts = [_as_float(txn.get('amount')) for txn in batch]
+        tml_scores = [_as_float(txn.get('TMLScore')) for txn in batch]
+        probabilities = self.model.predict_proba(classifier_features([classifier_feature_values(txn) for txn in batch]))
+        best = probabilities.argmax(axis=1)
+        results = []
+        for txn, amount, tml_score, k, row in zip(batch, amounts, tml_scores, best, probabilities):
+            risk_level = str(self.model.classes_[k])
+            explanation = (
+                f"Model estimate ({self.backend}, {self.training_rows} past verdicts): {risk_level} "
+                f"p={row[k]:.2f} for amount {amount:.0f}, TMLScore {tml_score:.0f}"
+            )
+            results.append({
+                **txn,
+                'risk_level': risk_level,
+                'explanation': explanation[:max_chars],
+                'analyzed_at': analyzed_at,
+                'source': 'classifier'
+            })
+        return results
+
+    def close(self):
+        pass
+
+def _as_float(value: Any) -> float:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return number if math.isfinite(number) else 0.0
+
+_providers: Dict[str, Any] = {}
+_providers_lock = threading.Lock()
+
+def provider_key(model: str) -> str:
+    if model == CLASSIFIER_MODEL or model.startswith(CLASSIFIER_MODEL + ":"):
+        return "classifier"
+    if LLM_BACKEND == "fake" or model == "fake":
+        return "fake"
+    if model.startswith(LOCAL_MODEL_PREFIX):
+        return "local"
+    return "groq"
+
+def _build_provider(key: str):
+    if key == "classifier":
+        return ClassifierProvider()
+    if key == "fake":
+        return LLMProvider("fake", _fake_client)
+    if key == "local":
+        return LLMProvider("local", _local_client)
+    return LLMProvider("groq", _groq_client)
+
+def get_provider(model: str):
+    key = provider_key(model)
+    provider = _providers.get(key)
+    if provider is None:
+        with _providers_lock:
+            provider = _providers.get(key)
+            if provider is None:
+                provider = _providers[key] = _build_provider(key)
+    return provider
+
+def close_all():
+    # Called on application shutdown; releases HTTP connection pools
+    with _providers_lock:
+        for provider in _providers.values():
+            provider.close()
+        _providers.clear()
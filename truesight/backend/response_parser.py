@@ -0,0 +1,160 @@
+import re
+import json
+from datetime import datetime
+from typing import List, Dict, Any, Iterable, Optional
+
+# Parsing of LLM answers into per-transaction verdicts. One pass over the lines; each
+# line is either a Markdown table row (| ID | Risk | Explanation |) or a JSON object
+# ({"transaction_id": ..., "risk_level": ..., "explanation": ...}), whichever format
+# was asked for, so a model that drifts into the other format is still understood.
+# A row is accepted when its ID resolves against the batch, which makes the header,
+# separator and any chatter around the table harmless.
+
+_RISK_RE = re.compile(r"HIGH|MEDIUM|LOW", re.IGNORECASE)
+# Markdown emphasis, code ticks and quotes models put around IDs: **TXN_1**, `TXN_1`
+_ID_WRAPPING_RE = re.compile(r"^[\s*`'\"]+|[\s*`'\"]+$")
+_CODE_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+
+def normalize_id(raw_id: str) -> str:
+    return _ID_WRAPPING_RE.sub("", raw_id)
+
+def normalize_risk_level(raw: Any) -> str:
+    match = _RISK_RE.search(str(raw or ""))
+    return match.group(0).upper() if match else "UNKNOWN"
+
+class TransactionIndex:
+    # transaction_id -> transaction for one batch. Built once and shared by every
+    # parse of that batch, including the retries for missing rows.
+    def __init__(self, transactions: Iterable[Dict[str, Any]]):
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        for txn in transactions:
+            self.by_id.setdefault(str(txn['transaction_id']), txn)
+        self._by_folded_id: Optional[Dict[str, str]] = None
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def resolve(self, raw_id: str) -> Optional[str]:
+        # Exact match first; then without markup; then case-insensitively
+        if raw_id in self.by_id:
+            return raw_id
+        cleaned = normalize_id(raw_id)
+        if cleaned in self.by_id:
+            return cleaned
+        if self._by_folded_id is None:
+            self._by_folded_id = {txn_id.casefold(): txn_id for txn_id in self.by_id}
+        return self._by_folded_id.get(cleaned.casefold())
+
+class ResponseParser:
+    # Streaming-friendly: feed() takes text as it arrives and returns the rows
+    # completed by that chunk; close() flushes the rest. parse() does both at once.
+    # missing_ids() lists the expected IDs that got no row, in batch order.
+    def __init__(
+        self,
+        index: TransactionIndex,
+        expected_ids: Optional[List[str]] = None,
+        analyzed_at: Optional[str] = None
+    ):
+        self.index = index
+        self.expected_ids = expected_ids if expected_ids is not None else list(index.by_id)
+        self._expected = set(self.expected_ids)
+        self.analyzed_at = analyzed_at or datetime.utcnow().isoformat()
+        self.seen: set = set()
+        self._buffer = ""
+        self._text: List[str] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        self._text.append(text)
+        if "\n" not in text:
+            self._buffer += text
+            return []
+        *lines, self._buffer = (self._buffer + text).split("\n")
+        return self._parse_lines(lines)
+
+    def close(self) -> List[Dict[str, Any]]:
+        remaining, self._buffer = self._buffer, ""
+        results = self._parse_lines([remaining])
+        if not self.seen:
+            # Nothing line-shaped came back; the answer may be one JSON document
+            results.extend(self._parse_json_document("".join(self._text)))
+        return results
+
+    def parse(self, text: str) -> List[Dict[str, Any]]:
+        results = self._parse_lines(text.split("\n"))
+        if not self.seen:
+            results.extend(self._parse_json_document(text))
+        return results
+
+    def missing_ids(self) -> List[str]:
+        return [txn_id for txn_id in self.expected_ids if txn_id not in self.seen]
+
+    def _parse_lines(self, lines: List[str]) -> List[Dict[str, Any]]:
+        results = []
+        for line in lines:
+            line = line.strip()
+            if line.startswith("|"):
+                result = self._parse_table_row(line)
+            elif line.startswith("{"):
+                result = self._parse_json_line(line)
+            else:
+                continue
+            if result is not None:
+                results.append(result)
+        return results
+
+    def _parse_table_row(self, line: str) -> Optional[Dict[str, Any]]:
+        body = line[1:-1] if line.endswith("|") and len(line) > 1 else line[1:]
+        # Only the first two separators split cells, so a '|' inside the
+        # explanation stays part of it
+        cells = body.split("|", 2)
+        if len(cells) < 3:
+            return None
+        return self._accept(cells[0].strip(), cells[1], cells[2].strip())
+
+    def _parse_json_line(self, line: str) -> Optional[Dict[str, Any]]:
+        try:
+            item = json.loads(line.rstrip(","))
+        except ValueError:
+            return None
+        return self._accept_item(item)
+
+    def _parse_json_document(self, text: str) -> List[Dict[str, Any]]:
+        text = _CODE_FENCE_RE.sub("", text.strip())
+        try:
+            document = json.loads(text)
+        except ValueError:
+            return []
+        if isinstance(document, dict):
+            # {"results": [...]} or similar wrapper
+            document = next((value for value in document.values() if isinstance(value, list)), [document])
+        if not isinstance(document, list):
+            return []
+        results = []
+        for item in document:
+            result = self._accept_item(item)
+            if result is not None:
+                results.append(result)
+        return results
+
+    def _accept_item(self, item: Any) -> Optional[Dict[str, Any]]:
+        if not isinstance(item, dict):
+            return None
+        raw_id = item.get("transaction_id", item.get("Transaction_ID", item.get("id")))
+        if raw_id is None:
+            return None
+        explanation = item.get("explanation", item.get("Explanation", ""))
+        return self._accept(str(raw_id), item.get("risk_level", item.get("Risk_Level")), str(explanation or "").strip())
+
+    def _accept(self, raw_id: str, raw_risk: Any, explanation: str) -> Optional[Dict[str, Any]]:
+        # Header and separator rows do not resolve. Rows for IDs outside this request
+        # (answered by an earlier attempt) and repeated rows are ignored.
+        txn_id = self.index.resolve(raw_id)
+        if txn_id is None or txn_id not in self._expected or txn_id in self.seen:
+            return None
+        self.seen.add(txn_id)
+        return {
+            **self.index.by_id[txn_id],
+            'risk_level': normalize_risk_level(raw_risk),
+            'explanation': explanation,
+            'analyzed_at': self.analyzed_at
+        }
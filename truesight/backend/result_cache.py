@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+# Content-addressed cache of LLM verdicts. The key is a hash of the transaction's
+# features (everything except its ID) plus the model settings and prompt version,
+# so re-running the same or overlapping data skips rows that were already scored.
+
+# Fields that are outputs of the analysis rather than inputs to it
+RESULT_FIELDS = {'transaction_id', 'risk_level', 'explanation', 'analyzed_at', 'source'}
+# Inputs the prompt does not include (feature_store.FEATURES_FIELD); they would
+# change the key as account history grows without changing the verdict
+NON_PROMPT_FIELDS = {'account_features'}
+
+def _normalize_value(value: Any) -> Any:
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+def make_cache_key(transaction: Dict[str, Any], model: str, temperature: float, prompt_version: str) -> str:
+    features = {
+        str(k): _normalize_value(v)
+        for k, v in transaction.items()
+        if k not in RESULT_FIELDS and k not in NON_PROMPT_FIELDS
+    }
+    payload = json.dumps(
+        {
+            'features': features,
+            'model': model,
+            'temperature': round(float(temperature), 3),
+            'prompt_version': prompt_version
+        },
+        sort_keys=True,
+        separators=(',', ':'),
+        default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class CacheBackend(ABC):
+    # A backend missing any of these cannot be instantiated
+    name = "base"
+
+    @abstractmethod
+    def get_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def set_many(self, items: Dict[str, Dict[str, Any]]) -> int:
+        # Returns the number of entries evicted to make room
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    @abstractmethod
+    def size(self) -> int:
+        ...
+
+class MemoryCacheBackend(CacheBackend):
+    name = "memory"
+
+    def __init__(self, max_entries: int = 100_000, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        found = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                stored_at, value = entry
+                if self.ttl_seconds and now - stored_at > self.ttl_seconds:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, items: Dict[str, Dict[str, Any]]) -> int:
+        evicted = 0
+        now = time.time()
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (now, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+class SQLiteCacheBackend(CacheBackend):
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int = 1_000_000, ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_result_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_result_cache_accessed ON llm_result_cache (accessed_at)")
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        found = {}
+        now = time.time()
+        min_stored_at = now - self.ttl_seconds if self.ttl_seconds else 0
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM llm_result_cache WHERE key IN ({placeholders}) AND stored_at >= ?",
+                    (*chunk, min_stored_at)
+                ).fetchall()
+                for key, value in rows:
+                    found[key] = json.loads(value)
+            if found:
+                self._conn.executemany(
+                    "UPDATE llm_result_cache SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def set_many(self, items: Dict[str, Dict[str, Any]]) -> int:
+        if not items:
+            return 0
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO llm_result_cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(key, json.dumps(value), now, now) for key, value in items.items()]
+            )
+            evicted = 0
+            if self.ttl_seconds:
+                evicted += self._conn.execute(
+                    "DELETE FROM llm_result_cache WHERE stored_at < ?", (now - self.ttl_seconds,)
+                ).rowcount
+            overflow = self._conn.execute("SELECT COUNT(*) FROM llm_result_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                # Least recently used entries go first
+                evicted += self._conn.execute(
+                    "DELETE FROM llm_result_cache WHERE key IN "
+                    "(SELECT key FROM llm_result_cache ORDER BY accessed_at LIMIT ?)",
+                    (overflow,)
+                ).rowcount
+            self._conn.commit()
+        return evicted
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_result_cache")
+            self._conn.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_result_cache").fetchone()[0]
+
+class ResultCache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def lookup(
+        self,
+        transactions: List[Dict[str, Any]],
+        model: str,
+        temperature: float,
+        prompt_version: str
+    ) -> Tuple[Dict[int, Dict[str, Any]], List[int]]:
+        # Returns ({input index: cached verdict}, [indexes that missed])
+        keys = [make_cache_key(t, model, temperature, prompt_version) for t in transactions]
+        found = self.backend.get_many(list(set(keys)))
+
+        hits = {}
+        missed = []
+        for index, key in enumerate(keys):
+            if key in found:
+                hits[index] = found[key]
+            else:
+                missed.append(index)
+
+        with self._lock:
+            self.hits += len(hits)
+            self.misses += len(missed)
+        return hits, missed
+
+    def store(self, results: List[Dict[str, Any]], model: str, temperature: float, prompt_version: str):
+        items = {
+            make_cache_key(res, model, temperature, prompt_version): {
+                'risk_level': res['risk_level'],
+                'explanation': res['explanation']
+            }
+            for res in results
+            if res.get('risk_level') and res['risk_level'] != "UNKNOWN"
+        }
+        evicted = self.backend.set_many(items)
+        with self._lock:
+            self.stores += len(items)
+            self.evictions += evicted
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.backend.name,
+                "entries": self.backend.size(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions
+            }
+
+_result_cache: Optional[ResultCache] = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache() -> Optional[ResultCache]:
+    # Configured from the environment on first use:
+    #   ANALYSIS_CACHE_BACKEND      memory (default), sqlite or none
+    #   ANALYSIS_CACHE_PATH         file for the sqlite backend
+    #   ANALYSIS_CACHE_TTL_SECONDS  entry lifetime, 0 = no expiry
+    #   ANALYSIS_CACHE_MAX_ENTRIES  LRU capacity
+    global _result_cache
+    if _result_cache is not None:
+        return _result_cache
+
+    with _result_cache_lock:
+        if _result_cache is None:
+            backend_name = os.getenv("ANALYSIS_CACHE_BACKEND", "memory").lower()
+            ttl_seconds = float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(7 * 24 * 3600))) or None
+            max_entries = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "100000"))
+
+            if backend_name == "none":
+                return None
+            if backend_name == "sqlite":
+                path = os.getenv("ANALYSIS_CACHE_PATH", "analysis_cache.sqlite3")
+                backend = SQLiteCacheBackend(path, max_entries=max_entries, ttl_seconds=ttl_seconds)
+            else:
+                backend = MemoryCacheBackend(max_entries=max_entries, ttl_seconds=ttl_seconds)
+            _result_cache = ResultCache(backend)
+    return _result_cache
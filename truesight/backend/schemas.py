@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 # User Schemas
 class UserBase(BaseModel):
@@ -42,6 +42,10 @@ class Case(CaseBase):
     class Config:
         from_attributes = True
 
+class CaseAttachment(BaseModel):
+    # Database ids of the alerts or transactions to attach to a case
+    ids: List[int]
+
 # Alert Schemas
 class AlertBase(BaseModel):
     alert_type: str
@@ -49,12 +53,13 @@ class AlertBase(BaseModel):
     description: Optional[str] = None
 
 class AlertCreate(AlertBase):
-    pass
+    transaction_id: Optional[int] = None
 
 class Alert(AlertBase):
     id: int
     status: str
     case_id: Optional[int] = None
+    transaction_id: Optional[int] = None
     created_by_id: int
     created_at: datetime
     
@@ -80,6 +85,8 @@ class Transaction(TransactionBase):
     id: int
     risk_score: float
     is_flagged: bool
+    risk_level: Optional[str] = None
+    explanation: Optional[str] = None
     case_id: Optional[int] = None
     timestamp: datetime
     
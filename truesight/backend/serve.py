@@ -0,0 +1,71 @@
+import os
+import shutil
+import argparse
+
+# Multi-worker launcher. Run from truesight/backend:
+#
+#   python serve.py                      # one worker per CPU
+#   python serve.py --workers 4 --port 8000
+#
+# Workers are separate processes sharing the listening socket (uvicorn's
+# supervisor). State that has to agree between them goes through the coordination
+# store (see coordination.py): LLM rate limits, the analysis job queue, table
+# versions behind ETags and the stats cache, and the retention lease. Verdicts are
+# cached in SQLite (ANALYSIS_CACHE_BACKEND=sqlite) and Prometheus metrics are summed
+# over all workers. Feature stores and similarity indexes stay per worker (see their
+# modules).
+#
+# Signals to the parent process:
+#   SIGHUP          restart the workers one at a time (new code is loaded; each
+#                   worker finishes its in-flight requests and running jobs first)
+#   SIGTTIN/SIGTTOU one worker more / less
+#   SIGINT/SIGTERM  stop
+#
+# `python main.py` still starts a single process with all state in memory.
+
+DEFAULT_WORKERS = int(os.getenv("WEB_CONCURRENCY", "0")) or os.cpu_count() or 1
+# Seconds a stopping worker waits for in-flight requests before closing them
+GRACEFUL_SHUTDOWN_SECONDS = int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "30"))
+
+def prepare_environment(workers: int):
+    # Defaults the workers inherit; explicit settings win
+    if workers > 1:
+        os.environ.setdefault("COORDINATION_PATH", "truesight_coordination.sqlite3")
+        os.environ.setdefault("ANALYSIS_CACHE_BACKEND", "sqlite")
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "prometheus_multiproc")
+
+def reset_shared_state():
+    # Before any worker starts: metric files and coordination state of a previous
+    # run are cleared, and the schema is created once instead of by every worker
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+    import coordination
+    if coordination.enabled():
+        coordination.get_store().reset()
+    import models  # registers the tables on Base
+    from database import Base, engine
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the TrueSight API with several worker processes")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    prepare_environment(workers)
+    reset_shared_state()
+
+    import uvicorn
+    print(f"Starting {workers} worker(s) on {args.host}:{args.port}")
+    uvicorn.run(
+        "main:app", host=args.host, port=args.port, workers=workers,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+import os
+import re
+import json
+import math
+import logging
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+import coordination
+
+logger = logging.getLogger(__name__)
+
+# Nearest-neighbour reuse of LLM verdicts. Every transaction the LLM has classified
+# is stored as a unit feature vector with its verdict; a new row whose closest
+# neighbours (cosine similarity) are near-identical and agree on the risk level is
+# given that verdict instead of going to the LLM, with the neighbour it came from
+# recorded as provenance. This catches the near-duplicates the exact-match
+# result_cache misses (same category and flags, slightly different amount).
+#
+# Search is brute force (batched matrix products) until the index holds
+# SIMILARITY_IVF_MIN_ROWS vectors; from then on vectors are grouped around k-means
+# centroids (IVF) and a query only scans the lists of its nprobe closest centroids.
+# There is one index per model, saved under SIMILARITY_INDEX_DIR. With several API
+# workers each indexes the verdicts it produced, and on shutdown merges them into
+# the saved file, so the next start sees all of them.
+
+SIMILARITY_INDEX_DIR = os.getenv("SIMILARITY_INDEX_DIR", "similarity_index")
+SIMILARITY_MAX_ENTRIES = int(os.getenv("SIMILARITY_MAX_ENTRIES", "1000000"))
+SIMILARITY_IVF_MIN_ROWS = int(os.getenv("SIMILARITY_IVF_MIN_ROWS", "100000"))
+# Queries x index rows scored per matrix product in brute-force search
+QUERY_BATCH_ROWS = 1024
+SEARCH_BLOCK_ROWS = 16384
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_ROWS = 50000
+
+# Overridable per run via config['similarity']
+DEFAULT_SIMILARITY_CONFIG = {
+    'enabled': True,
+    'minSimilarity': 0.995,  # cosine similarity a neighbour needs to count
+    'neighbors': 5,          # neighbours looked at per row
+    'minNeighbors': 1,       # close neighbours required; they must all agree on the risk level
+    'nprobe': 8              # IVF lists scanned per query
+}
+
+RISK_LEVELS = ["LOW", "MEDIUM", "HIGH"]
+MERCHANT_CATEGORIES = ["Retail", "E-commerce", "International", "Services"]
+AUTH_STRENGTHS = ["Weak", "Medium", "Strong"]
+FEATURE_DIM = 7 + len(AUTH_STRENGTHS) + len(MERCHANT_CATEGORIES) + 1 + 2
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+def _scaled(value: Any, upper: float, log: bool = False) -> float:
+    # [0, upper] -> [-1, 1]; missing -> 0
+    number = _number(value)
+    if number is None:
+        return 0.0
+    if log:
+        number, upper = math.log1p(max(number, 0.0)), math.log1p(upper)
+    return 2.0 * min(max(number / upper, 0.0), 1.0) - 1.0
+
+def _yes_no(value: Any) -> float:
+    text = str(value).strip().lower() if value is not None else ""
+    if text in ("yes", "true", "1"):
+        return 1.0
+    if text in ("no", "false", "0"):
+        return -1.0
+    return 0.0
+
+def vectorize(txn: Dict[str, Any]) -> np.ndarray:
+    # Fixed-layout vector of the fields analysis rows carry; missing fields are
+    # neutral (0). TMLScore counts double, as it does in the prompt's instructions.
+    vector = np.zeros(FEATURE_DIM, dtype=np.float32)
+    vector[0] = _scaled(txn.get('amount'), 50000, log=True)
+    vector[1] = 2.0 * _scaled(txn.get('TMLScore'), 999)
+    vector[2] = _scaled(txn.get('account_age_days'), 365)
+    vector[3] = _scaled(txn.get('velocity_count'), 20)
+    vector[4] = _yes_no(txn.get('new_beneficiary'))
+    vector[5] = _yes_no(txn.get('high_risk_country'))
+    vector[6] = _yes_no(txn.get('device_match'))
+    offset = 7
+    if txn.get('auth_strength') in AUTH_STRENGTHS:
+        vector[offset + AUTH_STRENGTHS.index(txn['auth_strength'])] = 1.0
+    offset += len(AUTH_STRENGTHS)
+    category = txn.get('merchant_category')
+    if category:
+        position = MERCHANT_CATEGORIES.index(category) if category in MERCHANT_CATEGORIES else len(MERCHANT_CATEGORIES)
+        vector[offset + position] = 1.0
+    offset += len(MERCHANT_CATEGORIES) + 1
+    match = re.match(r"^(\d{1,2}):(\d{2})", str(txn.get('time_of_day') or ""))
+    if match:
+        angle = 2 * math.pi * (int(match.group(1)) * 60 + int(match.group(2))) / 1440
+        vector[offset] = 0.5 * math.sin(angle)
+        vector[offset + 1] = 0.5 * math.cos(angle)
+    return vector
+
+def vectorize_many(transactions: List[Dict[str, Any]]) -> np.ndarray:
+    if not transactions:
+        return np.zeros((0, FEATURE_DIM), dtype=np.float32)
+    return _normalize(np.stack([vectorize(txn) for txn in transactions]))
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+def _top_k(similarities: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Per row: the k largest values and their column positions, best first
+    k = min(k, similarities.shape[1])
+    if k == 0:
+        return np.zeros((len(similarities), 0), dtype=np.float32), np.zeros((len(similarities), 0), dtype=np.int64)
+    part = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(similarities, part, axis=1)
+    order = np.argsort(-values, axis=1)
+    return np.take_along_axis(values, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+class SimilarityIndex:
+    def __init__(self, capacity: int = SIMILARITY_MAX_ENTRIES):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.vectors = np.zeros((0, FEATURE_DIM), dtype=np.float32)
+        self.labels = np.zeros(0, dtype=np.int8)
+        self.transaction_ids: List[str] = []
+        self.explanations: List[str] = []
+        self.analyzed_at: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self.inserted = 0  # total ever inserted; once full, new entries replace the oldest
+        # IVF state
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self._trained_size = 0
+        self._lists: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self.transaction_ids)
+
+    def add(self, results: List[Dict[str, Any]]) -> int:
+        # Adds analyzed rows (transaction fields + risk_level + explanation).
+        # Rows without a definite verdict, or already indexed, are skipped.
+        rows = [
+            res for res in results
+            if res.get('risk_level') in RISK_LEVELS and str(res['transaction_id']) not in self._positions
+        ]
+        if not rows:
+            return 0
+        vectors = vectorize_many(rows)
+        with self._lock:
+            added = 0
+            for res, vector in zip(rows, vectors):
+                txn_id = str(res['transaction_id'])
+                if txn_id in self._positions:
+                    continue
+                self._append(txn_id, vector, RISK_LEVELS.index(res['risk_level']), res.get('explanation') or "", res.get('analyzed_at') or "")
+                added += 1
+            self._after_add()
+            return added
+
+    def merge(self, other: "SimilarityIndex") -> int:
+        # Adds the entries of another index that this one does not have
+        with self._lock:
+            added = 0
+            for position, txn_id in enumerate(other.transaction_ids):
+                if txn_id in self._positions:
+                    continue
+                self._append(txn_id, other.vectors[position], int(other.labels[position]), other.explanations[position], other.analyzed_at[position])
+                added += 1
+            self._after_add()
+            return added
+
+    def _after_add(self):
+        self._lists = None
+        if len(self) >= SIMILARITY_IVF_MIN_ROWS and (self.centroids is None or len(self) >= 2 * self._trained_size):
+            self._train_ivf()
+
+    def _append(self, txn_id: str, vector: np.ndarray, label: int, explanation: str, analyzed_at: str):
+        if len(self) < self.capacity:
+            position = len(self)
+            if position >= len(self.vectors):
+                self._grow()
+            self.transaction_ids.append(txn_id)
+            self.explanations.append(explanation)
+            self.analyzed_at.append(analyzed_at)
+        else:
+            position = self.inserted % self.capacity
+            del self._positions[self.transaction_ids[position]]
+            self.transaction_ids[position] = txn_id
+            self.explanations[position] = explanation
+            self.analyzed_at[position] = analyzed_at
+        self.vectors[position] = vector
+        self.labels[position] = label
+        if self.centroids is not None:
+            self.assignments[position] = int(np.argmax(self.centroids @ vector))
+        self._positions[txn_id] = position
+        self.inserted += 1
+
+    def _grow(self):
+        size = min(self.capacity, max(1024, len(self.vectors) * 2))
+        vectors = np.zeros((size, FEATURE_DIM), dtype=np.float32)
+        vectors[:len(self.vectors)] = self.vectors
+        labels = np.zeros(size, dtype=np.int8)
+        labels[:len(self.labels)] = self.labels
+        assignments = np.zeros(size, dtype=np.int32)
+        assignments[:len(self.assignments)] = self.assignments
+        self.vectors, self.labels, self.assignments = vectors, labels, assignments
+
+    def _train_ivf(self):
+        # Spherical k-means on a sample, then every vector goes to its closest centroid
+        size = len(self)
+        lists = max(1, int(math.sqrt(size)))
+        rng = np.random.default_rng(0)
+        sample = self.vectors[rng.choice(size, min(size, max(KMEANS_SAMPLE_ROWS, lists * 4)), replace=False)]
+        centroids = sample[rng.choice(len(sample), lists, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+        self.centroids = centroids.astype(np.float32)
+        for start in range(0, size, SEARCH_BLOCK_ROWS):
+            block = self.vectors[start:start + SEARCH_BLOCK_ROWS][:size - start]
+            self.assignments[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        self._trained_size = size
+        self._lists = None
+        logger.info("Similarity index: IVF with %d lists over %d vectors", lists, size)
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        # (row positions grouped by list, start offset of each list), rebuilt after adds
+        if self._lists is None:
+            assignments = self.assignments[:len(self)]
+            order = np.argsort(assignments, kind="stable")
+            bounds = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, bounds)
+        return self._lists
+
+    def search(self, queries: np.ndarray, k: int, nprobe: int = DEFAULT_SIMILARITY_CONFIG['nprobe']) -> Tuple[np.ndarray, np.ndarray]:
+        # (similarities, positions), each (len(queries), k), best first; position -1
+        # and similarity -inf where fewer than k vectors were reachable
+        values, positions = [], []
+        with self._lock:
+            for start in range(0, max(len(queries), 1), QUERY_BATCH_ROWS):
+                batch = queries[start:start + QUERY_BATCH_ROWS]
+                if self.centroids is None:
+                    batch_values, batch_positions = self._search_brute_force(batch, k)
+                else:
+                    batch_values, batch_positions = self._search_ivf(batch, k, nprobe)
+                values.append(batch_values)
+                positions.append(batch_positions)
+        return np.concatenate(values), np.concatenate(positions)
+
+    def _search_brute_force(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        size = len(self)
+        best_values = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_positions = np.full((len(queries), k), -1, dtype=np.int64)
+        for start in range(0, size, SEARCH_BLOCK_ROWS):
+            block = self.vectors[start:min(size, start + SEARCH_BLOCK_ROWS)]
+            values, positions = _top_k(queries @ block.T, k)
+            merged_values = np.concatenate([best_values, values], axis=1)
+            merged_positions = np.concatenate([best_positions, positions + start], axis=1)
+            best_values, order = _top_k(merged_values, k)
+            best_positions = np.take_along_axis(merged_positions, order, axis=1)
+        return best_values, best_positions
+
+    def _search_ivf(self, queries: np.ndarray, k: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        nprobe = max(1, min(nprobe, len(self.centroids)))
+        _, probes = _top_k(queries @ self.centroids.T, nprobe)
+        order, bounds = self._inverted_lists()
+        candidate_values = np.full((len(queries), nprobe * k), -np.inf, dtype=np.float32)
+        candidate_positions = np.full((len(queries), nprobe * k), -1, dtype=np.int64)
+        # One matrix product per probed list, covering every query that probes it
+        for centroid in np.unique(probes):
+            members = order[bounds[centroid]:bounds[centroid + 1]]
+            query_rows, slots = np.nonzero(probes == centroid)
+            if not len(members):
+                continue
+            values, positions = _top_k(queries[query_rows] @ self.vectors[members].T, k)
+            columns = slots[:, None] * k + np.arange(values.shape[1])
+            candidate_values[query_rows[:, None], columns] = values
+            candidate_positions[query_rows[:, None], columns] = members[positions]
+        best_values, best = _top_k(candidate_values, k)
+        return best_values, np.take_along_axis(candidate_positions, best, axis=1)
+
+    def match(self, transactions: List[Dict[str, Any]], config: Dict[str, Any], analyzed_at: str) -> Dict[int, Dict[str, Any]]:
+        # {position in transactions: reused result} for rows with confident neighbours
+        if not transactions or not len(self):
+            return {}
+        k = max(1, int(config['neighbors']))
+        min_neighbors = max(1, int(config['minNeighbors']))
+        values, positions = self.search(vectorize_many(transactions), k, int(config['nprobe']))
+        matches = {}
+        close = values >= float(config['minSimilarity'])
+        for row in np.flatnonzero(close.sum(axis=1) >= min_neighbors):
+            neighbours = positions[row][close[row]]
+            labels = self.labels[neighbours]
+            if (labels != labels[0]).any():
+                continue
+            nearest = int(neighbours[0])
+            matches[int(row)] = {
+                **transactions[row],
+                'risk_level': RISK_LEVELS[int(labels[0])],
+                'explanation': self.explanations[nearest],
+                'analyzed_at': analyzed_at,
+                'similar_to': self.transaction_ids[nearest],
+                'similarity': round(float(values[row][0]), 4),
+                'similar_neighbors': int(close[row].sum())
+            }
+        return matches
+
+    def save(self, path: str):
+        with self._lock:
+            size = len(self)
+            state = {
+                'vectors': self.vectors[:size],
+                'labels': self.labels[:size],
+                'transaction_ids': np.array(self.transaction_ids, dtype=str),
+                'explanations': np.array(self.explanations, dtype=str),
+                'analyzed_at': np.array(self.analyzed_at, dtype=str),
+                'assignments': self.assignments[:size],
+                'meta': np.array(json.dumps({'inserted': self.inserted, 'trained_size': self._trained_size, 'dim': FEATURE_DIM}))
+            }
+            if self.centroids is not None:
+                state['centroids'] = self.centroids
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(temp_path, **state)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str, capacity: int = SIMILARITY_MAX_ENTRIES) -> "SimilarityIndex":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('dim') != FEATURE_DIM:
+                raise ValueError(f"Similarity index {path} has {meta.get('dim')} features, expected {FEATURE_DIM}")
+            index = cls(capacity=max(capacity, len(data['labels'])))
+            size = len(data['labels'])
+            index.vectors = np.zeros((max(size, 1024), FEATURE_DIM), dtype=np.float32)
+            index.vectors[:size] = data['vectors']
+            index.labels = np.zeros(len(index.vectors), dtype=np.int8)
+            index.labels[:size] = data['labels']
+            index.assignments = np.zeros(len(index.vectors), dtype=np.int32)
+            index.assignments[:size] = data['assignments']
+            index.transaction_ids = data['transaction_ids'].tolist()
+            index.explanations = data['explanations'].tolist()
+            index.analyzed_at = data['analyzed_at'].tolist()
+            index.centroids = data['centroids'] if 'centroids' in data else None
+        index._positions = {txn_id: position for position, txn_id in enumerate(index.transaction_ids)}
+        index.inserted = meta['inserted']
+        index._trained_size = meta['trained_size']
+        return index
+
+_indexes: Dict[str, SimilarityIndex] = {}
+_indexes_lock = threading.Lock()
+
+def index_path(model: str, base_dir: str = SIMILARITY_INDEX_DIR) -> str:
+    return os.path.join(base_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", model) + ".npz")
+
+def get_index(model: str) -> SimilarityIndex:
+    # Loaded from disk on first use if a saved index exists
+    index = _indexes.get(model)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(model)
+            if index is None:
+                path = index_path(model)
+                index = SimilarityIndex()
+                if SIMILARITY_INDEX_DIR and os.path.exists(path):
+                    try:
+                        index = SimilarityIndex.load(path)
+                    except (OSError, ValueError, KeyError) as e:
+                        logger.warning("Ignoring unreadable similarity index %s: %s", path, e)
+                _indexes[model] = index
+    return index
+
+@contextmanager
+def _file_lock(path: str):
+    # Exclusive lock between worker processes; not needed (and not available) elsewhere
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(f"{path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def save_all():
+    # Called on application shutdown
+    if not SIMILARITY_INDEX_DIR:
+        return
+    with _indexes_lock:
+        for model, index in _indexes.items():
+            if not len(index):
+                continue
+            path = index_path(model)
+            if not coordination.enabled():
+                index.save(path)
+                continue
+            os.makedirs(SIMILARITY_INDEX_DIR, exist_ok=True)
+            with _file_lock(path):
+                if os.path.exists(path):
+                    try:
+                        index.merge(SimilarityIndex.load(path))
+                    except (OSError, ValueError, KeyError) as e:
+                        logger.warning("Overwriting unreadable similarity index %s: %s", path, e)
+                index.save(path)
+
+def stats() -> Dict[str, Any]:
+    return {
+        model: {"entries": len(index), "inserted": index.inserted, "ivf_lists": 0 if index.centroids is None else len(index.centroids)}
+        for model, index in _indexes.items()
+    }
@@ -0,0 +1,215 @@
+import os
+import time
+import threading
+from typing import Dict, Any, Iterable, Optional
+from datetime import datetime
+from sqlalchemy import func, case, select, insert, update, and_, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+import models
+import change_versions
+
+# Dashboard statistics. Counts live in the single-row transaction_stats table and are
+# incremented in the same DB transaction as the inserts they describe, so reading
+# them is one primary-key lookup instead of COUNT(*) scans.
+STATS_ROW_ID = 1
+# Reads are served from memory for this long, or until transaction_stats changes
+# (in any worker; see change_versions)
+STATS_CACHE_TTL_SECONDS = float(os.getenv("STATS_CACHE_TTL_SECONDS", "5"))
+
+# Risk buckets used by the dashboard and investigation views (risk_score is 0-100)
+HIGH_RISK_SCORE = 80
+MEDIUM_RISK_SCORE = 50
+
+_cached_stats: Optional[Dict[str, Any]] = None
+_cached_at = 0.0
+_cached_version = 0
+_cache_lock = threading.Lock()
+
+def risk_level_for_score(risk_score: float) -> str:
+    if risk_score > HIGH_RISK_SCORE:
+        return "HIGH"
+    if risk_score > MEDIUM_RISK_SCORE:
+        return "MEDIUM"
+    return "LOW"
+
+def effective_risk_level(risk_level: Optional[str], risk_score: Optional[float]) -> str:
+    # The level users see: the stored verdict, or the score-derived level for rows
+    # saved before verdicts were stored (or without an analysis)
+    return risk_level or risk_level_for_score(risk_score or 0.0)
+
+def _score_bucket(level: str):
+    # risk_level_for_score as a range predicate on risk_score
+    score = models.Transaction.risk_score
+    if level == "HIGH":
+        return score > HIGH_RISK_SCORE
+    if level == "MEDIUM":
+        return and_(score > MEDIUM_RISK_SCORE, score <= HIGH_RISK_SCORE)
+    return score <= MEDIUM_RISK_SCORE
+
+def risk_level_expression():
+    # effective_risk_level in SQL
+    return func.coalesce(models.Transaction.risk_level, case(
+        (_score_bucket("HIGH"), "HIGH"),
+        (_score_bucket("MEDIUM"), "MEDIUM"),
+        else_="LOW"
+    ))
+
+def risk_level_filter(levels: Iterable[str]):
+    # risk_level_expression() IN levels, spelled out so both branches are ranges of
+    # ix_transactions_risk_level_score_timestamp_id instead of a per-row expression
+    levels = list(levels)
+    txn = models.Transaction
+    return or_(
+        txn.risk_level.in_(levels),
+        and_(txn.risk_level.is_(None), or_(*[_score_bucket(level) for level in levels]))
+    )
+
+def compute_stats(db: Session) -> Dict[str, int]:
+    # One pass over transactions with conditional counts, by the level users see
+    level = risk_level_expression()
+    row = db.execute(
+        select(
+            func.count(models.Transaction.id),
+            func.count(case((level == "HIGH", 1))),
+            func.count(case((level == "MEDIUM", 1))),
+            func.count(case((level == "LOW", 1)))
+        )
+    ).one()
+    return {
+        "total_count": row[0],
+        "high_risk_count": row[1],
+        "medium_risk_count": row[2],
+        "low_risk_count": row[3]
+    }
+
+def _insert_stats_row(db: Session, counts: Dict[str, int]) -> bool:
+    # Creates the summary row unless it exists; False if it already did. ON CONFLICT
+    # DO NOTHING so workers or requests racing to create it cannot both insert id=1.
+    values = dict(
+        id=STATS_ROW_ID, processed_transactions=0, processing_seconds=0.0,
+        updated_at=datetime.utcnow(), **counts
+    )
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = pg_insert(models.TransactionStats).values(**values).on_conflict_do_nothing(index_elements=["id"])
+    elif dialect == "sqlite":
+        stmt = sqlite_insert(models.TransactionStats).values(**values).on_conflict_do_nothing(index_elements=["id"])
+    else:
+        if db.get(models.TransactionStats, STATS_ROW_ID) is not None:
+            return False
+        stmt = insert(models.TransactionStats).values(**values)
+    return db.execute(stmt).rowcount > 0
+
+def ensure_stats_row(db: Session):
+    # Called at startup, so the increments below always find the row. Existing
+    # transactions are counted into it the first time.
+    if db.get(models.TransactionStats, STATS_ROW_ID) is None:
+        _insert_stats_row(db, compute_stats(db))
+        db.commit()
+        invalidate_cache()
+
+def rebuild_stats(db: Session) -> models.TransactionStats:
+    # Recounts from the transactions table to repair the counters. Processing-time
+    # totals are kept.
+    counts = compute_stats(db)
+    if not _insert_stats_row(db, counts):
+        db.execute(
+            update(models.TransactionStats)
+            .where(models.TransactionStats.id == STATS_ROW_ID)
+            .values(updated_at=datetime.utcnow(), **counts)
+        )
+    db.commit()
+    invalidate_cache()
+    return db.get(models.TransactionStats, STATS_ROW_ID, populate_existing=True)
+
+def _increment(db: Session, values: Dict[str, Any], counted_by_seed: bool):
+    # Increments happen in SQL, so concurrent writers do not lose updates. Should
+    # the row be missing (a database the startup hook has not seen), it is created
+    # here; counted_by_seed says whether counting the table for it already covers
+    # this change (rows inserted earlier in the caller's transaction).
+    stmt = (
+        update(models.TransactionStats)
+        .where(models.TransactionStats.id == STATS_ROW_ID)
+        .values(updated_at=datetime.utcnow(), **values)
+    )
+    if db.execute(stmt).rowcount:
+        return
+    if not (_insert_stats_row(db, compute_stats(db)) and counted_by_seed):
+        db.execute(stmt)
+
+def record_transactions(db: Session, rows: Iterable[Dict[str, Any]]):
+    # Adds newly inserted transactions (dicts with risk_level and/or risk_score) to
+    # the counters. Call after the inserts and before the caller's commit so the
+    # counters and the rows land together.
+    high = medium = low = 0
+    for row in rows:
+        level = effective_risk_level(row.get('risk_level'), row.get('risk_score'))
+        if level == "HIGH":
+            high += 1
+        elif level == "MEDIUM":
+            medium += 1
+        else:
+            low += 1
+    total = high + medium + low
+    if not total:
+        return
+    stats = models.TransactionStats
+    _increment(db, {
+        "total_count": stats.total_count + total,
+        "high_risk_count": stats.high_risk_count + high,
+        "medium_risk_count": stats.medium_risk_count + medium,
+        "low_risk_count": stats.low_risk_count + low
+    }, counted_by_seed=True)
+    invalidate_cache()
+
+def record_processing(db: Session, seconds: float, transaction_count: int):
+    # Records the wall time of one analysis run for the avg_processing figure
+    if transaction_count <= 0:
+        return
+    stats = models.TransactionStats
+    _increment(db, {
+        "processed_transactions": stats.processed_transactions + transaction_count,
+        "processing_seconds": stats.processing_seconds + seconds
+    }, counted_by_seed=False)
+    db.commit()
+    invalidate_cache()
+
+def get_stats(db: Session) -> Dict[str, Any]:
+    global _cached_stats, _cached_at, _cached_version
+    version = change_versions.version("transaction_stats")
+    with _cache_lock:
+        if (
+            _cached_stats is not None and _cached_version == version
+            and time.monotonic() - _cached_at < STATS_CACHE_TTL_SECONDS
+        ):
+            return _cached_stats
+
+    stats = db.get(models.TransactionStats, STATS_ROW_ID)
+    if stats is None:
+        ensure_stats_row(db)
+        stats = db.get(models.TransactionStats, STATS_ROW_ID)
+
+    # Average analysis wall time per transaction, in seconds
+    avg_processing = 0.0
+    if stats.processed_transactions:
+        avg_processing = round(stats.processing_seconds / stats.processed_transactions, 3)
+
+    result = {
+        "total_analyzed": stats.total_count,
+        "high_risk": stats.high_risk_count,
+        "medium_risk": stats.medium_risk_count,
+        "low_risk": stats.low_risk_count,
+        "avg_processing": avg_processing
+    }
+    with _cache_lock:
+        _cached_stats = result
+        _cached_at = time.monotonic()
+        _cached_version = version
+    return result
+
+def invalidate_cache():
+    global _cached_stats
+    with _cache_lock:
+        _cached_stats = None
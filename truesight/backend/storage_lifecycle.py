@@ -0,0 +1,275 @@
+import os
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+import pandas as pd
+from sqlalchemy import select, delete, func, exists, and_
+from sqlalchemy.orm import Session
+import models
+import stats_service
+
+logger = logging.getLogger(__name__)
+
+# Hot/cold lifecycle for transactions. The hot table is treated as a series of
+# monthly partitions on `timestamp`; the retention job moves rows older than
+# HOT_RETENTION_DAYS to compressed Parquet files, one directory per month
+# (COLD_STORAGE_DIR/transactions/month=YYYY-MM/), and deletes them from the table.
+# The cold read path queries those files with pyarrow, pruning by month.
+#
+# Rows that an investigation still points at (an alert or a case) stay hot, so
+# foreign keys never dangle. The same constraint is why this is done in the
+# application rather than with PostgreSQL declarative partitioning: a partitioned
+# transactions table would need (id, timestamp) as its primary key and could no
+# longer enforce transaction_id uniqueness on its own or be the target of the
+# alerts.transaction_id foreign key. The month boundaries used here line up with
+# what native partitions would be, so the move can be made later.
+#
+# Dashboard counters (transaction_stats) are all-time figures and are not reduced
+# by archiving.
+
+HOT_RETENTION_DAYS = int(os.getenv("HOT_RETENTION_DAYS", "90"))
+COLD_STORAGE_DIR = os.getenv("COLD_STORAGE_DIR", "cold_storage")
+# Rows read, written and deleted per step of the retention job
+ARCHIVE_BATCH_ROWS = int(os.getenv("ARCHIVE_BATCH_ROWS", "50000"))
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+MAX_COLD_ROWS = 10000
+
+COLD_COLUMNS = [
+    'id', 'transaction_id', 'amount', 'currency', 'transaction_type', 'merchant', 'location',
+    'ip_address', 'device_id', 'user_account', 'risk_score', 'is_flagged', 'risk_level',
+    'explanation', 'case_id', 'timestamp'
+]
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.dataset
+    except ImportError:
+        raise ValueError("Cold storage requires the pyarrow package")
+    return pyarrow
+
+def _cold_schema(pa):
+    # Fixed column types: a batch whose risk_level (or another optional column) is
+    # all NULL would otherwise be written with type null and fail string filters
+    string, real = pa.string(), pa.float64()
+    types = {
+        'id': pa.int64(), 'amount': real, 'risk_score': real, 'is_flagged': pa.bool_(),
+        'case_id': pa.int64(), 'timestamp': pa.timestamp("us")
+    }
+    return pa.schema([(column, types.get(column, string)) for column in COLD_COLUMNS])
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+def next_month(value: datetime) -> datetime:
+    return datetime(value.year + 1, 1, 1) if value.month == 12 else datetime(value.year, value.month + 1, 1)
+
+def month_label(value: datetime) -> str:
+    return value.strftime("%Y-%m")
+
+def _month_expression(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.to_char(func.date_trunc("month", models.Transaction.timestamp), "YYYY-MM")
+    return func.strftime("%Y-%m", models.Transaction.timestamp)
+
+def hot_partitions(db: Session) -> List[Dict[str, Any]]:
+    # Rows per month in the hot table, oldest first
+    month = _month_expression(db).label("month")
+    rows = db.execute(
+        select(month, func.count()).select_from(models.Transaction).group_by(month).order_by(month)
+    ).all()
+    return [{"month": row[0], "rows": row[1]} for row in rows if row[0]]
+
+def cold_partitions(base_dir: str = COLD_STORAGE_DIR) -> List[Dict[str, Any]]:
+    root = os.path.join(base_dir, "transactions")
+    if not os.path.isdir(root):
+        return []
+    pa = _pyarrow()
+    partitions = []
+    for name in sorted(os.listdir(root)):
+        if not name.startswith("month="):
+            continue
+        files = sorted(
+            os.path.join(root, name, file_name)
+            for file_name in os.listdir(os.path.join(root, name)) if file_name.endswith(".parquet")
+        )
+        partitions.append({
+            "month": name[len("month="):],
+            "files": len(files),
+            "rows": sum(pa.parquet.ParquetFile(path).metadata.num_rows for path in files),
+            "bytes": sum(os.path.getsize(path) for path in files)
+        })
+    return partitions
+
+def _archivable(start: datetime, end: datetime):
+    # Rows in [start, end) that no alert or case refers to
+    return and_(
+        models.Transaction.timestamp >= start,
+        models.Transaction.timestamp < end,
+        models.Transaction.case_id.is_(None),
+        ~exists().where(models.Alert.transaction_id == models.Transaction.id)
+    )
+
+def archive_month(db: Session, start: datetime, cutoff: datetime, base_dir: str = COLD_STORAGE_DIR) -> int:
+    # Moves the archivable rows of the month starting at `start` (and older than
+    # cutoff) to Parquet, ARCHIVE_BATCH_ROWS at a time. Each batch is written to its
+    # file before its rows are deleted and committed, so a crash in between leaves a
+    # row in both tiers, never in neither; read_cold drops such duplicates.
+    pa = _pyarrow()
+    end = min(next_month(start), cutoff)
+    directory = os.path.join(base_dir, "transactions", f"month={month_label(start)}")
+    columns = [getattr(models.Transaction, column) for column in COLD_COLUMNS]
+    archived = 0
+    while True:
+        rows = db.execute(
+            select(*columns).where(_archivable(start, end)).order_by(models.Transaction.id).limit(ARCHIVE_BATCH_ROWS)
+        ).all()
+        if not rows:
+            return archived
+        frame = pd.DataFrame.from_records(rows, columns=COLD_COLUMNS)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{int(time.time() * 1000)}-{int(frame['id'].iloc[0])}.parquet")
+        temp_path = f"{path}.tmp"
+        table = pa.Table.from_pandas(frame, schema=_cold_schema(pa), preserve_index=False)
+        pa.parquet.write_table(table, temp_path, compression=PARQUET_COMPRESSION)
+        os.replace(temp_path, path)
+
+        ids = frame['id'].tolist()
+        try:
+            db.execute(delete(models.Transaction).where(models.Transaction.id.in_(ids)))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        archived += len(ids)
+
+def run_retention(db: Session, days: int = HOT_RETENTION_DAYS, base_dir: str = COLD_STORAGE_DIR) -> Dict[str, Any]:
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    started = time.perf_counter()
+    months = []
+    for partition in hot_partitions(db):
+        start = datetime.strptime(partition["month"], "%Y-%m")
+        if start >= cutoff:
+            break
+        archived = archive_month(db, start, cutoff, base_dir)
+        months.append({"month": partition["month"], "archived": archived, "kept": partition["rows"] - archived})
+        if archived:
+            logger.info("Retention: archived %d transactions from %s", archived, partition['month'])
+    return {
+        "cutoff": cutoff.isoformat(),
+        "archived": sum(month["archived"] for month in months),
+        "months": months,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+def _cold_months(root: str, start: Optional[datetime], end: Optional[datetime]) -> List[str]:
+    # Month directories that can hold rows in [start, end), newest first
+    months = []
+    for name in sorted(os.listdir(root), reverse=True):
+        if not name.startswith("month="):
+            continue
+        month = datetime.strptime(name[len("month="):], "%Y-%m")
+        if end is not None and month >= end:
+            continue
+        if start is not None and next_month(month) <= start:
+            continue
+        months.append(os.path.join(root, name))
+    return months
+
+def _top_rows(frame: pd.DataFrame, limit: int) -> pd.DataFrame:
+    frame = frame.drop_duplicates(subset="transaction_id")
+    return frame.sort_values(["timestamp", "id"], ascending=False).head(limit)
+
+def _read_month(directory: str, condition, limit: int) -> pd.DataFrame:
+    # The newest `limit` matching rows of one month. Batches are folded into the
+    # running top rows as they are read, so memory stays at about limit + a batch.
+    pa = _pyarrow()
+    files = sorted(
+        os.path.join(directory, file_name)
+        for file_name in os.listdir(directory) if file_name.endswith(".parquet")
+    )
+    if not files:
+        return pd.DataFrame(columns=COLD_COLUMNS)
+    scanner = pa.dataset.dataset(files, schema=_cold_schema(pa), format="parquet").scanner(columns=COLD_COLUMNS, filter=condition)
+    top = None
+    for batch in scanner.to_batches():
+        if batch.num_rows == 0:
+            continue
+        frame = batch.to_pandas()
+        top = _top_rows(frame if top is None else pd.concat([top, frame], ignore_index=True), limit)
+    return top if top is not None else pd.DataFrame(columns=COLD_COLUMNS)
+
+def read_cold(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user_account: Optional[str] = None,
+    transaction_id: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    risk_levels: Optional[List[str]] = None,
+    limit: int = 1000,
+    base_dir: str = COLD_STORAGE_DIR
+) -> pd.DataFrame:
+    # Archived transactions matching the filters, newest first. The time range is
+    # [start, end), as in the hot feed (investigation_service.build_feed_query), so
+    # a query returns the same rows before and after they are archived. The other
+    # filters are pushed into the Parquet scan.
+    #
+    # Month directories are read newest first and the walk stops once `limit` rows
+    # are found: every row of a month is newer than every row of the months before
+    # it, so older months cannot change the result.
+    pa = _pyarrow()
+    ds = pa.dataset
+    root = os.path.join(base_dir, "transactions")
+    if not os.path.isdir(root):
+        return pd.DataFrame(columns=COLD_COLUMNS)
+    limit = max(1, min(limit, MAX_COLD_ROWS))
+
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("timestamp") >= pa.scalar(start, type=pa.timestamp("us")))
+    if end is not None:
+        conditions.append(ds.field("timestamp") < pa.scalar(end, type=pa.timestamp("us")))
+    if user_account is not None:
+        conditions.append(ds.field("user_account") == user_account)
+    if transaction_id is not None:
+        conditions.append(ds.field("transaction_id") == transaction_id)
+    if min_amount is not None:
+        conditions.append(ds.field("amount") >= min_amount)
+    if risk_levels:
+        # Same rule as the hot feed: the stored verdict, else the score bucket
+        score = ds.field("risk_score")
+        buckets = {
+            "HIGH": score > stats_service.HIGH_RISK_SCORE,
+            "MEDIUM": (score > stats_service.MEDIUM_RISK_SCORE) & (score <= stats_service.HIGH_RISK_SCORE),
+            "LOW": score <= stats_service.MEDIUM_RISK_SCORE
+        }
+        by_score = None
+        for level in risk_levels:
+            by_score = buckets[level] if by_score is None else by_score | buckets[level]
+        conditions.append(ds.field("risk_level").isin(risk_levels) | (ds.field("risk_level").is_null() & by_score))
+    condition = None
+    for part in conditions:
+        condition = part if condition is None else condition & part
+
+    frames = []
+    found = 0
+    for directory in _cold_months(root, start, end):
+        frame = _read_month(directory, condition, limit - found)
+        if len(frame):
+            frames.append(frame)
+            found += len(frame)
+        if found >= limit:
+            break
+    if not frames:
+        return pd.DataFrame(columns=COLD_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+def serialize_cold_frame(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    frame = frame.astype(object).where(frame.notna(), None)
+    records = frame.to_dict(orient="records")
+    for record in records:
+        if record['timestamp'] is not None:
+            record['timestamp'] = pd.Timestamp(record['timestamp']).isoformat()
+    return records
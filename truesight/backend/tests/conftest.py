@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+
+# Settings are read at import time, so they are fixed before any backend module
+# is imported: a throwaway SQLite database, no feature store file, the fake LLM
+# and in-memory caches
+_work_dir = tempfile.mkdtemp(prefix="truesight-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_work_dir, 'test.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["FEATURE_STORE_PATH"] = ""
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["ANALYSIS_CACHE_BACKEND"] = "memory"
+os.environ["COORDINATION_PATH"] = ""
+os.environ["SIMILARITY_INDEX_DIR"] = os.path.join(_work_dir, "similarity")
+os.environ["COLD_STORAGE_DIR"] = os.path.join(_work_dir, "cold_storage")
+os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+# bench_data's sample generator is shared with the benchmarks
+sys.path.insert(1, os.path.join(BACKEND_DIR, "benchmarks"))
+
+import pytest
+import models
+from database import Base, engine, SessionLocal
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
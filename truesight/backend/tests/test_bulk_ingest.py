@@ -0,0 +1,63 @@
+import pytest
+import models
+import stats_service
+import transaction_service
+
+@pytest.fixture(autouse=True)
+def fresh_stats_cache():
+    stats_service.invalidate_cache()
+
+def row(txn_id, amount=100.0, **fields):
+    return {'transaction_id': txn_id, 'amount': amount, **fields}
+
+def test_each_row_gets_a_status(db):
+    items = [
+        row("A", 20000.0, location="Suspicious Alley"),
+        row("B"),
+        {'amount': 5.0},
+        row("A"),
+        row("C", "lots"),
+        transaction_service.parse_ndjson_line(b"{not json")
+    ]
+    statuses = transaction_service.ingest_chunk(db, items, first_index=10)
+
+    assert [s["index"] for s in statuses] == list(range(10, 16))
+    assert [s["status"] for s in statuses] == ["created", "created", "invalid", "duplicate", "invalid", "invalid"]
+    assert (statuses[0]["risk_score"], statuses[0]["is_flagged"]) == (70.0, True)
+    assert (statuses[1]["risk_score"], statuses[1]["is_flagged"]) == (0.0, False)
+    assert statuses[2]["transaction_id"] is None
+    assert any(message.startswith("transaction_id") for message in statuses[2]["errors"])
+    assert statuses[4]["transaction_id"] == "C"
+    assert statuses[4]["errors"][0].startswith("amount")
+    assert statuses[5]["errors"][0].startswith("Invalid JSON")
+    assert {t.transaction_id for t in db.query(models.Transaction)} == {"A", "B"}
+
+def test_rows_already_stored_are_duplicates(db):
+    transaction_service.ingest_chunk(db, [row("A"), row("B")])
+    statuses = transaction_service.ingest_chunk(db, [row("B"), row("C")])
+    assert [s["status"] for s in statuses] == ["duplicate", "created"]
+    assert db.query(models.Transaction).count() == 3
+
+def test_created_rows_are_counted_in_the_stats(db):
+    stats_service.ensure_stats_row(db)
+    transaction_service.ingest_chunk(db, [row("A", 20000.0, location="suspicious"), row("B"), row("B")])
+    stats = stats_service.get_stats(db)
+    assert (stats["total_analyzed"], stats["medium_risk"], stats["low_risk"]) == (2, 1, 1)
+
+def test_summary_counts_and_rows():
+    statuses = [
+        {"index": 0, "transaction_id": "A", "status": "created"},
+        {"index": 1, "transaction_id": "A", "status": "duplicate"},
+        {"index": 2, "transaction_id": None, "status": "invalid", "errors": ["row: bad"]}
+    ]
+    summary = transaction_service.summarize(statuses, include_rows=False)
+    assert (summary["received"], summary["created"], summary["duplicates"], summary["invalid"]) == (3, 1, 1, 1)
+    assert [s["index"] for s in summary["rows"]] == [1, 2]
+    assert transaction_service.summarize(statuses)["rows"] == statuses
+
+def test_ndjson_and_json_bodies():
+    assert list(transaction_service.iter_ndjson(b'{"a": 1}\n\n{"a": 2}\n')) == [{"a": 1}, {"a": 2}]
+    assert transaction_service.parse_json_body(b'{"transactions": [{"a": 1}]}') == [{"a": 1}]
+    with pytest.raises(ValueError):
+        transaction_service.parse_json_body(b'{"rows": []}')
+    assert [len(chunk) for chunk in transaction_service.iter_chunks(range(7), chunk_rows=3)] == [3, 3, 1]
@@ -0,0 +1,121 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert
+import models
+import case_service
+from database import AsyncSessionLocal, async_engine
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    case_service._cache.clear()
+    yield
+    case_service._cache.clear()
+
+def run(coroutine_fn, *args, **kwargs):
+    # One event loop per call; the async engine's connections are closed before it ends
+    async def main():
+        try:
+            async with AsyncSessionLocal() as session:
+                return await coroutine_fn(session, *args, **kwargs)
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(main())
+
+def dossier(case_id, **kwargs):
+    return run(case_service.get_dossier, case_id, **kwargs)
+
+@pytest.fixture
+def cases(db):
+    first = models.Case(case_number="CASE-1", title="First")
+    second = models.Case(case_number="CASE-2", title="Second")
+    db.add_all([first, second])
+    db.flush()
+    for i in range(3):
+        db.add(models.Transaction(
+            transaction_id=f"TXN_{i}", amount=100.0 * (i + 1), risk_score=90.0,
+            case_id=first.id, timestamp=datetime(2024, 3, 1) + timedelta(hours=i)
+        ))
+    db.add(models.Alert(alert_type="suspicious_transaction", severity="high", case_id=first.id))
+    db.commit()
+    return first, second
+
+def test_dossier_totals_and_pages(db, cases):
+    first, _ = cases
+    for i in range(4):
+        db.add(models.Alert(alert_type="unusual_pattern", severity="low", case_id=first.id))
+    db.commit()
+
+    result = dossier(first.id, limit=2, alerts_limit=3)
+    assert result["case"]["case_number"] == "CASE-1"
+    assert result["totals"]["transaction_count"] == 3
+    assert result["totals"]["amount_sum"] == 600.0
+    assert result["totals"]["risk_distribution"] == {"LOW": 0, "MEDIUM": 0, "HIGH": 3}
+    assert result["totals"]["alert_count"] == 5
+    assert result["totals"]["alert_severity"] == {"high": 1, "low": 4}
+    assert [t["transaction_id"] for t in result["transactions"]["items"]] == ["TXN_2", "TXN_1"]
+    assert len(result["alerts"]["items"]) == 3
+
+    rest = dossier(first.id, limit=2, cursor=result["transactions"]["next_cursor"],
+                   alerts_limit=3, alerts_cursor=result["alerts"]["next_cursor"])
+    assert [t["transaction_id"] for t in rest["transactions"]["items"]] == ["TXN_0"]
+    assert len(rest["alerts"]["items"]) == 2
+    assert rest["alerts"]["next_cursor"] is None
+    all_alerts = result["alerts"]["items"] + rest["alerts"]["items"]
+    assert len({alert["id"] for alert in all_alerts}) == 5
+
+def test_missing_case_and_bad_cursor(db, cases):
+    with pytest.raises(case_service.CaseNotFound):
+        dossier(999)
+    with pytest.raises(ValueError):
+        dossier(cases[0].id, alerts_cursor="bogus")
+
+def test_unchanged_case_is_served_from_cache(db, cases):
+    first, _ = cases
+    assert dossier(first.id) is dossier(first.id)
+
+def test_verdict_change_invalidates_the_dossier(db, cases):
+    first, _ = cases
+    assert dossier(first.id)["totals"]["risk_distribution"]["LOW"] == 0
+    txn = db.query(models.Transaction).filter_by(transaction_id="TXN_0").one()
+    txn.risk_level = "LOW"
+    db.commit()
+    assert dossier(first.id)["totals"]["risk_distribution"]["LOW"] == 1
+
+def test_new_alert_invalidates_the_dossier(db, cases):
+    first, _ = cases
+    assert dossier(first.id)["totals"]["alert_count"] == 1
+    db.add(models.Alert(alert_type="unusual_pattern", severity="low", case_id=first.id))
+    db.commit()
+    assert dossier(first.id)["totals"]["alert_count"] == 2
+    # Inserted by statement rather than through the unit of work
+    db.execute(insert(models.Alert), [{"alert_type": "unusual_pattern", "severity": "low", "case_id": first.id}])
+    db.commit()
+    assert dossier(first.id)["totals"]["alert_count"] == 3
+
+def test_moving_a_row_invalidates_both_cases(db, cases):
+    first, second = cases
+    assert dossier(first.id)["totals"]["transaction_count"] == 3
+    assert dossier(second.id)["totals"]["transaction_count"] == 0
+    txn = db.query(models.Transaction).filter_by(transaction_id="TXN_0").one()
+    txn.case_id = second.id
+    db.commit()
+    assert dossier(first.id)["totals"]["transaction_count"] == 2
+    assert dossier(second.id)["totals"]["transaction_count"] == 1
+
+def test_case_edit_invalidates_the_dossier(db, cases):
+    first, _ = cases
+    assert dossier(first.id)["case"]["status"] == "open"
+    first.status = "investigating"
+    db.commit()
+    assert dossier(first.id)["case"]["status"] == "investigating"
+
+def test_attach_invalidates_old_and_new_case(db, cases):
+    first, second = cases
+    txn_id = db.query(models.Transaction).filter_by(transaction_id="TXN_1").one().id
+    assert dossier(first.id)["totals"]["transaction_count"] == 3
+    assert dossier(second.id)["totals"]["transaction_count"] == 0
+    result = run(case_service.attach_transactions, second.id, [txn_id, 999])
+    assert (result["attached"], result["missing"]) == ([txn_id], [999])
+    assert dossier(first.id)["totals"]["transaction_count"] == 2
+    assert dossier(second.id)["totals"]["transaction_count"] == 1
@@ -0,0 +1,58 @@
+import pytest
+import models
+import providers
+import analysis_service
+
+@pytest.fixture(autouse=True)
+def small_training_set(monkeypatch):
+    monkeypatch.setattr(providers, "CLASSIFIER_MIN_TRAINING_ROWS", 10)
+
+def verdict(i, source, risk_level):
+    return {
+        'transaction_id': f"{source.upper()}_{i:03d}",
+        'amount': 100.0 + i,
+        'TMLScore': 900 if risk_level == "HIGH" else 50,
+        'new_beneficiary': "Yes" if risk_level == "HIGH" else "No",
+        'auth_strength': "Weak",
+        'account_features': {'txn_count_24h': 7, 'distinct_devices_7d': 2},
+        'risk_level': risk_level,
+        'explanation': "",
+        'source': source
+    }
+
+def test_feature_values_include_flags_and_account_features():
+    values = providers.classifier_feature_values(verdict(0, "llm", "HIGH"))
+    assert set(values) == set(providers.CLASSIFIER_FEATURES)
+    assert values['TMLScore'] == 900.0
+    assert values['new_beneficiary'] == 1.0
+    assert values['weak_auth'] == 1.0
+    assert values['txn_count_24h'] == 7.0
+    # Signals the row does not have are marked missing, not treated as clean
+    assert values['device_mismatch'] == providers.MISSING_FEATURE
+    assert values['txn_count_1h'] == providers.MISSING_FEATURE
+
+def test_saved_verdicts_keep_their_source_and_inputs(db):
+    analysis_service.save_results_to_db([verdict(0, "prescreen", "LOW")], db)
+    row = db.query(models.Transaction).one()
+    assert row.verdict_source == "prescreen"
+    assert row.analysis_features['txn_count_24h'] == 7.0
+
+def test_training_uses_only_llm_and_analyst_verdicts(db):
+    results = [verdict(i, "llm", "HIGH" if i % 2 else "LOW") for i in range(12)]
+    results += [verdict(i, source, "HIGH") for source in ("prescreen", "classifier", "cache", "similar") for i in range(20)]
+    analysis_service.save_results_to_db(results, db)
+    db.add(models.Transaction(transaction_id="ANALYST_1", amount=10.0, risk_score=5.0, risk_level="LOW", verdict_source="analyst"))
+    db.add(models.Transaction(transaction_id="LEGACY_1", amount=10.0, risk_score=95.0, risk_level="HIGH"))
+    db.commit()
+
+    provider = providers.ClassifierProvider()
+    provider.train(db)
+    assert provider.training_rows == 13
+    scored = provider.score([verdict(99, "llm", "HIGH"), verdict(98, "llm", "LOW")], "now", 200)
+    assert [res['risk_level'] for res in scored] == ["HIGH", "LOW"]
+    assert all(res['source'] == "classifier" for res in scored)
+
+def test_training_needs_enough_trusted_verdicts(db):
+    analysis_service.save_results_to_db([verdict(i, "prescreen", "LOW") for i in range(50)], db)
+    with pytest.raises(RuntimeError):
+        providers.ClassifierProvider().train(db)
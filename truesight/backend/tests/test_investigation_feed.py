@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+import pytest
+import models
+import investigation_service
+import storage_lifecycle
+
+BASE_TIME = datetime(2024, 3, 1)
+
+@pytest.fixture
+def feed_rows(db):
+    # 30 rows an hour apart; every third pair shares a timestamp so the cursor has
+    # to break ties on id
+    rows = []
+    for i in range(30):
+        rows.append(models.Transaction(
+            transaction_id=f"TXN_{i:03d}",
+            amount=float(100 * i),
+            risk_score=[10.0, 60.0, 90.0][i % 3],
+            # Some rows carry a verdict that disagrees with their score bucket
+            risk_level=["HIGH", None, "LOW", None, None][i % 5],
+            is_flagged=i % 4 == 0,
+            timestamp=BASE_TIME + timedelta(hours=i - i % 2)
+        ))
+    db.add_all(rows)
+    db.commit()
+    return rows
+
+def read_all(db, limit, **filters):
+    items = []
+    cursor = None
+    while True:
+        page = investigation_service.get_feed(db, limit=limit, cursor=cursor, **filters)
+        items.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items
+
+def test_cursor_pages_through_every_row_once_newest_first(db, feed_rows):
+    items = read_all(db, limit=7)
+    assert len(items) == 30
+    assert len({item["id"] for item in items}) == 30
+    keys = [(item["timestamp"], int(item["id"][4:])) for item in items]
+    assert keys == sorted(keys, reverse=True)
+
+def test_cursor_round_trip_and_malformed_cursor():
+    timestamp = datetime(2024, 3, 1, 12, 30, 15, 123456)
+    assert investigation_service.decode_cursor(investigation_service.encode_cursor(timestamp, 42)) == (timestamp, 42)
+    with pytest.raises(ValueError):
+        investigation_service.decode_cursor("not-a-cursor")
+
+def test_risk_filter_matches_the_displayed_level(db, feed_rows):
+    shown = {item["id"]: item["risk"] for item in read_all(db, limit=100)}
+    for level in investigation_service.RISK_LEVELS:
+        filtered = read_all(db, limit=4, risk_levels=[level])
+        assert filtered
+        assert {item["id"] for item in filtered} == {txn_id for txn_id, risk in shown.items() if risk == level}
+    both = read_all(db, limit=100, risk_levels=investigation_service.parse_risk_levels("high, low"))
+    assert {item["risk"] for item in both} == {"HIGH", "LOW"}
+
+def test_unknown_risk_level_is_rejected():
+    with pytest.raises(ValueError):
+        investigation_service.parse_risk_levels("HIGH,SEVERE")
+
+def test_flag_amount_and_time_filters(db, feed_rows):
+    flagged = read_all(db, limit=100, flagged=True)
+    assert {item["id"] for item in flagged} == {t.transaction_id for t in feed_rows if t.is_flagged}
+    in_range = read_all(db, limit=100, min_amount=500.0, max_amount=1000.0)
+    assert sorted(item["amount"] for item in in_range) == [100.0 * i for i in range(5, 11)]
+    # The range is half-open: rows at `end` are excluded
+    start, end = BASE_TIME + timedelta(hours=4), BASE_TIME + timedelta(hours=10)
+    window = read_all(db, limit=100, start=start, end=end)
+    assert {item["timestamp"] for item in window} == {BASE_TIME + timedelta(hours=h) for h in (4, 6, 8)}
+
+def test_cold_reads_use_the_same_range_and_risk_rules(db, feed_rows, tmp_path):
+    start, end = BASE_TIME + timedelta(hours=4), BASE_TIME + timedelta(hours=20)
+    hot = {
+        level: {item["id"] for item in read_all(db, limit=100, start=start, end=end, risk_levels=[level])}
+        for level in investigation_service.RISK_LEVELS
+    }
+    assert storage_lifecycle.archive_month(db, datetime(2024, 3, 1), datetime(2024, 4, 1), base_dir=str(tmp_path)) == 30
+    for level, ids in hot.items():
+        cold = storage_lifecycle.read_cold(start=start, end=end, risk_levels=[level], base_dir=str(tmp_path))
+        assert set(cold["transaction_id"]) == ids
@@ -0,0 +1,161 @@
+import pytest
+import llm_scheduler
+from llm_scheduler import TokenBucket, CircuitBreaker, CircuitOpenError, LLMScheduler
+
+class FakeClock:
+    # Stands in for time.monotonic / time.sleep; sleeping advances the clock
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_scheduler.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(llm_scheduler.time, "sleep", clock.sleep)
+    return clock
+
+class ProviderError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+def test_bucket_starts_full_and_then_waits_for_refill(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.slept == []
+    bucket.acquire()
+    assert clock.slept == [pytest.approx(1.0)]
+
+def test_bucket_refill_is_capped_at_capacity(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    bucket.acquire(2)
+    clock.now += 600
+    bucket.acquire(2)
+    bucket.acquire(1)
+    assert sum(clock.slept) == pytest.approx(1.0)
+
+def test_oversized_request_waits_for_a_full_bucket_and_leaves_debt(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=10)
+    bucket.acquire(5)
+    bucket.acquire(25)
+    assert sum(clock.slept) == pytest.approx(5.0)
+    assert bucket.available == pytest.approx(-15)
+
+def test_bucket_adjust_charges_real_usage(clock):
+    bucket = TokenBucket(rate_per_minute=600, capacity=100)
+    bucket.acquire(50)
+    bucket.adjust(30)
+    assert bucket.available == pytest.approx(20)
+    bucket.adjust(-10)
+    assert bucket.available == pytest.approx(30)
+
+def test_breaker_opens_after_threshold_and_fails_fast(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+def test_breaker_half_open_allows_one_trial(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock.now += 31
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert (breaker.state, breaker.failures) == ("closed", 0)
+    breaker.before_call()
+
+def test_failed_trial_reopens_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 31
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+def test_released_trial_keeps_half_open(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock.now += 31
+    breaker.before_call()
+    breaker.release_trial()
+    assert breaker.state == "half_open"
+    breaker.before_call()
+
+def test_scheduler_retries_transient_errors(clock):
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=0, max_attempts=3, base_delay=0.01)
+    outcomes = [ProviderError(503), ProviderError(429, retry_after=2.0), "ok"]
+    def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    assert scheduler.call(call) == "ok"
+    # Retry-After is a floor for the backoff
+    assert clock.slept[1] >= 2.0
+    # Only the 503 counts against the breaker, and the success resets it
+    assert (scheduler.breaker.state, scheduler.breaker.failures) == ("closed", 0)
+
+def test_scheduler_does_not_retry_client_errors(clock):
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=0, max_attempts=3)
+    calls = []
+    def call():
+        calls.append(1)
+        raise ProviderError(400)
+    with pytest.raises(ProviderError):
+        scheduler.call(call)
+    assert len(calls) == 1
+    assert scheduler.breaker.failures == 0
+
+def test_scheduler_reconciles_reported_usage(clock):
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=600)
+    class Usage:
+        total_tokens = 40
+    class Completion:
+        usage = Usage()
+    scheduler.call(lambda: Completion(), estimated_tokens=100)
+    assert scheduler.token_bucket.available == pytest.approx(600 - 40)
+
+def test_streamed_call_is_reconciled_once_drained(clock):
+    from fake_llm import FakeLLMClient
+    client = FakeLLMClient()
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=6000)
+    prompt = "TRANSACTIONS DATA\ntransaction_id|TMLScore\nT1|900\nT2|100\n"
+    stream = scheduler.call(
+        lambda: client.chat.completions.create(messages=[{"role": "user", "content": prompt}], stream=True),
+        estimated_tokens=1000
+    )
+    # Nothing is known until the stream is drained; the estimate stands
+    assert scheduler.token_bucket.available == pytest.approx(6000 - 1000)
+    usage = None
+    for chunk in stream:
+        usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+    scheduler.reconcile_tokens(usage, 1000)
+    assert usage is not None
+    assert scheduler.token_bucket.available == pytest.approx(6000 - usage.total_tokens)
+
+def test_stream_without_usage_keeps_the_estimate(clock):
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=600)
+    scheduler.call(lambda: iter(()), estimated_tokens=100)
+    scheduler.reconcile_tokens(None, 100)
+    assert scheduler.token_bucket.available == pytest.approx(500)
@@ -0,0 +1,73 @@
+import json
+from response_parser import TransactionIndex, ResponseParser, normalize_risk_level
+
+TRANSACTIONS = [
+    {'transaction_id': "TXN_1", 'amount': 100},
+    {'transaction_id': "TXN_2", 'amount': 200},
+    {'transaction_id': "TXN_3", 'amount': 300}
+]
+
+def parser(expected_ids=None):
+    return ResponseParser(TransactionIndex(TRANSACTIONS), expected_ids, analyzed_at="2024-01-01T00:00:00")
+
+def verdicts(results):
+    return {r['transaction_id']: (r['risk_level'], r['explanation']) for r in results}
+
+def test_markdown_table():
+    text = (
+        "Here is the analysis:\n"
+        "| Transaction_ID | Risk_Level | Explanation |\n"
+        "|---|---|---|\n"
+        "| TXN_1 | 🔴 HIGH | New beneficiary | weak auth |\n"
+        "| **TXN_2** | 🟢 low | Known device |\n"
+        "| txn_3 | 🟡 Medium | Mid TMLScore |\n"
+    )
+    results = parser().parse(text)
+    assert verdicts(results) == {
+        "TXN_1": ("HIGH", "New beneficiary | weak auth"),
+        "TXN_2": ("LOW", "Known device"),
+        "TXN_3": ("MEDIUM", "Mid TMLScore")
+    }
+    # Verdicts carry the original transaction
+    assert results[0]['amount'] == 100
+
+def test_json_lines():
+    text = "\n".join([
+        json.dumps({"transaction_id": "TXN_1", "risk_level": "HIGH", "explanation": "a"}) + ",",
+        "not json",
+        json.dumps({"id": "TXN_2", "Risk_Level": "LOW", "Explanation": "b"})
+    ])
+    assert verdicts(parser().parse(text)) == {"TXN_1": ("HIGH", "a"), "TXN_2": ("LOW", "b")}
+
+def test_json_document_fallback():
+    document = {"results": [
+        {"transaction_id": "TXN_1", "risk_level": "MEDIUM", "explanation": "a"},
+        {"transaction_id": "TXN_3", "risk_level": "HIGH", "explanation": "c"}
+    ]}
+    text = "```json\n" + json.dumps(document, indent=2) + "\n```"
+    assert verdicts(parser().parse(text)) == {"TXN_1": ("MEDIUM", "a"), "TXN_3": ("HIGH", "c")}
+
+def test_missing_rows_are_reported_in_batch_order():
+    p = parser()
+    p.parse("| TXN_2 | HIGH | x |")
+    assert p.missing_ids() == ["TXN_1", "TXN_3"]
+
+def test_unknown_repeated_and_unexpected_rows_are_ignored():
+    p = parser(expected_ids=["TXN_2", "TXN_3"])
+    results = p.parse("| TXN_9 | HIGH | x |\n| TXN_1 | HIGH | x |\n| TXN_2 | LOW | first |\n| TXN_2 | HIGH | again |")
+    assert verdicts(results) == {"TXN_2": ("LOW", "first")}
+    assert p.missing_ids() == ["TXN_3"]
+
+def test_streamed_chunks_match_a_single_parse():
+    text = "| TXN_1 | HIGH | a |\n| TXN_2 | LOW | b |\n| TXN_3 | MEDIUM | c |"
+    p = parser()
+    results = []
+    for start in range(0, len(text), 7):
+        results.extend(p.feed(text[start:start + 7]))
+    results.extend(p.close())
+    assert verdicts(results) == verdicts(parser().parse(text))
+
+def test_unrecognized_risk_level():
+    assert normalize_risk_level("🟠 ELEVATED") == "UNKNOWN"
+    assert normalize_risk_level(None) == "UNKNOWN"
+    assert verdicts(parser().parse("| TXN_1 | ? | unsure |")) == {"TXN_1": ("UNKNOWN", "unsure")}
@@ -0,0 +1,87 @@
+import pytest
+import result_cache
+from result_cache import CacheBackend, MemoryCacheBackend, SQLiteCacheBackend, ResultCache, make_cache_key
+
+MODEL = "test-model"
+TXN = {
+    'transaction_id': "TXN001",
+    'amount': 250.0,
+    'merchant': "Corner Shop ",
+    'location': "London",
+    'risk_level': None
+}
+
+def key(txn, temperature=0.0, prompt_version="v1"):
+    return make_cache_key(txn, MODEL, temperature, prompt_version)
+
+def test_cache_key_ignores_transaction_id_and_results():
+    other = {**TXN, 'transaction_id': "TXN999", 'risk_level': "HIGH", 'explanation': "x", 'analyzed_at': "now"}
+    assert key(other) == key(TXN)
+
+def test_cache_key_normalizes_values():
+    assert key({**TXN, 'amount': 250, 'merchant': "Corner Shop"}) == key(TXN)
+
+def test_cache_key_ignores_account_features():
+    assert key({**TXN, 'account_features': {'txn_count_30d': 12}}) == key(TXN)
+
+def test_cache_key_changes_with_features_and_settings():
+    base = key(TXN)
+    assert key({**TXN, 'amount': 251.0}) != base
+    assert key(TXN, temperature=0.5) != base
+    assert key(TXN, prompt_version="v2") != base
+    assert make_cache_key(TXN, "other-model", 0.0, "v1") != base
+
+def test_backend_must_implement_every_method():
+    class Partial(CacheBackend):
+        def get_many(self, keys):
+            return {}
+
+    with pytest.raises(TypeError):
+        Partial()
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(max_entries=2)
+    assert backend.set_many({"a": {'v': 1}, "b": {'v': 2}}) == 0
+    # Reading "a" makes "b" the oldest entry
+    assert backend.get_many(["a"]) == {"a": {'v': 1}}
+    assert backend.set_many({"c": {'v': 3}}) == 1
+    assert set(backend.get_many(["a", "b", "c"])) == {"a", "c"}
+    assert backend.size() == 2
+
+def test_memory_backend_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "time", lambda: now[0])
+    backend = MemoryCacheBackend(ttl_seconds=60)
+    backend.set_many({"a": {'v': 1}})
+    now[0] += 61
+    assert backend.get_many(["a"]) == {}
+    assert backend.size() == 0
+
+def test_sqlite_backend_evicts_least_recently_used(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "time", lambda: now[0])
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    backend.set_many({"a": {'v': 1}})
+    now[0] += 1
+    backend.set_many({"b": {'v': 2}})
+    now[0] += 1
+    backend.get_many(["a"])
+    now[0] += 1
+    assert backend.set_many({"c": {'v': 3}}) == 1
+    assert set(backend.get_many(["a", "b", "c"])) == {"a", "c"}
+
+def test_result_cache_lookup_and_store():
+    cache = ResultCache(MemoryCacheBackend())
+    results = [
+        {**TXN, 'risk_level': "HIGH", 'explanation': "Large amount"},
+        {**TXN, 'transaction_id': "TXN002", 'amount': 5.0, 'risk_level': "UNKNOWN", 'explanation': ""}
+    ]
+    cache.store(results, MODEL, 0.0, "v1")
+    # UNKNOWN verdicts are not cached
+    assert cache.stats()["entries"] == 1
+
+    hits, missed = cache.lookup([{**TXN, 'transaction_id': "TXN003"}, results[1]], MODEL, 0.0, "v1")
+    assert hits == {0: {'risk_level': "HIGH", 'explanation': "Large amount"}}
+    assert missed == [1]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
@@ -0,0 +1,71 @@
+import pytest
+import models
+import stats_service
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    stats_service.invalidate_cache()
+    yield
+    stats_service.invalidate_cache()
+
+def add_transactions(db, rows):
+    for i, row in enumerate(rows):
+        db.add(models.Transaction(transaction_id=f"TXN_{len(rows)}_{i}", amount=100.0, **row))
+    db.flush()
+    stats_service.record_transactions(db, rows)
+    db.commit()
+
+def counts(db):
+    stats = stats_service.get_stats(db)
+    return stats["total_analyzed"], stats["high_risk"], stats["medium_risk"], stats["low_risk"]
+
+def test_effective_risk_level_prefers_the_verdict():
+    assert stats_service.effective_risk_level("LOW", 95.0) == "LOW"
+    assert stats_service.effective_risk_level(None, 95.0) == "HIGH"
+    assert stats_service.effective_risk_level(None, 80.0) == "MEDIUM"
+    assert stats_service.effective_risk_level(None, 50.0) == "LOW"
+    assert stats_service.effective_risk_level(None, None) == "LOW"
+
+def test_ensure_stats_row_counts_existing_transactions(db):
+    db.add_all([
+        models.Transaction(transaction_id="A", amount=1.0, risk_score=90.0),
+        models.Transaction(transaction_id="B", amount=1.0, risk_score=90.0, risk_level="LOW"),
+        models.Transaction(transaction_id="C", amount=1.0, risk_score=60.0)
+    ])
+    db.commit()
+    stats_service.ensure_stats_row(db)
+    assert counts(db) == (3, 1, 1, 1)
+    # A second call leaves the row alone
+    stats_service.ensure_stats_row(db)
+    assert counts(db) == (3, 1, 1, 1)
+
+def test_increments_follow_the_stored_verdict(db):
+    stats_service.ensure_stats_row(db)
+    add_transactions(db, [
+        {'risk_score': 95.0},
+        {'risk_score': 10.0, 'risk_level': "HIGH"},
+        {'risk_score': 70.0},
+        {'risk_score': 95.0, 'risk_level': "LOW"}
+    ])
+    assert counts(db) == (4, 2, 1, 1)
+    assert counts(db) == tuple(stats_service.compute_stats(db).values())
+
+def test_increment_without_a_stats_row_is_not_lost(db):
+    add_transactions(db, [{'risk_score': 95.0}, {'risk_score': 10.0}])
+    # The seed row counted the inserted rows; they are not added a second time
+    assert counts(db) == (2, 1, 0, 1)
+
+def test_processing_time_without_a_stats_row_is_recorded(db):
+    stats_service.record_processing(db, 3.0, 6)
+    assert stats_service.get_stats(db)["avg_processing"] == 0.5
+    stats_service.record_processing(db, 1.0, 2)
+    assert stats_service.get_stats(db)["avg_processing"] == 0.5
+
+def test_rebuild_repairs_counters_and_keeps_processing_time(db):
+    stats_service.ensure_stats_row(db)
+    stats_service.record_processing(db, 2.0, 4)
+    db.add(models.Transaction(transaction_id="UNCOUNTED", amount=1.0, risk_level="HIGH"))
+    db.commit()
+    stats_service.rebuild_stats(db)
+    assert counts(db) == (1, 1, 0, 0)
+    assert stats_service.get_stats(db)["avg_processing"] == 0.5
@@ -0,0 +1,64 @@
+import os
+from datetime import datetime, timedelta
+import pytest
+import models
+import storage_lifecycle
+
+MONTHS = [datetime(2024, 1, 1), datetime(2024, 2, 1), datetime(2024, 3, 1)]
+
+@pytest.fixture
+def archive(db, tmp_path):
+    # 10 rows in each of three months, archived month by month
+    for month in MONTHS:
+        db.add_all([
+            models.Transaction(
+                transaction_id=f"TXN_{month:%m}_{i:02d}", amount=float(i), risk_score=90.0 if i % 2 else 10.0,
+                timestamp=month + timedelta(days=i)
+            )
+            for i in range(10)
+        ])
+    db.commit()
+    for month in MONTHS:
+        assert storage_lifecycle.archive_month(db, month, datetime(2024, 4, 1), base_dir=str(tmp_path)) == 10
+    return str(tmp_path)
+
+@pytest.fixture
+def scanned(monkeypatch):
+    months = []
+    read_month = storage_lifecycle._read_month
+    def recording(directory, condition, limit):
+        months.append(os.path.basename(directory))
+        return read_month(directory, condition, limit)
+    monkeypatch.setattr(storage_lifecycle, "_read_month", recording)
+    return months
+
+def test_limited_read_stops_before_older_partitions(archive, scanned):
+    frame = storage_lifecycle.read_cold(limit=5, base_dir=archive)
+    assert list(frame["transaction_id"]) == [f"TXN_03_{i:02d}" for i in range(9, 4, -1)]
+    assert scanned == ["month=2024-03"]
+
+def test_read_spans_partitions_newest_first(archive, scanned):
+    frame = storage_lifecycle.read_cold(limit=15, base_dir=archive)
+    assert len(frame) == 15
+    assert list(frame["timestamp"]) == sorted(frame["timestamp"], reverse=True)
+    assert scanned == ["month=2024-03", "month=2024-02"]
+
+def test_partitions_outside_the_range_are_skipped(archive, scanned):
+    frame = storage_lifecycle.read_cold(start=datetime(2024, 2, 5), end=datetime(2024, 3, 1), base_dir=archive)
+    assert set(frame["transaction_id"]) == {f"TXN_02_{i:02d}" for i in range(4, 10)}
+    assert scanned == ["month=2024-02"]
+
+def test_filters_are_pushed_into_the_scan(archive):
+    frame = storage_lifecycle.read_cold(risk_levels=["HIGH"], min_amount=5.0, base_dir=archive)
+    assert len(frame) == 3 * 3
+    assert set(frame["amount"]) == {5.0, 7.0, 9.0}
+
+def test_duplicate_rows_are_returned_once(archive):
+    # A crash between writing a batch and deleting its rows leaves a second copy
+    directory = os.path.join(archive, "transactions", "month=2024-03")
+    original = os.path.join(directory, os.listdir(directory)[0])
+    with open(original, "rb") as source, open(os.path.join(directory, "part-copy.parquet"), "wb") as copy:
+        copy.write(source.read())
+    frame = storage_lifecycle.read_cold(limit=20, base_dir=archive)
+    assert frame["transaction_id"].is_unique
+    assert len(frame) == 20
@@ -0,0 +1,223 @@
+import io
+import os
+import csv
+import json
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+from datetime import datetime
+import pandas as pd
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+import models
+import schemas
+import stats_service
+import analysis_service
+import feature_store
+import change_versions
+
+# Bulk ingestion of raw transactions (POST /api/transactions/bulk). Rows are
+# validated, scored and inserted a chunk at a time with one commit per chunk, and
+# every row gets a status: created, duplicate or invalid.
+BULK_CHUNK_ROWS = int(os.getenv("BULK_INGEST_CHUNK_ROWS", "5000"))
+
+# Rule-based risk score used for directly ingested transactions (0-100)
+LARGE_AMOUNT = 10000
+LARGE_AMOUNT_POINTS = 30
+SUSPICIOUS_LOCATION_POINTS = 40
+FLAG_SCORE = 50
+
+TRANSACTION_FIELDS = list(schemas.TransactionCreate.model_fields)
+# Column order for PostgreSQL COPY
+COPY_COLUMNS = TRANSACTION_FIELDS + ['risk_score', 'is_flagged', 'timestamp']
+
+_rows_adapter = TypeAdapter(List[schemas.TransactionCreate])
+
+class MalformedRow:
+    # Placeholder for an NDJSON line that is not valid JSON
+    def __init__(self, error: str):
+        self.error = error
+
+def score_transaction(amount: float, location: Optional[str]) -> float:
+    risk_score = 0.0
+    if amount > LARGE_AMOUNT:
+        risk_score += LARGE_AMOUNT_POINTS
+    if location and "suspicious" in location.lower():
+        risk_score += SUSPICIOUS_LOCATION_POINTS
+    return risk_score
+
+def score_frame(frame: pd.DataFrame) -> pd.Series:
+    # Vectorized score_transaction over a whole chunk
+    large = (frame['amount'] > LARGE_AMOUNT).astype(float) * LARGE_AMOUNT_POINTS
+    suspicious = frame['location'].fillna("").str.lower().str.contains("suspicious", regex=False)
+    return large + suspicious.astype(float) * SUSPICIOUS_LOCATION_POINTS
+
+def parse_ndjson_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return MalformedRow(f"Invalid JSON: {e}")
+
+def iter_ndjson(body: bytes) -> Iterator[Any]:
+    for line in body.splitlines():
+        if line.strip():
+            yield parse_ndjson_line(line)
+
+def parse_json_body(body: bytes) -> List[Any]:
+    # A JSON array, or {"transactions": [...]}. Raises ValueError otherwise.
+    document = json.loads(body)
+    if isinstance(document, dict):
+        document = document.get('transactions')
+    if not isinstance(document, list):
+        raise ValueError("Body must be a JSON array of transactions or {\"transactions\": [...]}")
+    return document
+
+def validate_rows(items: List[Any]) -> Tuple[List[Tuple[int, schemas.TransactionCreate]], Dict[int, List[str]]]:
+    # Returns ([(position, transaction)], {position: [error messages]}). The whole
+    # chunk is validated in one TypeAdapter call; if any row fails, the rest are
+    # validated again in a second call.
+    errors: Dict[int, List[str]] = {}
+    positions = []
+    candidates = []
+    for position, item in enumerate(items):
+        if isinstance(item, MalformedRow):
+            errors[position] = [item.error]
+        else:
+            positions.append(position)
+            candidates.append(item)
+
+    try:
+        return list(zip(positions, _rows_adapter.validate_python(candidates))), errors
+    except ValidationError as e:
+        for error in e.errors(include_url=False):
+            position = positions[error['loc'][0]]
+            field = ".".join(str(part) for part in error['loc'][1:]) or "row"
+            errors.setdefault(position, []).append(f"{field}: {error['msg']}")
+
+    positions = [position for position in positions if position not in errors]
+    valid = _rows_adapter.validate_python([items[position] for position in positions])
+    return list(zip(positions, valid)), errors
+
+def ingest_chunk(db: Session, items: List[Any], first_index: int = 0) -> List[Dict[str, Any]]:
+    # Validates, scores and inserts one chunk, then commits. Returns one status per item.
+    statuses: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    valid, errors = validate_rows(items)
+    for position, messages in errors.items():
+        item = items[position]
+        statuses[position] = {
+            "index": first_index + position,
+            "transaction_id": item.get('transaction_id') if isinstance(item, dict) else None,
+            "status": "invalid",
+            "errors": messages
+        }
+
+    # First occurrence of an ID in the request wins; IDs already stored are duplicates
+    unique = {}
+    for position, txn in valid:
+        if txn.transaction_id in unique:
+            statuses[position] = {"index": first_index + position, "transaction_id": txn.transaction_id, "status": "duplicate"}
+        else:
+            unique[txn.transaction_id] = (position, txn)
+    existing = analysis_service.get_existing_transaction_ids(db, list(unique)) if unique else set()
+    for txn_id in existing:
+        position, _ = unique.pop(txn_id)
+        statuses[position] = {"index": first_index + position, "transaction_id": txn_id, "status": "duplicate"}
+
+    if unique:
+        transactions = [txn for _, txn in unique.values()]
+        frame = pd.DataFrame({field: [getattr(txn, field) for txn in transactions] for field in TRANSACTION_FIELDS})
+        frame['risk_score'] = score_frame(frame)
+        frame['is_flagged'] = frame['risk_score'] > FLAG_SCORE
+        frame['timestamp'] = datetime.utcnow()
+        rows = frame.astype(object).where(frame.notna(), None).to_dict(orient='records')
+
+        try:
+            inserted = _insert_rows(db, rows)
+            stats_service.record_transactions(db, [row for row in rows if row['transaction_id'] in inserted])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        feature_store.record_stored(row for row in rows if row['transaction_id'] in inserted)
+
+        for row in rows:
+            position, _ = unique[row['transaction_id']]
+            status = "created" if row['transaction_id'] in inserted else "duplicate"
+            statuses[position] = {"index": first_index + position, "transaction_id": row['transaction_id'], "status": status}
+            if status == "created":
+                statuses[position]["risk_score"] = row['risk_score']
+                statuses[position]["is_flagged"] = row['is_flagged']
+    return statuses
+
+def _insert_rows(db: Session, rows: List[Dict[str, Any]]) -> set:
+    # Returns the transaction_ids that were inserted. Rows whose ID was stored by a
+    # concurrent request since the duplicate check are skipped, not errors.
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        try:
+            with db.begin_nested():
+                _copy_rows(db, rows)
+            return {row['transaction_id'] for row in rows}
+        except Exception as e:
+            if "unique" not in str(e).lower():
+                raise
+        # COPY cannot skip conflicts; redo the chunk as an upsert that does
+        stmt = pg_insert(models.Transaction).on_conflict_do_nothing(
+            index_elements=[models.Transaction.transaction_id]
+        ).returning(models.Transaction.transaction_id)
+        return {row[0] for row in db.execute(stmt, rows)}
+
+    if dialect == "sqlite":
+        stmt = sqlite_insert(models.Transaction).on_conflict_do_nothing(
+            index_elements=[models.Transaction.transaction_id]
+        ).returning(models.Transaction.transaction_id)
+        return {row[0] for row in db.execute(stmt, rows)}
+
+    db.execute(insert(models.Transaction), rows)
+    return {row['transaction_id'] for row in rows}
+
+def _copy_rows(db: Session, rows: List[Dict[str, Any]]):
+    # COPY ... FROM STDIN on the session's own connection, inside its transaction
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["" if row[column] is None else row[column] for column in COPY_COLUMNS])
+    buffer.seek(0)
+    # COPY bypasses the session, so the table change is recorded by hand
+    change_versions.mark(db, models.Transaction.__tablename__)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {models.Transaction.__tablename__} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+def iter_chunks(items: Iterable[Any], chunk_rows: int = BULK_CHUNK_ROWS) -> Iterator[List[Any]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def summarize(statuses: List[Dict[str, Any]], include_rows: bool = True) -> Dict[str, Any]:
+    counts = {"created": 0, "duplicate": 0, "invalid": 0}
+    for status in statuses:
+        counts[status["status"]] += 1
+    summary = {
+        "received": len(statuses),
+        "created": counts["created"],
+        "duplicates": counts["duplicate"],
+        "invalid": counts["invalid"]
+    }
+    if include_rows:
+        summary["rows"] = statuses
+    else:
+        # Only the rows that were not created
+        summary["rows"] = [status for status in statuses if status["status"] != "created"]
+    return summary
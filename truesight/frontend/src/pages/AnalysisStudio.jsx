@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useState, useRef } from 'react';
 import { Upload, Play, Sliders, FileText, Database, RefreshCw } from 'lucide-react';
 import './AnalysisStudio.css';
 
@@ -15,6 +15,15 @@ const AnalysisStudio = () => {
     const [logs, setLogs] = useState([]);
 
     const [transactions, setTransactions] = useState([]);
+    const [uploadFile, setUploadFile] = useState(null);
+    const fileInputRef = useRef(null);
+
+    const handleFileSelected = (file) => {
+        if (!file) return;
+        setUploadFile(file);
+        setTransactions([]);
+        setLogs(prev => [...prev, `📁 Selected ${file.name} (${(file.size / 1024 / 1024).toFixed(1)} MB)`]);
+    };
 
     const handleGenerateSample = async (count) => {
         try {
@@ -24,6 +33,7 @@ const AnalysisStudio = () => {
             });
             const data = await response.json();
             setTransactions(data);
+            setUploadFile(null);
             setLogs(prev => [...prev, `✅ Generated ${data.length} records ready for analysis.`]);
         } catch (error) {
             setLogs(prev => [...prev, `❌ Error generating sample: ${error.message}`]);
@@ -31,7 +41,7 @@ const AnalysisStudio = () => {
     };
 
     const handleRunAnalysis = async () => {
-        if (transactions.length === 0) {
+        if (transactions.length === 0 && !uploadFile) {
             alert("Please upload or generate transactions first.");
             return;
         }
@@ -41,38 +51,66 @@ const AnalysisStudio = () => {
         setLogs(prev => [...prev, "🚀 Starting analysis pipeline..."]);
 
         try {
-            // Simulate progress steps while waiting for request
-            const progressInterval = setInterval(() => {
-                setProgress(prev => {
-                    if (prev >= 90) return prev;
-                    return prev + 5;
+            let response;
+            if (uploadFile) {
+                // Large files go straight to the backend, which reads them in chunks
+                setLogs(prev => [...prev, `📡 Uploading ${uploadFile.name} for analysis...`]);
+                const formData = new FormData();
+                formData.append('file', uploadFile);
+                formData.append('config', JSON.stringify(config));
+                response = await fetch('/api/analysis/upload', {
+                    method: 'POST',
+                    body: formData
                 });
-            }, 500);
-
-            setLogs(prev => [...prev, `📡 Sending ${transactions.length} transactions to Groq LLM...`]);
-
-            const response = await fetch('/api/analysis/run', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    transactions: transactions,
-                    config: config
-                })
-            });
+            } else {
+                setLogs(prev => [...prev, `📡 Sending ${transactions.length} transactions to Groq LLM...`]);
 
-            const result = await response.json();
+                // Submit a background job, then poll it for per-batch progress
+                response = await fetch('/api/analysis/jobs', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json'
+                    },
+                    body: JSON.stringify({
+                        transactions: transactions,
+                        config: config
+                    })
+                });
+            }
+
+            if (!response.ok) {
+                const failure = await response.json();
+                throw new Error(failure.detail || response.statusText);
+            }
+
+            let job = await response.json();
+            setLogs(prev => [...prev, `🧾 Job ${job.job_id} queued`]);
+
+            let lastBatches = 0;
+            let lastRows = 0;
+            while (job.status !== 'completed' && job.status !== 'failed') {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const pollResponse = await fetch(`/api/analysis/jobs/${job.job_id}`);
+                job = await pollResponse.json();
+
+                setProgress(Math.round(job.progress * 100));
+                if (job.kind === 'upload' && job.rows_read > lastRows) {
+                    lastRows = job.rows_read;
+                    setLogs(prev => [...prev, `⏳ ${job.rows_read}/${job.total_transactions} rows read (${job.processed_count} analyzed, ${job.invalid_count} invalid)`]);
+                } else if (job.kind !== 'upload' && job.completed_batches > lastBatches) {
+                    lastBatches = job.completed_batches;
+                    setLogs(prev => [...prev, `⏳ Batch ${job.completed_batches}/${job.total_batches} analyzed (${job.processed_count} results)`]);
+                }
+            }
 
-            clearInterval(progressInterval);
             setProgress(100);
 
-            if (result.status === 'success') {
+            if (job.status === 'completed') {
                 setLogs(prev => [...prev, "✅ Analysis complete!"]);
-                setLogs(prev => [...prev, `📊 Processed: ${result.processed_count}, Saved: ${result.saved_count}`]);
+                setLogs(prev => [...prev, `📊 Processed: ${job.processed_count}, Saved: ${job.saved_count}, Failed: ${job.failed_count}`]);
                 // Redirect to investigation or show success
             } else {
-                setLogs(prev => [...prev, "❌ Analysis failed or returned partial results."]);
+                setLogs(prev => [...prev, `❌ Analysis failed: ${job.error}`]);
             }
 
         } catch (error) {
@@ -96,10 +134,24 @@ const AnalysisStudio = () => {
                             <h3><Database size={20} /> Data Source</h3>
                         </div>
                         <div className="data-source-options">
-                            <div className="upload-zone">
+                            <div
+                                className="upload-zone"
+                                onDragOver={(e) => e.preventDefault()}
+                                onDrop={(e) => {
+                                    e.preventDefault();
+                                    handleFileSelected(e.dataTransfer.files[0]);
+                                }}
+                            >
                                 <Upload size={32} />
-                                <p>Drag & drop <strong>transactions.csv</strong> here</p>
-                                <button className="btn btn-outline btn-sm">Browse Files</button>
+                                <p>{uploadFile ? <strong>{uploadFile.name}</strong> : <>Drag & drop <strong>transactions.csv</strong> here</>}</p>
+                                <input
+                                    ref={fileInputRef}
+                                    type="file"
+                                    accept=".csv,.parquet"
+                                    style={{ display: 'none' }}
+                                    onChange={(e) => handleFileSelected(e.target.files[0])}
+                                />
+                                <button className="btn btn-outline btn-sm" onClick={() => fileInputRef.current.click()}>Browse Files</button>
                             </div>
                             <div className="divider">OR</div>
                             <div className="generate-zone">
@@ -168,6 +220,7 @@ FOR EACH transaction, provide:
                                 <option value="qwen/qwen3-32b">Qwen 3 (32B)</option>
                                 <option value="llama3-70b">Llama 3 (70B)</option>
                                 <option value="mixtral-8x7b">Mixtral 8x7B</option>
+                                <option value="classifier">In-process classifier (offline)</option>
                             </select>
                         </div>
 
@@ -6,16 +6,22 @@ const Investigation = () => {
     const [filter, setFilter] = useState('all');
     const [transactions, setTransactions] = useState([]);
     const [loading, setLoading] = useState(true);
+    const [nextCursor, setNextCursor] = useState(null);
 
     useEffect(() => {
         fetchTransactions();
-    }, []);
+    }, [filter]);
 
-    const fetchTransactions = async () => {
+    // Risk filtering happens server-side; "Load more" follows the feed cursor
+    const fetchTransactions = async (cursor = null) => {
         try {
-            const response = await fetch('/api/investigation/data');
+            const params = new URLSearchParams({ limit: '50' });
+            if (filter !== 'all') params.set('risk', filter);
+            if (cursor) params.set('cursor', cursor);
+            const response = await fetch(`/api/investigation/feed?${params}`);
             const data = await response.json();
-            setTransactions(data);
+            setTransactions(prev => cursor ? [...prev, ...data.items] : data.items);
+            setNextCursor(data.next_cursor);
         } catch (error) {
             console.error('Error fetching transactions:', error);
         } finally {
@@ -23,9 +29,7 @@ const Investigation = () => {
         }
     };
 
-    const filteredTransactions = filter === 'all'
-        ? transactions
-        : transactions.filter(t => t.risk === filter.toUpperCase());
+    const filteredTransactions = transactions;
 
     return (
         <div className="investigation-page">
@@ -122,6 +126,11 @@ const Investigation = () => {
                         ))}
                     </tbody>
                 </table>
+                {nextCursor && (
+                    <button className="filter-btn" onClick={() => fetchTransactions(nextCursor)}>
+                        Load more
+                    </button>
+                )}
             </div>
         </div>
     );